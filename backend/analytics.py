@@ -0,0 +1,289 @@
+"""
+Terms Analytics
+
+Book-wide statistics over effective terms: per fund and clause type, how many
+investors have the term, commitment-weighted averages, min/max and the
+distribution of values. Funds and weights come from the commitments table, so
+an investor committed to several funds counts in each with that commitment;
+investors without commitments are grouped as "Unassigned".
+
+Answering this per investor would mean one effective-terms resolution per
+investor. Instead the whole book is resolved in one pass from three
+column-only queries (investors with their commitments, documents and
+clauses; no ORM objects, no source text) into a columnar snapshot of
+winning terms. Aggregation then runs over that snapshot in
+memory.
+
+The snapshot is rebuilt only when the book changes. It is keyed by the same
+validator as GET /investors: investor count plus max(updated_at), which
+touch_investor advances on every document and clause write. The three
+queries run in one REPEATABLE READ transaction on PostgreSQL, and the
+version is read again after a build: a snapshot the book moved under is
+rebuilt (up to SNAPSHOT_ATTEMPTS times) rather than cached under the old
+version.
+"""
+
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import select
+
+from http_cache import listing_validators
+from models import db, Investor, Document, Clause, Commitment, Fund
+from supersedes_graph import SupersedesCycleError, build_supersedes_graph
+from terms_resolution import Candidate, resolve_many
+
+# Numeric clause fields that get statistics
+METRICS = ("rate", "discount")
+
+UNASSIGNED_FUND = "Unassigned"
+
+# Builds tried before serving a snapshot the book kept changing under, uncached
+SNAPSHOT_ATTEMPTS = 3
+
+# Filter combinations memoized per snapshot (filters come from query strings)
+MAX_CACHED_AGGREGATES = 256
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+class TermsSnapshot:
+    """
+    Winning terms for every investor, one column per field.
+
+    Row i is investor investor_ids[i]'s effective term of clause_types[i]
+    in funds[i]; an investor committed to several funds has rows in each.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.investor_ids = []
+        self.funds = []
+        self.commitments = []
+        self.clause_types = []
+        self.rates = []
+        self.discounts = []
+        # Per fund totals, including investors without any terms
+        self.fund_investors = Counter()
+        self.fund_commitments = defaultdict(float)
+        self.total_investors = 0
+        # Investors left out because of a supersedes cycle
+        self.skipped_investors = []
+        # aggregate() results by filter; the snapshot itself never changes
+        self.aggregates = {}
+
+    def __len__(self):
+        return len(self.investor_ids)
+
+    def append(self, investor_id, fund, commitment, clause_type, rate, discount):
+        self.investor_ids.append(investor_id)
+        self.funds.append(fund)
+        self.commitments.append(commitment)
+        self.clause_types.append(clause_type)
+        self.rates.append(rate)
+        self.discounts.append(discount)
+
+
+def resolve_winners(document_rows, clause_rows):
+    """
+    Batch-resolve effective terms from plain rows instead of ORM objects.
+    
+    document_rows: (id, investor_id, priority, effective_date, supersedes_id)
+    clause_rows: rows starting (id, document_id, clause_type, ...); the whole
+    row is kept as the winner's payload. Clauses of documents missing from
+    document_rows (committed between the two reads) are skipped.
+    
+    Returns ({investor_id: {clause_type: winning Candidate}}, skipped), where
+    skipped lists investors whose supersedes links form a cycle.
+    """
+    documents = {}
+    supersedes = defaultdict(dict)
+    for doc_id, investor_id, priority, effective_date, supersedes_id in document_rows:
+        documents[doc_id] = (investor_id, priority, effective_date)
+        supersedes[investor_id][doc_id] = supersedes_id
+
+    graphs = {}
+    skipped = []
+    for investor_id, links in supersedes.items():
+        try:
+            graphs[investor_id] = build_supersedes_graph(links)
+        except SupersedesCycleError:
+            skipped.append(investor_id)
+
+    candidates = defaultdict(list)
+    for row in clause_rows:
+        clause_id, document_id, clause_type = row[0], row[1], row[2]
+        if document_id not in documents:
+            continue
+        investor_id, priority, effective_date = documents[document_id]
+        graph = graphs.get(investor_id)
+        if graph is None:
+            continue
+        superseded_by = graph.latest[document_id] if graph.is_superseded(document_id) else None
+        candidates[investor_id].append(Candidate(
+            clause_id, document_id, clause_type, priority, effective_date,
+            superseded_by=superseded_by, payload=row,
+        ))
+
+    winners = {
+        investor_id: {clause_type: winner for clause_type, (winner, _) in resolved.items()}
+        for investor_id, resolved in resolve_many(candidates).items()
+    }
+    return winners, sorted(skipped)
+
+
+def build_snapshot(version=None):
+    """
+    Resolve the effective terms of every investor in one pass.
+
+    On PostgreSQL the queries run on a connection of their own in one
+    REPEATABLE READ transaction (the request's session has usually started
+    its transaction already), so they see a single state of the book.
+    """
+    bind = db.session.get_bind()
+    if bind.dialect.name == "postgresql":
+        with bind.connect() as connection:
+            connection.execution_options(isolation_level="REPEATABLE READ")
+            with connection.begin():
+                return _build_snapshot(connection, version)
+    return _build_snapshot(db.session, version)
+
+
+def _build_snapshot(connection, version):
+    snapshot = TermsSnapshot(version)
+
+    # An investor counts in every fund it commits to, weighted by that commitment
+    investors = defaultdict(list)
+    for investor_id, fund, amount, legacy_amount in connection.execute(
+        select(Investor.id, Fund.name, Commitment.amount, Investor.commitment_amount)
+        .outerjoin(Commitment, Commitment.investor_id == Investor.id)
+        .outerjoin(Fund, Fund.id == Commitment.fund_id)
+    ):
+        if fund is None:
+            fund, amount = UNASSIGNED_FUND, legacy_amount
+        commitment = _float(amount)
+        investors[investor_id].append((fund, commitment))
+        snapshot.fund_investors[fund] += 1
+        snapshot.fund_commitments[fund] += commitment or 0.0
+    snapshot.total_investors = len(investors)
+
+    winners, snapshot.skipped_investors = resolve_winners(
+        connection.execute(select(
+            Document.id, Document.investor_id, Document.priority,
+            Document.effective_date, Document.supersedes_id,
+        )),
+        connection.execute(select(
+            Clause.id, Clause.document_id, Clause.clause_type, Clause.rate, Clause.discount,
+        )),
+    )
+
+    for investor_id, terms in winners.items():
+        for fund, commitment in investors[investor_id]:
+            for clause_type, winner in terms.items():
+                row = winner.payload
+                snapshot.append(investor_id, fund, commitment, clause_type,
+                                _float(row.rate), _float(row.discount))
+
+    return snapshot
+
+
+class SnapshotCache:
+    """Holds the latest snapshot; rebuilds when the book version changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def get(self, version):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            # Another request may have rebuilt it while we waited
+            if self._snapshot is not None and self._snapshot.version == version:
+                return self._snapshot
+            for _ in range(SNAPSHOT_ATTEMPTS):
+                snapshot = build_snapshot(version)
+                current = listing_validators()[0]
+                if current == version:
+                    self._snapshot = snapshot
+                    return snapshot
+                # Written to while it was read: build again for the new version
+                version = current
+            return snapshot
+
+
+def metric_stats(values, weights):
+    """count/min/max/mean, commitment-weighted mean and value distribution."""
+    pairs = [(value, weight) for value, weight in zip(values, weights) if value is not None]
+    if not pairs:
+        return None
+    numbers = [value for value, _ in pairs]
+    total_weight = sum(weight for _, weight in pairs if weight)
+    weighted = (
+        sum(value * weight for value, weight in pairs if weight) / total_weight
+        if total_weight else None
+    )
+    distribution = Counter(f"{value:g}" for value in numbers)
+    return {
+        "count": len(numbers),
+        "min": min(numbers),
+        "max": max(numbers),
+        "mean": sum(numbers) / len(numbers),
+        "weightedMean": weighted,
+        "distribution": dict(sorted(distribution.items(), key=lambda item: float(item[0]))),
+    }
+
+
+def aggregate(snapshot, fund=None, clause_type=None):
+    """Group the snapshot by fund and clause type (memoized per filter)."""
+    key = (fund, clause_type)
+    result = snapshot.aggregates.get(key)
+    if result is None:
+        result = _aggregate(snapshot, fund, clause_type)
+        if len(snapshot.aggregates) < MAX_CACHED_AGGREGATES:
+            snapshot.aggregates[key] = result
+    return result
+
+
+def _aggregate(snapshot, fund, clause_type):
+    groups = defaultdict(list)
+    for i in range(len(snapshot)):
+        if fund is not None and snapshot.funds[i] != fund:
+            continue
+        if clause_type is not None and snapshot.clause_types[i] != clause_type:
+            continue
+        groups[(snapshot.funds[i], snapshot.clause_types[i])].append(i)
+
+    funds = {}
+    for fund_name in sorted(snapshot.fund_investors):
+        if fund is not None and fund_name != fund:
+            continue
+        funds[fund_name] = {
+            "fund": fund_name,
+            "investors": snapshot.fund_investors[fund_name],
+            "commitment": snapshot.fund_commitments[fund_name],
+            "clauseTypes": {},
+        }
+
+    for (fund_name, type_name), rows in sorted(groups.items()):
+        weights = [snapshot.commitments[i] for i in rows]
+        entry = {
+            "investors": len(rows),
+            "share": len(rows) / snapshot.fund_investors[fund_name],
+            "commitment": sum(weight or 0.0 for weight in weights),
+        }
+        columns = {"rate": snapshot.rates, "discount": snapshot.discounts}
+        for metric in METRICS:
+            entry[metric] = metric_stats([columns[metric][i] for i in rows], weights)
+        funds[fund_name]["clauseTypes"][type_name] = entry
+
+    # Distinct investors: one committed to several funds counts once overall
+    investors = snapshot.total_investors if fund is None else snapshot.fund_investors.get(fund, 0)
+    return {
+        "investors": investors,
+        "skippedInvestors": snapshot.skipped_investors,
+        "funds": list(funds.values()),
+    }
@@ -1,13 +1,65 @@
 import os
+import time
+import click
 import jwt
 from datetime import datetime, timedelta, date
 from functools import wraps
-from flask import Flask, request, jsonify
+from flask import Flask, Response, current_app, request, jsonify, stream_with_context
+from werkzeug.formparser import parse_form_data
 from flask_cors import CORS
+from sqlalchemy import delete, func, inspect, select, update
+from sqlalchemy.orm import defer, selectinload
+from sqlalchemy.schema import CreateColumn
 from config import config
-from models import db, User, Investor, Document, Clause
-from terms_engine import calculate_effective_terms
-from extraction_service import extract_clauses, mock_extract_clauses
+from models import (
+    db, User, Investor, Document, Clause, ClauseSignature, DocumentVersion, Fund, Commitment, Change,
+    delete_clauses, delete_documents, delete_investors, derive_priority, intern_texts,
+    migrate_clause_texts, move_commitment, record_changes, sync_commitments, touch_investor,
+    touch_investors, unindex_clauses,
+)
+from demo_data import seed_demo_investors, seed_synthetic_investors
+from analytics import SnapshotCache, aggregate
+from http_cache import make_etag, listing_validators, conditional
+from http_compression import init_compression
+from profiling import init_profiling, list_profiles, load_profile
+from serialization import FastJSONProvider, with_text_refs
+from shared_cache import build_cache, cached_render, investor_tag
+from provider_router import build_router
+from snapshot_export import (
+    ARROW_AVAILABLE,
+    SNAPSHOT_FORMATS,
+    TABLE_NAMES,
+    arrow_stream,
+    snapshot_version,
+    write_snapshot,
+)
+from supersedes_graph import SupersedesCycleError
+from terms_engine import calculate_effective_terms, effective_terms_for_documents
+from terms_feed import ChangePoller, TermsFeed, format_sse, winners_from_terms
+from clause_similarity import index_clauses, similar_clauses
+from document_files import (
+    PYPDF_AVAILABLE,
+    TextExtractor,
+    assign_page_numbers,
+    file_kind,
+    remove_uploads,
+    upload_dir,
+    upload_limits,
+    upload_stream_factory,
+)
+from document_versions import plan_revision, section_index, settle_unlocated
+from extraction_service import (
+    configured_async_providers,
+    configured_providers,
+    configured_stream_providers,
+    extract_in_chunks,
+    extract_with_prefilter,
+    extraction_metrics,
+    mock_extract_clauses,
+    stream_extract_clauses,
+    validate_extraction_text,
+    with_mock_fallback,
+)
 
 
 def parse_date(date_string):
@@ -22,6 +74,90 @@ def parse_date(date_string):
         return None
 
 
+# Bounds for ?limit= and ?offset= on paged fund listings
+MAX_PAGE_SIZE = 1000
+MAX_PAGE_OFFSET = 2**31 - 1
+
+
+def page_args(args):
+    """
+    (limit, offset, error) from ?limit= and ?offset=.
+    
+    limit is None when not given (the whole listing); offset defaults to 0.
+    """
+    limit, offset = args.get("limit"), args.get("offset", "0")
+    if limit is None:
+        return None, 0, None
+    if not (limit.isdigit() and offset.isdigit()
+            and 1 <= int(limit) <= MAX_PAGE_SIZE and int(offset) <= MAX_PAGE_OFFSET):
+        return None, 0, f"limit must be between 1 and {MAX_PAGE_SIZE} and offset between 0 and {MAX_PAGE_OFFSET}"
+    return int(limit), int(offset), None
+
+
+# API field -> (Clause column, kind) for clause writes
+CLAUSE_FIELDS = {
+    "clauseType": ("clause_type", "text"),
+    "clauseText": ("clause_text", "text"),
+    "rate": ("rate", "number"),
+    "threshold": ("threshold", "text"),
+    "thresholdAmount": ("threshold_amount", "number"),
+    "discount": ("discount", "number"),
+    "effectiveDate": ("effective_date", "date"),
+    "notes": ("notes", "text"),
+    "pageNumber": ("page_number", "integer"),
+    "sectionRef": ("section_ref", "text"),
+}
+
+
+def clause_values(data, strict=False):
+    """
+    Map API clause fields in `data` to column values.
+    
+    Returns (values, error). With strict=True, unknown fields and values of
+    the wrong type are an error instead of being ignored or stored as-is.
+    """
+    values = {}
+    unknown = sorted(set(data) - set(CLAUSE_FIELDS) - {"id"})
+    if strict and unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+    for field, (column, kind) in CLAUSE_FIELDS.items():
+        if field not in data:
+            continue
+        value = data[field]
+        if kind == "date":
+            parsed = parse_date(value)
+            if strict and value and parsed is None:
+                return None, f"{field} must be a YYYY-MM-DD date"
+            value = parsed
+        elif strict and value is not None:
+            valid = {
+                "text": isinstance(value, str),
+                "number": isinstance(value, (int, float)) and not isinstance(value, bool),
+                "integer": isinstance(value, int) and not isinstance(value, bool),
+            }[kind]
+            if not valid:
+                return None, f"{field} must be a {'string' if kind == 'text' else kind}"
+        values[column] = value
+    return values, None
+
+
+def extracted_clause(document_id, clause_data, text_ids):
+    """Build a Clause from one entry of an extraction result; text_ids from intern_texts()."""
+    return Clause(
+        document_id=document_id,
+        clause_type=clause_data.get("clause_type", "Other"),
+        rate=clause_data.get("rate"),
+        threshold=clause_data.get("threshold"),
+        threshold_amount=clause_data.get("threshold_amount"),
+        discount=clause_data.get("discount"),
+        effective_date=parse_date(clause_data.get("effective_date")),
+        section_ref=clause_data.get("section_ref"),
+        page_number=clause_data.get("page_number"),
+        text_id=text_ids.get(clause_data.get("clause_text")),
+        notes=clause_data.get("notes", "")
+    )
+
+
 def create_app(config_name=None):
     """Application factory."""
     if config_name is None:
@@ -29,47 +165,212 @@ def create_app(config_name=None):
     
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.json = FastJSONProvider(app)
     
     # Initialize extensions
     CORS(app)
     db.init_app(app)
+    init_compression(app)
+    init_profiling(app, is_admin)
+    app.extensions["terms_feed"] = TermsFeed(app.config["SSE_MAX_SUBSCRIBERS"])
+    app.extensions["terms_poller"] = ChangePoller(
+        app, app.extensions["terms_feed"], publish_terms, app.config["SSE_POLL_SECONDS"]
+    )
+    app.extensions["terms_snapshot"] = SnapshotCache()
+    provider_timeout = app.config["PROVIDER_TIMEOUT_SECONDS"]
+    app.extensions["provider_router"] = build_router(
+        app.config,
+        configured_providers(provider_timeout),
+        configured_async_providers(provider_timeout),
+        configured_stream_providers(provider_timeout),
+    )
+    app.extensions["shared_cache"] = build_cache(app.config)
+    app.extensions["file_text_extractor"] = TextExtractor(
+        app.config["FILE_EXTRACTION_WORKERS"], app.config["FILE_EXTRACTION_TIMEOUT"]
+    )
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
-    
-    # Register routes
+    # Register routes and CLI commands
     register_routes(app)
+    register_commands(app)
     
     return app
 
 
+def register_commands(app):
+    """Register Flask CLI commands (run with `flask --app app <command>`)."""
+    
+    @app.cli.command("init-db")
+    def init_db():
+        """Create database tables. Run once per deploy, not per worker."""
+        db.create_all()
+        # create_all skips existing tables; add columns and indexes introduced since
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    with db.engine.begin() as conn:
+                        conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        # Mirror Investor.fund / commitment_amount into funds and commitments
+        sync_commitments()
+        # Move clause text stored inline into the interned clause_texts table
+        migrate_clause_texts()
+        # Build similarity index entries for clauses that have none
+        index_clauses(select(Clause.id).where(Clause.id.not_in(select(ClauseSignature.clause_id))))
+        db.session.commit()
+        print("Database tables created")
+    
+    @app.cli.command("seed-demo")
+    @click.option("--investors", type=int, default=None,
+                  help="Generate this many synthetic investor books instead of the demo set.")
+    @click.option("--seed", type=int, default=7, help="Random seed for synthetic books.")
+    def seed_demo(investors, seed):
+        """Seed demo investors, or bulk-generate synthetic ones."""
+        start = time.perf_counter()
+        if investors is None:
+            created = seed_demo_investors()
+        else:
+            created = seed_synthetic_investors(investors, seed=seed)
+        print(
+            f"Created {created['investors']} investors, {created['documents']} documents "
+            f"and {created['clauses']} clauses in {time.perf_counter() - start:.1f}s"
+        )
+    
+    @app.cli.command("export-snapshot")
+    @click.argument("output_dir")
+    @click.option("--format", "fmt", type=click.Choice(sorted(SNAPSHOT_FORMATS)), default="arrow",
+                  help="Arrow IPC files (memory-mappable) or Parquet.")
+    @click.option("--batch-size", type=int, default=10000, help="Rows per record batch.")
+    def export_snapshot(output_dir, fmt, batch_size):
+        """Write investors, documents, clauses and effective terms as columnar files."""
+        if not ARROW_AVAILABLE:
+            raise click.ClickException("Columnar export requires pyarrow")
+        manifest = write_snapshot(output_dir, fmt=fmt, batch_size=batch_size)
+        for table, entry in manifest["tables"].items():
+            print(f"{entry['file']}: {entry['rows']} rows")
+        print(f"Snapshot {manifest['snapshotVersion']} written to {output_dir}")
+
+
 def token_required(f):
     """Decorator to require valid JWT token."""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get("Authorization")
-        
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
+        email, error = authenticate_token(bearer_token(), current_app.config["JWT_SECRET"])
+        if error:
+            return jsonify({"error": error}), 401
+        request.user_email = email
         
-        if not token:
-            return jsonify({"error": "Token is missing"}), 401
-        
-        try:
-            from flask import current_app
-            data = jwt.decode(token, current_app.config["JWT_SECRET"], algorithms=["HS256"])
-            request.user_email = data["email"]
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Invalid token"}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+
+def admin_required(f):
+    """Decorator to require a valid JWT token for an admin (ADMIN_EMAILS)."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        email, error = authenticate_token(bearer_token(), current_app.config["JWT_SECRET"])
+        if error:
+            return jsonify({"error": error}), 401
+        if email not in current_app.config["ADMIN_EMAILS"]:
+            return jsonify({"error": "Admin access required"}), 403
+        request.user_email = email
         
         return f(*args, **kwargs)
     return decorated
 
 
+def text_refs_requested():
+    """Whether the client asked for clause texts by reference (?clauseText=refs)."""
+    return request.args.get("clauseText") == "refs"
+
+
+def text_refs_etag(etag):
+    """The ETag of a clause-bearing response, distinct for the refs representation."""
+    return make_etag("refs", etag) if text_refs_requested() else etag
+
+
+def clause_json(payload):
+    """jsonify a payload containing clauses, sending each text once if asked to."""
+    return jsonify(with_text_refs(payload) if text_refs_requested() else payload)
+
+
+def is_admin():
+    """Whether the current request carries an admin's token."""
+    email, error = authenticate_token(bearer_token(), current_app.config["JWT_SECRET"])
+    return error is None and email in current_app.config["ADMIN_EMAILS"]
+
+
+def bearer_token():
+    """Token from the Authorization header, if any."""
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header.split(" ")[1]
+    return None
+
+
+def investors_changed(*investor_ids):
+    """
+    Fan out a committed write to anything tracking investor state.
+    
+    Call after db.session.commit() in write endpoints.
+    """
+    cache = current_app.extensions["shared_cache"]
+    if cache is not None:
+        try:
+            cache.invalidate(*(investor_tag(i) for i in set(investor_ids) if i is not None))
+        except Exception as e:
+            # Entries are keyed by ETag, so a missed invalidation only wastes space
+            current_app.logger.warning("Shared cache invalidation failed: %s", e)
+    
+    for investor_id in set(investor_ids):
+        if investor_id is not None:
+            publish_terms(investor_id)
+
+
+def publish_terms(investor_id):
+    """Push an investor's changed winning terms to its feed subscribers."""
+    feed = current_app.extensions["terms_feed"]
+    try:
+        feed.investor_changed(
+            investor_id,
+            lambda: winners_from_terms(calculate_effective_terms(investor_id)["terms"]),
+        )
+    except SupersedesCycleError as e:
+        # The write is already committed; tell listeners why no terms follow
+        current_app.logger.warning("Terms feed for investor %s not updated: %s", investor_id, e)
+        feed.publish(investor_id, "terms-cycle", {
+            "investorId": investor_id, "error": str(e), "cycle": e.cycle,
+        })
+
+
+def authenticate_token(token, secret):
+    """Decode a JWT. Returns (email, error message)."""
+    if not token:
+        return None, "Token is missing"
+    try:
+        data = jwt.decode(token, secret, algorithms=["HS256"])
+        return data["email"], None
+    except jwt.ExpiredSignatureError:
+        return None, "Token has expired"
+    except jwt.InvalidTokenError:
+        return None, "Invalid token"
+
+
+def clause_owners(clause_ids):
+    """{clause id: (document id, investor id)} for the clauses that exist."""
+    if not clause_ids:
+        return {}
+    rows = db.session.execute(
+        select(Clause.id, Clause.document_id, Document.investor_id)
+        .join(Document, Document.id == Clause.document_id)
+        .where(Clause.id.in_(list(clause_ids)))
+    )
+    return {clause_id: (document_id, investor_id) for clause_id, document_id, investor_id in rows}
+
+
 def register_routes(app):
     """Register all API routes."""
     
@@ -117,8 +418,13 @@ def register_routes(app):
     @app.route("/investors", methods=["GET"])
     @token_required
     def list_investors():
-        investors = Investor.query.order_by(Investor.created_at.desc()).all()
-        return jsonify([inv.to_dict() for inv in investors])
+        etag, last_modified = listing_validators()
+        
+        def render():
+            investors = Investor.query.order_by(Investor.created_at.desc()).all()
+            return jsonify([inv.to_dict() for inv in investors])
+        
+        return conditional(etag, last_modified, render)
     
     @app.route("/investors", methods=["POST"])
     @token_required
@@ -134,6 +440,9 @@ def register_routes(app):
             internal_notes=data.get("internalNotes", ""),
         )
         db.session.add(investor)
+        db.session.flush()
+        sync_commitments([investor.id])
+        record_changes("investor", "upsert", [investor.id])
         db.session.commit()
         return jsonify(investor.to_dict()), 201
     
@@ -141,13 +450,16 @@ def register_routes(app):
     @token_required
     def get_investor(investor_id):
         investor = Investor.query.get_or_404(investor_id)
-        return jsonify(investor.to_dict())
+        etag = make_etag("investor", investor.id, investor.updated_at)
+        render = cached_render(etag, investor.id, lambda: jsonify(investor.to_dict()))
+        return conditional(etag, investor.updated_at, render)
     
     @app.route("/investors/<int:investor_id>", methods=["PUT"])
     @token_required
     def update_investor(investor_id):
         investor = Investor.query.get_or_404(investor_id)
         data = request.get_json() or {}
+        old_fund = investor.fund
         
         if "name" in data:
             investor.name = data["name"].strip()
@@ -164,27 +476,42 @@ def register_routes(app):
         if "internalNotes" in data:
             investor.internal_notes = data["internalNotes"]
         
+        if data.keys() & {"fund", "commitmentAmount", "currency"}:
+            db.session.flush()
+            if investor.fund != old_fund:
+                move_commitment(investor_id, old_fund)
+            sync_commitments([investor_id])
+        record_changes("investor", "upsert", [investor_id])
         db.session.commit()
+        investors_changed(investor_id)
         return jsonify(investor.to_dict())
     
     @app.route("/investors/<int:investor_id>", methods=["DELETE"])
     @token_required
     def delete_investor(investor_id):
-        investor = Investor.query.get_or_404(investor_id)
-        db.session.delete(investor)
+        Investor.query.get_or_404(investor_id)
+        # Set-based: documents and clauses are never loaded into the session
+        delete_investors([investor_id])
         db.session.commit()
+        investors_changed(investor_id)
         return "", 204
     
     # Documents
     @app.route("/documents", methods=["GET"])
     @token_required
     def list_documents():
-        investor_id = request.args.get("investorId")
-        query = Document.query
-        if investor_id:
-            query = query.filter_by(investor_id=investor_id)
-        documents = query.order_by(Document.effective_date.desc().nullslast()).all()
-        return jsonify([doc.to_dict() for doc in documents])
+        investor_id = request.args.get("investorId", type=int)
+        etag, last_modified = listing_validators(investor_id)
+        etag = text_refs_etag(etag)
+        
+        def render():
+            query = Document.query
+            if investor_id:
+                query = query.filter_by(investor_id=investor_id)
+            documents = query.order_by(Document.effective_date.desc().nullslast()).all()
+            return clause_json([doc.to_dict() for doc in documents])
+        
+        return conditional(etag, last_modified, render)
     
     @app.route("/documents", methods=["POST"])
     @token_required
@@ -199,47 +526,66 @@ def register_routes(app):
             if not investor:
                 return jsonify({"error": "Investor not found"}), 404
         
+        # A document can only supersede another document of the same investor
+        supersedes_id = data.get("supersedesId")
+        if supersedes_id:
+            superseded = db.session.get(Document, supersedes_id)
+            if not superseded:
+                return jsonify({"error": "Superseded document not found"}), 404
+            if investor_id and superseded.investor_id != investor.id:
+                return jsonify({"error": "Superseded document belongs to another investor"}), 400
+        
         document = Document(
             investor_id=investor_id,
             title=data.get("title", "").strip() or "Untitled Document",
             doc_type=doc_type,
             status=data.get("status", "Active"),
             effective_date=parse_date(data.get("effectiveDate")),
-            supersedes_id=data.get("supersedesId"),
+            supersedes_id=supersedes_id,
             priority=data.get("priority") or derive_priority(doc_type),
             source_text=data.get("sourceText"),
             file_name=data.get("fileName"),
             file_url=data.get("fileUrl"),
         )
         db.session.add(document)
+        db.session.flush()
+        record_changes("document", "upsert", [document.id])
+        touch_investor(investor_id)
         db.session.commit()
+        investors_changed(document.investor_id)
         return jsonify(document.to_dict()), 201
     
     @app.route("/documents/<int:document_id>", methods=["GET"])
     @token_required
     def get_document(document_id):
         document = Document.query.get_or_404(document_id)
-        return jsonify(document.to_dict())
+        etag = text_refs_etag(make_etag("document", document.id, document.updated_at))
+        render = cached_render(etag, document.investor_id, lambda: clause_json(document.to_dict()))
+        return conditional(etag, document.updated_at, render)
     
     @app.route("/documents/<int:document_id>", methods=["DELETE"])
     @token_required
     def delete_document(document_id):
         document = Document.query.get_or_404(document_id)
-        db.session.delete(document)
+        investor_id = document.investor_id
+        delete_documents([document_id])
+        touch_investor(investor_id)
         db.session.commit()
+        investors_changed(investor_id)
         return "", 204
     
     # Clauses
     @app.route("/documents/<int:document_id>/clauses", methods=["POST"])
     @token_required
     def create_clause(document_id):
-        Document.query.get_or_404(document_id)
+        document = Document.query.get_or_404(document_id)
         data = request.get_json() or {}
         
+        clause_text = data.get("clauseText", "")
         clause = Clause(
             document_id=document_id,
             clause_type=data.get("clauseType", "Other"),
-            clause_text=data.get("clauseText", ""),
+            text_id=intern_texts([clause_text]).get(clause_text),
             rate=data.get("rate"),
             threshold=data.get("threshold"),
             threshold_amount=data.get("thresholdAmount"),
@@ -250,7 +596,12 @@ def register_routes(app):
             section_ref=data.get("sectionRef"),
         )
         db.session.add(clause)
+        db.session.flush()
+        index_clauses([clause.id])
+        record_changes("clause", "upsert", [clause.id])
+        touch_investor(document.investor_id, document_id)
         db.session.commit()
+        investors_changed(document.investor_id)
         return jsonify(clause.to_dict()), 201
     
     @app.route("/clauses/<int:clause_id>", methods=["GET"])
@@ -265,56 +616,530 @@ def register_routes(app):
         clause = Clause.query.get_or_404(clause_id)
         data = request.get_json() or {}
         
-        if "clauseType" in data:
-            clause.clause_type = data["clauseType"]
-        if "clauseText" in data:
-            clause.clause_text = data["clauseText"]
-        if "rate" in data:
-            clause.rate = data["rate"]
-        if "threshold" in data:
-            clause.threshold = data["threshold"]
-        if "thresholdAmount" in data:
-            clause.threshold_amount = data["thresholdAmount"]
-        if "discount" in data:
-            clause.discount = data["discount"]
-        if "effectiveDate" in data:
-            clause.effective_date = parse_date(data["effectiveDate"])
-        if "notes" in data:
-            clause.notes = data["notes"]
-        if "pageNumber" in data:
-            clause.page_number = data["pageNumber"]
-        if "sectionRef" in data:
-            clause.section_ref = data["sectionRef"]
+        values, _ = clause_values(data)
+        for column, value in values.items():
+            setattr(clause, column, value)
+        if "clause_text" in values:
+            index_clauses([clause_id])
+        record_changes("clause", "upsert", [clause_id])
         
+        investor_id = clause.document.investor_id
+        touch_investor(investor_id, clause.document_id)
         db.session.commit()
+        investors_changed(investor_id)
         return jsonify(clause.to_dict())
     
     @app.route("/clauses/<int:clause_id>", methods=["DELETE"])
     @token_required
     def delete_clause(clause_id):
         clause = Clause.query.get_or_404(clause_id)
+        investor_id = clause.document.investor_id
+        touch_investor(investor_id, clause.document_id)
+        record_changes("clause", "delete", [clause_id])
+        unindex_clauses([clause_id])
         db.session.delete(clause)
         db.session.commit()
+        investors_changed(investor_id)
         return "", 204
     
+    @app.route("/clauses/<int:clause_id>/similar", methods=["GET"])
+    @token_required
+    def get_similar_clauses(clause_id):
+        """
+        Clauses with the same or nearly the same wording, across all investors.
+        
+        Query: limit (default 20, max 200) and minSimilarity (0-1, default
+        0.5). Similarity is the MinHash estimate of word 3-gram overlap; see
+        clause_similarity.
+        """
+        if db.session.get(Clause, clause_id) is None:
+            return jsonify({"error": "Clause not found"}), 404
+        limit = request.args.get("limit", 20, type=int)
+        min_similarity = request.args.get("minSimilarity", 0.5, type=float)
+        if not 1 <= limit <= 200 or not 0 < min_similarity <= 1:
+            return jsonify({"error": "limit must be 1-200 and minSimilarity in (0, 1]"}), 400
+        matches, candidates = similar_clauses(clause_id, limit=limit, min_similarity=min_similarity)
+        return clause_json({"clauseId": clause_id, "candidates": candidates, "similar": matches})
+    
+    @app.route("/clauses", methods=["PATCH"])
+    @token_required
+    def bulk_update_clauses():
+        """
+        Apply partial updates to many clauses in one transaction.
+        
+        Body: a list (or {"clauses": [...]}) of {"id": ..., <fields>}. Updates
+        changing the same set of fields go out as one executemany UPDATE.
+        Returns a result per item in request order; invalid or unknown items
+        are reported and skipped while the rest are applied.
+        """
+        data = request.get_json(silent=True)
+        items = data.get("clauses") if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({"error": "Expected a list of clause updates"}), 400
+        
+        results = [None] * len(items)
+        pending = {}  # clause id -> (index, values)
+        for index, item in enumerate(items):
+            clause_id = item.get("id") if isinstance(item, dict) else None
+            if not isinstance(clause_id, int) or isinstance(clause_id, bool):
+                results[index] = {"id": clause_id, "status": 400, "error": "id is required"}
+                continue
+            if clause_id in pending:
+                results[index] = {"id": clause_id, "status": 400, "error": "Duplicate id in batch"}
+                continue
+            values, error = clause_values(item, strict=True)
+            if error:
+                results[index] = {"id": clause_id, "status": 400, "error": error}
+            else:
+                pending[clause_id] = (index, values)
+        
+        owners = clause_owners(pending)
+        text_ids = intern_texts(
+            values["clause_text"] for clause_id, (_, values) in pending.items()
+            if clause_id in owners and "clause_text" in values
+        )
+        groups = {}  # changed column set -> executemany parameters
+        for clause_id, (index, values) in pending.items():
+            if clause_id not in owners:
+                results[index] = {"id": clause_id, "status": 404, "error": "Clause not found"}
+            elif values:
+                if "clause_text" in values:
+                    # Stored as a reference to the interned text
+                    text = values.pop("clause_text")
+                    values.update(text_id=text_ids.get(text), legacy_text=None)
+                groups.setdefault(tuple(sorted(values)), []).append({"id": clause_id, **values})
+        
+        for params in groups.values():
+            db.session.execute(update(Clause), params)
+        index_clauses([
+            clause_id for columns, params in groups.items() if "text_id" in columns
+            for clause_id in (item["id"] for item in params)
+        ])
+        updated = [clause_id for clause_id in pending if clause_id in owners]
+        # Items naming no fields are reported but leave no trace
+        changed = [item["id"] for params in groups.values() for item in params]
+        record_changes("clause", "upsert", changed)
+        investor_ids = {owners[clause_id][1] for clause_id in changed}
+        touch_investors(investor_ids, {owners[clause_id][0] for clause_id in changed})
+        db.session.commit()
+        investors_changed(*investor_ids)
+        
+        clauses = {
+            clause.id: clause
+            for clause in db.session.scalars(select(Clause).where(Clause.id.in_(updated)))
+        }
+        for clause_id in updated:
+            results[pending[clause_id][0]] = {
+                "id": clause_id, "status": 200, "clause": clauses[clause_id].to_dict(),
+            }
+        return jsonify({"updated": len(changed), "results": results})
+    
+    @app.route("/clauses", methods=["DELETE"])
+    @token_required
+    def bulk_delete_clauses():
+        """
+        Delete many clauses in one statement.
+        
+        Ids come from the body ({"ids": [...]}) or ?ids=1,2,3. Returns a
+        result per id: 204 when deleted, 404 when it didn't exist.
+        """
+        data = request.get_json(silent=True) or {}
+        ids = data.get("ids") if isinstance(data, dict) else None
+        if ids is None and request.args.get("ids"):
+            try:
+                ids = [int(part) for part in request.args["ids"].split(",") if part.strip()]
+            except ValueError:
+                return jsonify({"error": "ids must be integers"}), 400
+        if not isinstance(ids, list) or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids
+        ):
+            return jsonify({"error": "Expected a list of clause ids"}), 400
+        
+        ids = list(dict.fromkeys(ids))
+        owners = clause_owners(ids)
+        found = [clause_id for clause_id in ids if clause_id in owners]
+        delete_clauses(found)
+        investor_ids = {owners[clause_id][1] for clause_id in found}
+        touch_investors(investor_ids, {owners[clause_id][0] for clause_id in found})
+        db.session.commit()
+        investors_changed(*investor_ids)
+        
+        return jsonify({
+            "deleted": len(found),
+            "results": [
+                {"id": clause_id, "status": 204} if clause_id in owners
+                else {"id": clause_id, "status": 404, "error": "Clause not found"}
+                for clause_id in ids
+            ],
+        })
+    
+    # Funds
+    @app.route("/funds", methods=["GET"])
+    @token_required
+    def list_funds():
+        """Funds with their investor count and total commitments."""
+        rows = db.session.execute(
+            select(Fund, func.count(Commitment.id), func.sum(Commitment.amount))
+            .outerjoin(Commitment, Commitment.fund_id == Fund.id)
+            .group_by(Fund.id)
+            .order_by(Fund.name)
+        )
+        return jsonify([
+            {**fund.to_dict(), "investorCount": count, "totalCommitment": total}
+            for fund, count, total in rows
+        ])
+    
+    @app.route("/funds", methods=["POST"])
+    @token_required
+    def create_fund():
+        data = request.get_json() or {}
+        name = (data.get("name") or "").strip()
+        if not name:
+            return jsonify({"error": "name is required"}), 400
+        if db.session.scalar(select(Fund.id).where(Fund.name == name)) is not None:
+            return jsonify({"error": f"Fund '{name}' already exists"}), 409
+        fund = Fund(name=name, vehicle_type=data.get("vehicleType"), vintage_year=data.get("vintageYear"))
+        db.session.add(fund)
+        db.session.commit()
+        return jsonify(fund.to_dict()), 201
+    
+    @app.route("/funds/<int:fund_id>/commitments", methods=["POST"])
+    @token_required
+    def upsert_commitment(fund_id):
+        """Create or update an investor's commitment to the fund."""
+        fund = Fund.query.get_or_404(fund_id)
+        data = request.get_json() or {}
+        investor_id = data.get("investorId")
+        if not investor_id:
+            return jsonify({"error": "investorId is required"}), 400
+        investor = Investor.query.get_or_404(investor_id)
+        
+        commitment = db.session.scalar(
+            select(Commitment).where(Commitment.investor_id == investor_id, Commitment.fund_id == fund_id)
+        )
+        created = commitment is None
+        if created:
+            commitment = Commitment(investor_id=investor_id, fund_id=fund_id)
+            db.session.add(commitment)
+        if "amount" in data:
+            commitment.amount = data["amount"]
+        if "currency" in data:
+            commitment.currency = data["currency"]
+        if "commitmentDate" in data:
+            commitment.commitment_date = parse_date(data["commitmentDate"])
+        if "status" in data:
+            commitment.status = data["status"]
+        if fund.name == investor.fund:
+            # The legacy fields mirror the commitment to the investor's named fund
+            investor.commitment_amount = commitment.amount
+            investor.currency = commitment.currency or "USD"
+        record_changes("investor", "upsert", [investor_id])
+        touch_investor(investor_id)
+        db.session.commit()
+        investors_changed(investor_id)
+        return jsonify(commitment.to_dict()), 201 if created else 200
+    
+    @app.route("/funds/<int:fund_id>/investors", methods=["GET"])
+    @token_required
+    def fund_investors(fund_id):
+        """
+        Investors committed to a fund, with their commitment.
+        
+        Answered from the commitments (fund_id, investor_id) index and the
+        investors primary key; ?limit= and ?offset= page through large funds.
+        """
+        fund = Fund.query.get_or_404(fund_id)
+        limit, offset, error = page_args(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        query = (
+            select(Investor.id, Investor.name, Investor.investor_type, Commitment.id,
+                   Commitment.amount, Commitment.currency, Commitment.commitment_date,
+                   Commitment.status)
+            .join(Commitment, Commitment.investor_id == Investor.id)
+            .where(Commitment.fund_id == fund_id)
+            .order_by(Commitment.investor_id)
+        )
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+        count, total = db.session.execute(
+            select(func.count(Commitment.id), func.sum(Commitment.amount))
+            .where(Commitment.fund_id == fund_id)
+        ).one()
+        return jsonify({
+            "fund": fund.to_dict(),
+            "investorCount": count,
+            "totalCommitment": total,
+            "investors": [
+                {
+                    "id": investor_id,
+                    "name": name,
+                    "investorType": investor_type,
+                    "commitment": {
+                        "id": commitment_id,
+                        "amount": amount,
+                        "currency": currency,
+                        "commitmentDate": commitment_date,
+                        "status": status,
+                    },
+                }
+                for investor_id, name, investor_type, commitment_id, amount, currency,
+                    commitment_date, status in db.session.execute(query)
+            ],
+        })
+    
+    @app.route("/funds/<int:fund_id>/documents", methods=["GET"])
+    @token_required
+    def fund_documents(fund_id):
+        """
+        Documents of the fund's investors, newest first (optional ?docType=).
+        
+        Joins the commitments index to documents.investor_id; source text and
+        clauses are left out (GET /documents/:id has them).
+        """
+        Fund.query.get_or_404(fund_id)
+        limit, offset, error = page_args(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        query = (
+            select(Document.id, Document.investor_id, Investor.name, Document.title,
+                   Document.doc_type, Document.status, Document.effective_date,
+                   Document.supersedes_id, Document.priority, Document.updated_at)
+            .join(Commitment, Commitment.investor_id == Document.investor_id)
+            .join(Investor, Investor.id == Document.investor_id)
+            .where(Commitment.fund_id == fund_id)
+            .order_by(Document.effective_date.desc().nullslast(), Document.id)
+        )
+        doc_type = request.args.get("docType")
+        if doc_type:
+            query = query.where(Document.doc_type == doc_type)
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+        return jsonify([
+            {
+                "id": document_id,
+                "investorId": investor_id,
+                "investorName": investor_name,
+                "title": title,
+                "docType": document_type,
+                "status": status,
+                "effectiveDate": effective_date,
+                "supersedesId": supersedes_id,
+                "priority": priority,
+                "updatedAt": updated_at,
+            }
+            for document_id, investor_id, investor_name, title, document_type, status,
+                effective_date, supersedes_id, priority, updated_at in db.session.execute(query)
+        ])
+    
     # Effective Terms
     @app.route("/investors/<int:investor_id>/effective-terms", methods=["GET"])
     @token_required
     def get_effective_terms(investor_id):
         """Get calculated effective terms for an investor."""
         # Verify investor exists
+        investor = Investor.query.get_or_404(investor_id)
+        
+        # Optional ?asOf=YYYY-MM-DD gives the terms in force on that date
+        as_of = parse_date(request.args.get("asOf"))
+        
+        # Terms only change when something under the investor changes
+        etag = text_refs_etag(make_etag("effective-terms", investor.id, investor.updated_at, as_of))
+        
+        def render():
+            try:
+                result = calculate_effective_terms(
+                    investor_id, as_of=as_of, version=investor.updated_at
+                )
+            except SupersedesCycleError as e:
+                response = jsonify({"error": str(e), "cycle": e.cycle})
+                response.status_code = 409
+                return response
+            return clause_json(result)
+        
+        return conditional(etag, investor.updated_at, cached_render(etag, investor.id, render))
+    
+    @app.route("/investors/<int:investor_id>/overview", methods=["GET"])
+    @token_required
+    def get_investor_overview(investor_id):
+        """
+        Everything an investor page needs in one response: the investor, its
+        commitments, its documents with clauses (no source text) and the
+        effective terms resolved from those same documents.
+        
+        Four queries whatever the size of the book: investor, commitments,
+        documents and clauses. Optional ?asOf=YYYY-MM-DD applies to the terms.
+        """
+        investor = Investor.query.get_or_404(investor_id)
+        as_of = parse_date(request.args.get("asOf"))
+        etag = text_refs_etag(make_etag("overview", investor.id, investor.updated_at, as_of))
+        
+        def render():
+            commitments = db.session.execute(
+                select(Commitment, Fund.name)
+                .join(Fund, Fund.id == Commitment.fund_id)
+                .where(Commitment.investor_id == investor_id)
+                .order_by(Fund.name)
+            ).all()
+            documents = db.session.scalars(
+                select(Document)
+                .where(Document.investor_id == investor_id)
+                .options(defer(Document.source_text), selectinload(Document.clauses))
+                .order_by(Document.effective_date.desc().nullslast(), Document.id)
+            ).all()
+            
+            terms_error = None
+            try:
+                terms = effective_terms_for_documents(
+                    documents, as_of=as_of, cache_key=(investor.id, investor.updated_at)
+                )
+            except SupersedesCycleError as e:
+                terms, terms_error = None, {"error": str(e), "cycle": e.cycle}
+            
+            return clause_json({
+                "investor": investor.to_dict(),
+                "commitments": [
+                    {**commitment.to_dict(), "fundName": fund_name}
+                    for commitment, fund_name in commitments
+                ],
+                "documents": [doc.to_dict(include_source_text=False) for doc in documents],
+                "effectiveTerms": terms,
+                "effectiveTermsError": terms_error,
+            })
+        
+        return conditional(etag, investor.updated_at, cached_render(etag, investor.id, render))
+    
+    @app.route("/investors/<int:investor_id>/effective-terms/stream", methods=["GET"])
+    def stream_effective_terms(investor_id):
+        """
+        Server-sent events feed of changes to an investor's effective terms.
+        
+        EventSource can't set headers, so the token may be passed as ?token=.
+        """
+        token = bearer_token() or request.args.get("token")
+        _, error = authenticate_token(token, app.config["JWT_SECRET"])
+        if error:
+            return jsonify({"error": error}), 401
+        
         Investor.query.get_or_404(investor_id)
+        # Other workers' writes from here on reach this stream via the change log
+        app.extensions["terms_poller"].start()
+        try:
+            winners = winners_from_terms(calculate_effective_terms(investor_id)["terms"])
+        except SupersedesCycleError as e:
+            return jsonify({"error": str(e), "cycle": e.cycle}), 409
+        feed = app.extensions["terms_feed"]
+        subscription = feed.subscribe(investor_id, winners)
+        if subscription is None:
+            response = jsonify({"error": "Too many open streams, try again later"})
+            response.headers["Retry-After"] = str(int(app.config["SSE_HEARTBEAT_SECONDS"]))
+            return response, 503
+        heartbeat = app.config["SSE_HEARTBEAT_SECONDS"]
+        
+        def events():
+            try:
+                yield format_sse("snapshot", {"investorId": investor_id, "terms": winners})
+                while True:
+                    event = subscription.get(timeout=heartbeat)
+                    if event is None:
+                        yield ": keep-alive\n\n"
+                    else:
+                        yield format_sse(*event)
+            finally:
+                feed.unsubscribe(subscription)
         
-        # Calculate effective terms
-        result = calculate_effective_terms(investor_id)
-        return jsonify(result)
+        return Response(events(), mimetype="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+    
+    # Analytics
+    @app.route("/analytics/terms", methods=["GET"])
+    @token_required
+    def terms_analytics():
+        """
+        Effective-terms statistics per fund and clause type across the book.
+        
+        Optional ?fund= and ?clauseType= filters.
+        """
+        fund = request.args.get("fund")
+        clause_type = request.args.get("clauseType")
+        book_etag, last_modified = listing_validators()
+        etag = make_etag("analytics", book_etag, fund, clause_type)
+        
+        def render():
+            snapshot = current_app.extensions["terms_snapshot"].get(book_etag)
+            return jsonify(aggregate(snapshot, fund=fund, clause_type=clause_type))
+        
+        return conditional(etag, last_modified, render)
+    
+    # Columnar export
+    @app.route("/export/<table>", methods=["GET"])
+    @token_required
+    def export_table(table):
+        """
+        Stream one snapshot table (investors, documents, clauses or
+        effective_terms) as an Arrow IPC stream, one record batch at a time.
+        """
+        if table not in TABLE_NAMES:
+            return jsonify({"error": f"Unknown table: {table}"}), 404
+        if not ARROW_AVAILABLE:
+            return jsonify({"error": "Columnar export requires pyarrow"}), 501
+        
+        version, _ = snapshot_version()
+        return Response(
+            stream_with_context(arrow_stream(table, version)),
+            mimetype="application/vnd.apache.arrow.stream",
+            headers={"X-Snapshot-Version": version},
+        )
+    
+    # Change feed
+    @app.route("/changes", methods=["GET"])
+    @token_required
+    def list_changes():
+        """
+        Investor, document and clause writes after a cursor, oldest first.
+        
+        ?since=<cursor> (default 0, the start of the log) and ?limit= (default
+        500, max 5000). Returns the changes, the cursor to pass next time and
+        whether more are waiting. Each entry says which entity was upserted or
+        deleted, with its document and investor ids.
+        """
+        since = request.args.get("since", "0")
+        limit = request.args.get("limit", "500")
+        if not (since.isdigit() and limit.isdigit() and 1 <= int(limit) <= 5000):
+            return jsonify({"error": "since must be a cursor and limit between 1 and 5000"}), 400
+        since, limit = int(since), int(limit)
+        
+        changes = db.session.scalars(
+            select(Change).where(Change.id > since).order_by(Change.id).limit(limit + 1)
+        ).all()
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return jsonify({
+            "changes": [change.to_dict() for change in changes],
+            "cursor": changes[-1].id if changes else since,
+            "hasMore": has_more,
+        })
     
     # Demo Data Management
     @app.route("/demo/seed", methods=["POST"])
     @token_required
     def seed_demo_data():
-        """Seed the database with demo data for presentation."""
-        created = seed_demo_investors()
+        """
+        Seed the database with demo data for presentation.
+        
+        ?investors=N generates N synthetic investor books instead (optional
+        ?seed= for a different but repeatable set).
+        """
+        n_investors = request.args.get("investors", type=int)
+        if n_investors is None:
+            created = seed_demo_investors()
+        else:
+            max_investors = current_app.config["DEMO_SEED_MAX_INVESTORS"]
+            if not 1 <= n_investors <= max_investors:
+                return jsonify({"error": f"investors must be between 1 and {max_investors}"}), 400
+            created = seed_synthetic_investors(n_investors, seed=request.args.get("seed", 7, type=int))
         return jsonify({
             "message": "Demo data seeded successfully",
             "created": created
@@ -324,11 +1149,12 @@ def register_routes(app):
     @token_required
     def clear_demo_data():
         """Clear all data from the database."""
-        # Delete in order to handle foreign keys
-        Clause.query.delete()
-        Document.query.delete()
-        Investor.query.delete()
+        investor_ids = [investor_id for (investor_id,) in db.session.query(Investor.id)]
+        
+        delete_investors(select(Investor.id))
+        db.session.execute(delete(Fund))
         db.session.commit()
+        investors_changed(*investor_ids)
         return jsonify({"message": "All data cleared successfully"})
     
     # AI Extraction
@@ -340,27 +1166,132 @@ def register_routes(app):
         text = data.get("text", "")
         use_mock = data.get("mock", False)
         
-        if not text or len(text.strip()) < 50:
-            return jsonify({"error": "Document text is too short (minimum 50 characters)"}), 400
-        
-        if len(text) > 100000:
-            return jsonify({"error": "Document text is too long (maximum 100,000 characters)"}), 400
+        error = validate_extraction_text(text)
+        if error:
+            return jsonify({"error": error}), 400
         
         try:
             if use_mock:
                 result = mock_extract_clauses(text)
             else:
-                result = extract_clauses(text)
-                # Fall back to mock if AI fails
-                if "error" in result and not result.get("clauses"):
-                    mock_result = mock_extract_clauses(text)
-                    mock_result["ai_error"] = result.get("error")
-                    result = mock_result
+                # Route across providers; fall back to mock if they all fail
+                router = current_app.extensions["provider_router"]
+                result = with_mock_fallback(extract_with_prefilter(text, router.extract), text)
             
             return jsonify(result)
         except Exception as e:
             return jsonify({"error": f"Extraction failed: {str(e)}"}), 500
     
+    @app.route("/extract/upload", methods=["POST"])
+    @token_required
+    def extract_from_upload():
+        """
+        Extract clauses from an uploaded PDF, DOCX or TXT file.
+        
+        multipart/form-data with a "file" part (and optional mock=true). The
+        file is streamed to disk, converted to text with page ranges in a
+        child process, then extracted like POST /extract. Clauses get
+        page numbers from where their text falls. The response carries
+        sourceText and pages for POST /extract/apply; the file is removed.
+        """
+        created = []
+        try:
+            _, form, files = parse_form_data(
+                request.environ,
+                stream_factory=upload_stream_factory(
+                    upload_dir(current_app.config), current_app.config["MAX_UPLOAD_BYTES"], created
+                ),
+                **upload_limits(current_app.config),
+            )
+            upload = files.get("file")
+            if upload is None or not upload.filename:
+                return jsonify({"error": "A file is required"}), 400
+            kind = file_kind(upload.filename)
+            if kind is None:
+                return jsonify({"error": "Unsupported file type (use .pdf, .docx or .txt)"}), 415
+            if kind == "pdf" and not PYPDF_AVAILABLE:
+                return jsonify({"error": "PDF support is not installed (pip install pypdf)"}), 415
+            upload.stream.flush()
+            
+            try:
+                document_text = current_app.extensions["file_text_extractor"].extract(
+                    upload.stream.name, kind
+                )
+            except Exception as e:
+                return jsonify({"error": f"Could not read {upload.filename}: {e}"}), 422
+            file_info = {"name": upload.filename, "kind": kind, "size": upload.stream.size}
+        finally:
+            remove_uploads(created)
+        
+        text, pages = document_text["text"], document_text["pages"]
+        error = validate_extraction_text(text, max_length=current_app.config["UPLOAD_MAX_TEXT_LENGTH"])
+        if error:
+            return jsonify({"error": error, "file": file_info}), 400
+        
+        try:
+            if form.get("mock", "").lower() == "true":
+                result = mock_extract_clauses(text)
+            else:
+                # Files may hold more than one provider call takes: the text
+                # sent after pre-filtering goes in pieces of MAX_TEXT_LENGTH
+                router = current_app.extensions["provider_router"]
+                result = with_mock_fallback(extract_with_prefilter(
+                    text, lambda prompt_text: extract_in_chunks(prompt_text, router.extract)
+                ), text)
+        except Exception as e:
+            return jsonify({"error": f"Extraction failed: {str(e)}"}), 500
+        
+        assign_page_numbers(result.get("clauses", []), text, pages)
+        return jsonify({**result, "file": file_info, "sourceText": text, "pages": pages})
+    
+    @app.route("/extract/providers", methods=["GET"])
+    @token_required
+    def extraction_providers():
+        """Circuit state and latency percentiles of each configured provider."""
+        return jsonify(current_app.extensions["provider_router"].status())
+    
+    @app.route("/extract/metrics", methods=["GET"])
+    @token_required
+    def extraction_metrics_summary():
+        """Prompt tokens sent and saved by the pre-filter, and provider time."""
+        return jsonify(extraction_metrics.summary())
+    
+    @app.route("/extract/stream", methods=["POST"])
+    @token_required
+    def stream_extraction():
+        """
+        Extract clauses as newline-delimited JSON while the model generates.
+        
+        Each line is {"type": "clause", "clause": {...}} as soon as that clause
+        is complete, followed by one {"type": "done", ...} line carrying
+        document_info and extraction_notes.
+        """
+        data = request.get_json() or {}
+        text = data.get("text", "")
+        use_mock = data.get("mock", False)
+        
+        error = validate_extraction_text(text)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        router = current_app.extensions["provider_router"]
+        
+        def lines():
+            try:
+                for kind, payload in stream_extract_clauses(text, router.stream, mock=use_mock):
+                    if kind == "clause":
+                        event = {"type": "clause", "clause": payload}
+                    else:
+                        event = {"type": "done", **payload}
+                    yield app.json.dumps(event) + "\n"
+            except Exception as e:
+                yield app.json.dumps({"type": "done", "error": f"Extraction failed: {str(e)}"}) + "\n"
+        
+        return Response(stream_with_context(lines()), mimetype="application/x-ndjson", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+    
     @app.route("/extract/apply", methods=["POST"])
     @token_required
     def apply_extraction():
@@ -369,6 +1300,7 @@ def register_routes(app):
         document_id = data.get("documentId")
         clauses = data.get("clauses", [])
         source_text = data.get("sourceText")  # Save the source text for highlighting
+        file_name = data.get("fileName")
         
         if not document_id:
             return jsonify({"error": "documentId is required"}), 400
@@ -378,31 +1310,26 @@ def register_routes(app):
         # Save the source text to the document if provided
         if source_text:
             document.source_text = source_text
+        if file_name:
+            document.file_name = file_name
         
         created_clauses = []
+        # Skip if not approved or low confidence
+        clauses = [clause_data for clause_data in clauses if clause_data.get("approved", True)]
+        text_ids = intern_texts(clause_data.get("clause_text") for clause_data in clauses)
         
         for clause_data in clauses:
-            # Skip if not approved or low confidence
-            if not clause_data.get("approved", True):
-                continue
-            
-            clause = Clause(
-                document_id=document_id,
-                clause_type=clause_data.get("clause_type", "Other"),
-                rate=clause_data.get("rate"),
-                threshold=clause_data.get("threshold"),
-                threshold_amount=clause_data.get("threshold_amount"),
-                discount=clause_data.get("discount"),
-                effective_date=parse_date(clause_data.get("effective_date")),
-                section_ref=clause_data.get("section_ref"),
-                page_number=clause_data.get("page_number"),
-                clause_text=clause_data.get("clause_text"),
-                notes=clause_data.get("notes", "")
-            )
+            clause = extracted_clause(document_id, clause_data, text_ids)
             db.session.add(clause)
             created_clauses.append(clause)
         
+        db.session.flush()
+        index_clauses([clause.id for clause in created_clauses])
+        record_changes("document", "upsert", [document_id])
+        record_changes("clause", "upsert", [clause.id for clause in created_clauses])
+        touch_investor(document.investor_id, document_id)
         db.session.commit()
+        investors_changed(document.investor_id)
         
         # Refresh the document to get the updated data with all clauses
         db.session.refresh(document)
@@ -412,444 +1339,166 @@ def register_routes(app):
             "clauses": [c.to_dict() for c in created_clauses],
             "document": document.to_dict()  # Return full document with sourceText
         })
-
-
-def seed_demo_investors():
-    """Create demo investors with documents and clauses."""
-    created = {"investors": 0, "documents": 0, "clauses": 0}
     
-    # Sample document texts
-    SAMPLE_PPM_TEXT = """PRIVATE PLACEMENT MEMORANDUM
-
-MOCK FUND I, LP
-
-Confidential Private Placement Memorandum dated January 1, 2024.
-
-SECTION 6. MANAGEMENT FEE AND EXPENSES
-
-6.1 Management Fee. The Management Fee shall be 2.00% per annum of each Limited Partner's Capital Commitment during the Investment Period. Following the Investment Period, the Management Fee shall be calculated based on invested capital.
-
-6.2 Payment. The Management Fee shall be payable quarterly in advance.
-
-6.3 Expenses. The Partnership shall bear all organizational expenses and operating expenses."""
-
-    SAMPLE_SUBSCRIPTION_TEXT = """SUBSCRIPTION AGREEMENT
-
-This Subscription Agreement is entered into by and between the undersigned investor ("Limited Partner") and Mock Fund I GP, LLC ("General Partner").
-
-SECTION 4. ACKNOWLEDGMENTS
-
-4.1 PPM Review. The Limited Partner acknowledges receipt and review of the Private Placement Memorandum.
-
-4.2 Management Fee. Limited Partner acknowledges the Management Fee as set forth in the PPM.
-
-4.3 Commitment. The Limited Partner hereby commits to contribute capital as set forth in Schedule A."""
-
-    SAMPLE_SIDE_LETTER_TEXT = """SIDE LETTER AGREEMENT
-
-This Side Letter Agreement ("Agreement") is entered into as of February 1, 2024.
-
-PARTIES:
-- Mock Capital LP ("Limited Partner")
-- Mock Fund I GP, LLC ("General Partner")
-
-SECTION 3. MANAGEMENT FEE REDUCTION
-
-3.1 Base Fee. The standard Management Fee is 2.00% per annum as set forth in the PPM.
-
-3.2 Reduced Rate. Notwithstanding Section 6.1 of the PPM, the Management Fee payable by the Limited Partner shall be reduced to 1.75% per annum of the Capital Commitment.
-
-3.3 Fee Step-Down. Beginning on the fourth anniversary of the final closing, the Management Fee shall be further reduced by 0.25% per annum.
-
-SECTION 5. MOST FAVORED NATION
-
-5.1 MFN Rights. If the Partnership enters into a side letter with any other Limited Partner granting more favorable economic terms, the Partnership shall promptly notify the Limited Partner and offer equivalent terms."""
-
-    # ========================================
-    # Mock Capital LP - Demonstrates Hierarchy
-    # ========================================
-    mock_capital = Investor(
-        name="Mock Capital LP",
-        investor_type="Limited Partner",
-        commitment_amount=250000000,  # $250M
-        currency="USD",
-        fund="Mock Fund I",
-        relationship_notes="Long-standing institutional investor. Key relationship.",
-        internal_notes="Negotiated favorable terms due to anchor commitment."
-    )
-    db.session.add(mock_capital)
-    db.session.flush()  # Get ID
-    created["investors"] += 1
-    
-    # PPM (base document)
-    ppm = Document(
-        investor_id=mock_capital.id,
-        title="Mock Fund I PPM",
-        doc_type="PPM",
-        status="Active",
-        effective_date=date(2024, 1, 1),
-        priority=derive_priority("PPM"),
-        source_text=SAMPLE_PPM_TEXT
-    )
-    db.session.add(ppm)
-    db.session.flush()
-    created["documents"] += 1
-    
-    # PPM clause - Base management fee
-    ppm_fee = Clause(
-        document_id=ppm.id,
-        clause_type="Management Fee",
-        rate=2.0,
-        section_ref="6.1",
-        page_number=42,
-        clause_text="The Management Fee shall be 2.00% per annum of each Limited Partner's Capital Commitment during the Investment Period.",
-        notes="Standard PPM rate"
-    )
-    db.session.add(ppm_fee)
-    created["clauses"] += 1
-    
-    # Subscription Agreement
-    sub_agreement = Document(
-        investor_id=mock_capital.id,
-        title="Mock Capital Subscription Agreement",
-        doc_type="Subscription Agreement",
-        status="Active",
-        effective_date=date(2024, 1, 15),
-        priority=derive_priority("Subscription Agreement"),
-        source_text=SAMPLE_SUBSCRIPTION_TEXT
-    )
-    db.session.add(sub_agreement)
-    db.session.flush()
-    created["documents"] += 1
-    
-    # Subscription clause - confirms PPM rate
-    sub_fee = Clause(
-        document_id=sub_agreement.id,
-        clause_type="Management Fee",
-        rate=2.0,
-        section_ref="4.2",
-        page_number=8,
-        clause_text="Limited Partner acknowledges the Management Fee as set forth in the PPM.",
-        notes="References PPM terms"
-    )
-    db.session.add(sub_fee)
-    created["clauses"] += 1
-    
-    # Side Letter (overrides subscription)
-    side_letter = Document(
-        investor_id=mock_capital.id,
-        title="Mock Capital Side Letter",
-        doc_type="Side Letter",
-        status="Active",
-        effective_date=date(2024, 2, 1),
-        priority=derive_priority("Side Letter"),
-        source_text=SAMPLE_SIDE_LETTER_TEXT
-    )
-    db.session.add(side_letter)
-    db.session.flush()
-    created["documents"] += 1
-    
-    # Side Letter clause - Reduced management fee
-    sl_fee = Clause(
-        document_id=side_letter.id,
-        clause_type="Management Fee",
-        rate=1.75,
-        section_ref="3.2",
-        page_number=2,
-        clause_text="Notwithstanding Section 6.1 of the PPM, the Management Fee payable by the Limited Partner shall be reduced to 1.75% per annum of the Capital Commitment.",
-        notes="Negotiated reduction for anchor investor"
-    )
-    db.session.add(sl_fee)
-    created["clauses"] += 1
-    
-    # Side Letter clause - Fee step-down
-    sl_stepdown = Clause(
-        document_id=side_letter.id,
-        clause_type="Fee Step-Down",
-        discount=0.25,
-        threshold="Year 4",
-        section_ref="3.3",
-        page_number=2,
-        clause_text="Beginning on the fourth anniversary of the final closing, the Management Fee shall be further reduced by 0.25% per annum.",
-        notes="Time-based reduction"
-    )
-    db.session.add(sl_stepdown)
-    created["clauses"] += 1
-    
-    # Side Letter clause - MFN
-    sl_mfn = Clause(
-        document_id=side_letter.id,
-        clause_type="MFN (Most Favored Nation)",
-        section_ref="5.1",
-        page_number=3,
-        clause_text="If the Partnership enters into a side letter with any other Limited Partner granting more favorable economic terms, the Partnership shall promptly notify the Limited Partner and offer equivalent terms.",
-        notes="Full MFN protection"
-    )
-    db.session.add(sl_mfn)
-    created["clauses"] += 1
+    # Profiling
+    @app.route("/admin/profiles", methods=["GET"])
+    @admin_required
+    def profiles():
+        """Most recent ?profile=1 captures (summaries, newest first)."""
+        return jsonify([
+            {key: value for key, value in profile.items() if key != "sql"}
+            for profile in list_profiles(current_app.config)
+        ])
     
-    # ========================================
-    # Atlas Family Office - Multiple Clause Types
-    # ========================================
-    ATLAS_SUBSCRIPTION_TEXT = """SUBSCRIPTION AGREEMENT
-
-ATLAS FAMILY OFFICE
-
-This Subscription Agreement is entered into as of March 1, 2024.
-
-SECTION 4. TERMS AND CONDITIONS
-
-4.1 Capital Commitment. The Limited Partner commits to contribute $75,000,000.
-
-4.2 Management Fee. The Management Fee shall be as set forth in the PPM.
-
-4.3 Investment Period. The Investment Period shall be five years from the final closing."""
-
-    ATLAS_SIDE_LETTER_TEXT = """SIDE LETTER AGREEMENT
-
-This Side Letter Agreement is entered into as of March 15, 2024.
-
-PARTIES:
-- Atlas Family Office ("Limited Partner")
-- Mock Fund I GP, LLC ("General Partner")
-
-SECTION 4. CO-INVESTMENT RIGHTS
-
-4.1 Co-Investment. The Limited Partner shall have the right to participate in co-investment opportunities alongside the Fund on a no-fee, no-carry basis, subject to allocation procedures determined by the General Partner.
-
-SECTION 5. MOST FAVORED NATION
-
-5.1 MFN Rights. The Limited Partner shall be entitled to receive the benefit of any more favorable terms granted to other Limited Partners with respect to management fees or carried interest.
-
-SECTION 6. PREFERRED RETURN
-
-6.1 Hurdle Rate. The Limited Partner shall receive a preferred return of 8% per annum, compounded annually, before any carried interest is payable to the General Partner."""
-
-    atlas = Investor(
-        name="Atlas Family Office",
-        investor_type="Family Office",
-        commitment_amount=75000000,  # $75M
-        currency="USD",
-        fund="Mock Fund I",
-        relationship_notes="Multi-generational family office. Focus on alternative investments.",
-        internal_notes="Interested in co-investment opportunities."
-    )
-    db.session.add(atlas)
-    db.session.flush()
-    created["investors"] += 1
-    
-    # Subscription Agreement for Atlas
-    atlas_sub = Document(
-        investor_id=atlas.id,
-        title="Atlas Family Office Subscription Agreement",
-        doc_type="Subscription Agreement",
-        status="Active",
-        effective_date=date(2024, 3, 1),
-        priority=derive_priority("Subscription Agreement"),
-        source_text=ATLAS_SUBSCRIPTION_TEXT
-    )
-    db.session.add(atlas_sub)
-    db.session.flush()
-    created["documents"] += 1
-    
-    # Atlas subscription - standard fee
-    atlas_sub_fee = Clause(
-        document_id=atlas_sub.id,
-        clause_type="Management Fee",
-        rate=2.0,
-        section_ref="4.2",
-        page_number=8,
-        clause_text="The Management Fee shall be as set forth in the PPM.",
-        notes="Standard terms"
-    )
-    db.session.add(atlas_sub_fee)
-    created["clauses"] += 1
-    
-    # Side Letter for Atlas
-    atlas_sl = Document(
-        investor_id=atlas.id,
-        title="Atlas Family Office Side Letter",
-        doc_type="Side Letter",
-        status="Active",
-        effective_date=date(2024, 3, 15),
-        priority=derive_priority("Side Letter"),
-        source_text=ATLAS_SIDE_LETTER_TEXT
-    )
-    db.session.add(atlas_sl)
-    db.session.flush()
-    created["documents"] += 1
-    
-    # Atlas - Co-investment rights
-    atlas_coinvest = Clause(
-        document_id=atlas_sl.id,
-        clause_type="Co-investment Rights",
-        section_ref="4.1",
-        page_number=2,
-        clause_text="The Limited Partner shall have the right to participate in co-investment opportunities alongside the Fund on a no-fee, no-carry basis, subject to allocation procedures determined by the General Partner.",
-        notes="Priority co-investment rights"
-    )
-    db.session.add(atlas_coinvest)
-    created["clauses"] += 1
-    
-    # Atlas - MFN protection
-    atlas_mfn = Clause(
-        document_id=atlas_sl.id,
-        clause_type="MFN (Most Favored Nation)",
-        section_ref="5.1",
-        page_number=3,
-        clause_text="The Limited Partner shall be entitled to receive the benefit of any more favorable terms granted to other Limited Partners with respect to management fees or carried interest.",
-        notes="Economic MFN only"
-    )
-    db.session.add(atlas_mfn)
-    created["clauses"] += 1
-    
-    # Atlas - Preferred return
-    atlas_pref = Clause(
-        document_id=atlas_sl.id,
-        clause_type="Preferred Return",
-        rate=8.0,
-        section_ref="6.1",
-        page_number=4,
-        clause_text="The Limited Partner shall receive a preferred return of 8% per annum, compounded annually, before any carried interest is payable to the General Partner.",
-        notes="Standard hurdle rate"
-    )
-    db.session.add(atlas_pref)
-    created["clauses"] += 1
+    @app.route("/admin/profiles/<profile_id>", methods=["GET"])
+    @admin_required
+    def get_profile(profile_id):
+        """A captured profile: timings, SQL statements and folded stacks."""
+        profile = load_profile(current_app.config, profile_id)
+        if profile is None:
+            return jsonify({"error": "Profile not found"}), 404
+        summary, folded = profile
+        return jsonify({**summary, "folded": folded})
     
-    # ========================================
-    # Meridian Pension Fund - Large Institutional
-    # ========================================
-    MERIDIAN_SUBSCRIPTION_TEXT = """SUBSCRIPTION AGREEMENT
-
-MERIDIAN PENSION FUND
-
-This Subscription Agreement is entered into as of June 1, 2024.
-
-SECTION 4. TERMS AND CONDITIONS
-
-4.1 Capital Commitment. The Limited Partner commits to contribute $500,000,000 to Mock Fund II.
-
-4.2 Management Fee. In recognition of the Limited Partner's substantial commitment, the Management Fee shall be 1.50% per annum.
-
-4.3 Governance. All material amendments require board approval from the Limited Partner."""
-
-    MERIDIAN_SIDE_LETTER_TEXT = """SIDE LETTER AGREEMENT
-
-This Side Letter Agreement is entered into as of June 15, 2024.
-
-PARTIES:
-- Meridian Pension Fund ("Limited Partner")
-- Mock Fund II GP, LLC ("General Partner")
-
-SECTION 3. FEE ARRANGEMENTS
-
-3.1 Volume Discount. As the Limited Partner's Capital Commitment equals or exceeds $500,000,000, the Management Fee shall be further reduced by 0.25%.
-
-SECTION 7. CARRIED INTEREST
-
-7.1 Standard Carry. The standard carried interest is 20% of net profits.
-
-7.2 Reduced Carry. The Carried Interest payable to the General Partner shall be reduced to 15% (from the standard 20%) of net profits."""
-
-    meridian = Investor(
-        name="Meridian Pension Fund",
-        investor_type="Pension Fund",
-        commitment_amount=500000000,  # $500M
-        currency="USD",
-        fund="Mock Fund II",
-        relationship_notes="State pension fund. Strict governance requirements.",
-        internal_notes="Largest LP in Fund II. Board approval required for all amendments."
-    )
-    db.session.add(meridian)
-    db.session.flush()
-    created["investors"] += 1
-    
-    # Meridian Subscription
-    meridian_sub = Document(
-        investor_id=meridian.id,
-        title="Meridian Pension Fund Subscription Agreement",
-        doc_type="Subscription Agreement",
-        status="Active",
-        effective_date=date(2024, 6, 1),
-        priority=derive_priority("Subscription Agreement"),
-        source_text=MERIDIAN_SUBSCRIPTION_TEXT
-    )
-    db.session.add(meridian_sub)
-    db.session.flush()
-    created["documents"] += 1
-    
-    # Meridian - Management fee
-    meridian_fee = Clause(
-        document_id=meridian_sub.id,
-        clause_type="Management Fee",
-        rate=1.5,
-        section_ref="4.2",
-        page_number=12,
-        clause_text="In recognition of the Limited Partner's substantial commitment, the Management Fee shall be 1.50% per annum.",
-        notes="Reduced fee for large commitment"
-    )
-    db.session.add(meridian_fee)
-    created["clauses"] += 1
-    
-    # Meridian Side Letter
-    meridian_sl = Document(
-        investor_id=meridian.id,
-        title="Meridian Pension Fund Side Letter",
-        doc_type="Side Letter",
-        status="Active",
-        effective_date=date(2024, 6, 15),
-        priority=derive_priority("Side Letter"),
-        source_text=MERIDIAN_SIDE_LETTER_TEXT
-    )
-    db.session.add(meridian_sl)
-    db.session.flush()
-    created["documents"] += 1
-    
-    # Meridian - Fee waiver/discount
-    meridian_waiver = Clause(
-        document_id=meridian_sl.id,
-        clause_type="Fee Waiver/Discount",
-        discount=0.25,
-        threshold="Commitment >= $500M",
-        section_ref="3.1",
-        page_number=1,
-        clause_text="As the Limited Partner's Capital Commitment equals or exceeds $500,000,000, the Management Fee shall be further reduced by 0.25%.",
-        notes="Volume discount"
-    )
-    db.session.add(meridian_waiver)
-    created["clauses"] += 1
-    
-    # Meridian - Carry terms
-    meridian_carry = Clause(
-        document_id=meridian_sl.id,
-        clause_type="Carry Terms",
-        rate=15.0,
-        section_ref="7.2",
-        page_number=5,
-        clause_text="The Carried Interest payable to the General Partner shall be reduced to 15% (from the standard 20%) of net profits.",
-        notes="Reduced carry for anchor LP"
-    )
-    db.session.add(meridian_carry)
-    created["clauses"] += 1
+    @app.route("/admin/profiles/<profile_id>/folded", methods=["GET"])
+    @admin_required
+    def get_profile_folded(profile_id):
+        """Folded stacks only, for flamegraph.pl / speedscope / inferno."""
+        profile = load_profile(current_app.config, profile_id)
+        if profile is None:
+            return jsonify({"error": "Profile not found"}), 404
+        return Response(profile[1], mimetype="text/plain")
     
-    db.session.commit()
-    return created
-
-
-def derive_priority(doc_type):
-    """Derive document priority based on type."""
-    priority_map = {
-        "Amendment": 4,
-        "Side Letter": 3,
-        "Fee Schedule": 3,
-        "Subscription Agreement": 2,
-        "PPM": 1,
-    }
-    return priority_map.get(doc_type, 1)
+    @app.route("/admin/slow-requests", methods=["GET"])
+    @admin_required
+    def slow_requests():
+        """Slowest sampled requests per route in this worker, with their SQL."""
+        return jsonify({
+            "sampleRate": current_app.config["SLOW_REQUEST_SAMPLE_RATE"],
+            "routes": current_app.extensions["slow_requests"].snapshot(),
+        })
+    
+    # Document versions
+    @app.route("/documents/<int:document_id>/versions", methods=["GET"])
+    @token_required
+    def list_document_versions(document_id):
+        Document.query.get_or_404(document_id)
+        versions = db.session.scalars(
+            select(DocumentVersion)
+            .where(DocumentVersion.document_id == document_id)
+            .order_by(DocumentVersion.version)
+        ).all()
+        return jsonify([v.to_dict() for v in versions])
+    
+    @app.route("/documents/<int:document_id>/versions", methods=["POST"])
+    @token_required
+    def create_document_version(document_id):
+        """
+        Upload an amended source text and re-extract only what changed.
+        
+        The new text is split into sections and diffed against the previous
+        version. Clauses found in unchanged sections are carried forward;
+        clauses in changed or removed sections are replaced by extracting just
+        the changed and added sections. Clauses that can't be placed are
+        replaced if a clause of their type was re-extracted, and otherwise
+        carried and listed under "unlocated". With "apply": false nothing is
+        saved.
+        """
+        document = Document.query.get_or_404(document_id)
+        data = request.get_json() or {}
+        source_text = data.get("sourceText", "")
+        use_mock = data.get("mock", False)
+        apply = data.get("apply", True)
+        
+        error = validate_extraction_text(source_text)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        previous = db.session.scalars(
+            select(DocumentVersion)
+            .where(DocumentVersion.document_id == document_id)
+            .order_by(DocumentVersion.version.desc())
+            .limit(1)
+        ).first()
+        old_text = document.source_text or ""
+        if previous is None and old_text:
+            # Documents from before versioning: their current text is version 1
+            previous = DocumentVersion(
+                document_id=document_id, version=1,
+                source_text=old_text, sections=section_index(old_text),
+            )
+            db.session.add(previous)
+        
+        plan = plan_revision(
+            old_text, previous.sections if previous else [], source_text, document.clauses,
+        )
+        extraction = {"document_info": {}, "clauses": []}
+        if plan["extract_text"].strip():
+            try:
+                if use_mock:
+                    extraction = mock_extract_clauses(plan["extract_text"])
+                else:
+                    router = current_app.extensions["provider_router"]
+                    extraction = with_mock_fallback(
+                        extract_with_prefilter(plan["extract_text"], router.extract),
+                        plan["extract_text"],
+                    )
+            except Exception as e:
+                db.session.rollback()
+                return jsonify({"error": f"Extraction failed: {str(e)}"}), 500
+        
+        settle_unlocated(plan, extraction.get("clauses", []))
+        version_number = (previous.version if previous else 0) + 1
+        stale_ids = [c.id for c in plan["stale"]]
+        created = []
+        if apply:
+            delete_clauses(stale_ids)
+            # The set-based delete bypasses the session: drop the loaded rows so
+            # new clauses flushed under reused ids don't collide with them
+            for clause in plan["stale"]:
+                db.session.expunge(clause)
+            db.session.expire(document, ["clauses"])
+            text_ids = intern_texts(c.get("clause_text") for c in extraction.get("clauses", []))
+            for clause_data in extraction.get("clauses", []):
+                clause = extracted_clause(document_id, clause_data, text_ids)
+                db.session.add(clause)
+                created.append(clause)
+            db.session.flush()
+            index_clauses([clause.id for clause in created])
+            record_changes("document", "upsert", [document_id])
+            record_changes("clause", "upsert", [clause.id for clause in created])
+            version = DocumentVersion(
+                document_id=document_id, version=version_number,
+                source_text=source_text, sections=plan["sections"],
+            )
+            db.session.add(version)
+            document.source_text = source_text
+            touch_investor(document.investor_id, document_id)
+            db.session.commit()
+            investors_changed(document.investor_id)
+        else:
+            db.session.rollback()
+        
+        return jsonify({
+            "documentId": document_id,
+            "version": version_number,
+            "applied": bool(apply),
+            "diff": plan["diff"],
+            "carriedForward": [c.id for c in plan["carried"]],
+            "unlocated": [c.id for c in plan["unlocated"]],
+            "replaced": stale_ids,
+            "created": [c.to_dict() for c in created] if apply else extraction.get("clauses", []),
+            "extraction": {
+                key: value for key, value in extraction.items() if key != "clauses"
+            },
+        }), 201 if apply else 200
 
 
 # Create app instance for Gunicorn
 app = create_app()
 
 if __name__ == "__main__":
+    # Local development server only; deployed workers expect `init-db` to have run
+    with app.app_context():
+        db.create_all()
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=True)
@@ -0,0 +1,284 @@
+"""
+ASGI Serving Mode
+
+Serves the API on an event loop so I/O-bound work doesn't hold a worker:
+- POST /extract is implemented natively: the app's provider router runs on
+  the event loop with async provider clients (same pre-filter, failover,
+  circuit breaking, hedging and rate limits as the Flask route), so a single
+  worker can keep hundreds of extraction calls in flight. The app's request
+  hooks still run around it (CORS, compression, profiling and Server-Timing)
+- every other route is handed to the Flask app through a WSGI bridge that
+  runs it on a thread pool, so CRUD stays responsive meanwhile
+
+Run with:
+    uvicorn asgi:app --port 5000
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+"""
+
+import asyncio
+import contextvars
+import io
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from app import app as flask_app, authenticate_token
+from extraction_service import (
+    extract_with_prefilter_async,
+    load_sdk,
+    mock_extract_clauses,
+    validate_extraction_text,
+    with_mock_fallback,
+)
+
+
+# Request bodies above this size are spooled to disk before the WSGI app reads them
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class WSGIBridge:
+    """
+    Run a WSGI app from ASGI on a thread pool.
+    
+    Response chunks are sent as the WSGI iterable yields them, so streaming
+    responses (e.g. server-sent events) keep working.
+    """
+
+    def __init__(self, wsgi_app, max_threads=32):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        environ = self.build_environ(scope, body)
+        await loop.run_in_executor(self.executor, self.run, environ, send, loop)
+
+    def run(self, environ, send, loop):
+        """Runs on a worker thread; hands each message back to the event loop."""
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        pending_start = []
+
+        def start_response(status, headers, exc_info=None):
+            pending_start[:] = [{
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }]
+
+        def flush_start():
+            if pending_start:
+                send_sync(pending_start.pop())
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if not chunk:
+                    continue
+                flush_start()
+                send_sync({"type": "http.response.body", "body": chunk, "more_body": True})
+            flush_start()
+            send_sync({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+            environ["wsgi.input"].close()
+
+    @staticmethod
+    def build_environ(scope, body):
+        server_name, server_port = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server_name,
+            "SERVER_PORT": str(server_port),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            # The body is fully buffered, so it can be read to EOF without a length
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for raw_name, raw_value in scope["headers"]:
+            name = raw_name.decode("latin-1").upper().replace("-", "_")
+            value = raw_value.decode("latin-1")
+            if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                key = name
+            else:
+                key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+class FlaskRequestHooks:
+    """
+    The Flask request lifecycle around a natively served request.
+    
+    before_request hooks run when it opens, after_request and teardown hooks
+    when it finishes, each on a worker thread but inside one contextvars
+    context, so the request context pushed by open() is the one finish()
+    pops. The event loop is free in between.
+    """
+
+    def __init__(self, flask_app, environ):
+        self.flask_app = flask_app
+        self.context = contextvars.copy_context()
+        self.request_context = flask_app.request_context(environ)
+
+    async def open(self):
+        """Returns a before_request hook's response, or None to go on."""
+        return await asyncio.to_thread(self.context.run, self._open)
+
+    async def finish(self, rv):
+        """Turn a view return value into the final response."""
+        return await asyncio.to_thread(self.context.run, self._finish, rv)
+
+    def _open(self):
+        self.request_context.push()
+        try:
+            rv = self.flask_app.preprocess_request()
+        except BaseException as e:
+            self.request_context.pop(e)
+            raise
+        return None if rv is None else self._finish(rv)
+
+    def _finish(self, rv):
+        error = None
+        try:
+            return self.flask_app.process_response(self.flask_app.make_response(rv))
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.request_context.pop(error)
+
+
+class AgreementTrackerASGI:
+    """ASGI entry point: async extraction, everything else via Flask."""
+
+    def __init__(self, wsgi_app, max_concurrent_extractions=256, wsgi_threads=32):
+        self.wsgi_app = wsgi_app
+        self.wsgi = WSGIBridge(wsgi_app, max_threads=wsgi_threads)
+        # Caps in-flight provider calls (the semaphore binds to the loop on first use)
+        self.extraction_slots = asyncio.Semaphore(max_concurrent_extractions)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"] == "/extract"
+        ):
+            await self.extract(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Import the provider SDKs off the event loop before traffic arrives
+                for provider in self.wsgi_app.extensions["provider_router"].async_providers:
+                    await asyncio.to_thread(load_sdk, provider)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def extract(self, scope, receive, send):
+        """Async equivalent of the Flask POST /extract route."""
+        body = await self.read_body(receive)
+        hooks = FlaskRequestHooks(self.wsgi_app, WSGIBridge.build_environ(scope, io.BytesIO(body)))
+        response = await hooks.open()
+        if response is None:
+            response = await hooks.finish(await self.extract_result(scope, body))
+        await self.send_response(send, response)
+
+    async def extract_result(self, scope, body):
+        """The route itself; returns (payload, status)."""
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+
+        auth_header = headers.get("authorization", "")
+        token = auth_header.split(" ")[1] if auth_header.startswith("Bearer ") else None
+        _, error = authenticate_token(token, self.wsgi_app.config["JWT_SECRET"])
+        if error:
+            return {"error": error}, 401
+
+        try:
+            data = self.wsgi_app.json.loads(body or b"{}")
+        except ValueError:
+            return {"error": "Invalid JSON body"}, 400
+        if not isinstance(data, dict):
+            data = {}
+
+        text = data.get("text", "")
+        error = validate_extraction_text(text)
+        if error:
+            return {"error": error}, 400
+
+        try:
+            if data.get("mock", False):
+                result = await asyncio.to_thread(mock_extract_clauses, text)
+            else:
+                router = self.wsgi_app.extensions["provider_router"]
+                async with self.extraction_slots:
+                    result = await extract_with_prefilter_async(text, router.extract_async)
+                # Fall back to mock if AI fails
+                result = with_mock_fallback(result, text)
+        except Exception as e:
+            return {"error": f"Extraction failed: {str(e)}"}, 500
+
+        return result, 200
+
+    @staticmethod
+    async def read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def send_response(send, response):
+        """Send a finished (non-streamed) Flask response."""
+        body = response.get_data()
+        response.headers["Content-Length"] = str(len(body))
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in response.headers.items()
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+app = AgreementTrackerASGI(
+    flask_app,
+    max_concurrent_extractions=flask_app.config["ASYNC_MAX_CONCURRENT_EXTRACTIONS"],
+    wsgi_threads=flask_app.config["ASYNC_WSGI_THREADS"],
+)
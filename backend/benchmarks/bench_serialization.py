@@ -0,0 +1,142 @@
+"""
+Serialization / compression benchmark.
+
+Builds a synthetic 10k-document listing (the shape GET /documents returns)
+and compares:
+- the legacy path: float()/isoformat() in to_dict, then stdlib json
+- FastJSONProvider on the standard library
+- FastJSONProvider on orjson (when installed)
+and the payload size under each available content-coding.
+
+Usage:
+    python benchmarks/bench_serialization.py [--documents 10000] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_compression import available_encodings, compress
+from serialization import ORJSON_AVAILABLE, dumps_bytes
+
+SOURCE_TEXT = (
+    "SIDE LETTER AGREEMENT\n\n"
+    "3.2 Reduced Rate. Notwithstanding Section 6.1 of the PPM, the Management Fee "
+    "payable by the Limited Partner shall be reduced to 1.75% per annum of the "
+    "Capital Commitment.\n\n"
+) * 12
+
+
+def build_listing(n_documents):
+    """Raw to_dict()-shaped documents, three clauses each."""
+    created = datetime(2024, 1, 1, 9, 30, 15, 123456)
+    documents = []
+    for i in range(n_documents):
+        effective = date(2024, 1, 1) + timedelta(days=i % 365)
+        clauses = [
+            {
+                "id": i * 3 + j,
+                "documentId": i,
+                "clauseType": clause_type,
+                "clauseText": f"Clause {j} of document {i}: the rate shall be {rate}% per annum.",
+                "rate": Decimal(rate),
+                "threshold": "Commitment >= $250M" if j == 2 else None,
+                "thresholdAmount": Decimal("250000000.00") if j == 2 else None,
+                "discount": Decimal("0.2500") if j == 2 else None,
+                "effectiveDate": effective,
+                "notes": None,
+                "pageNumber": j + 1,
+                "sectionRef": f"3.{j + 1}",
+                "createdAt": created,
+            }
+            for j, (clause_type, rate) in enumerate([
+                ("Management Fee", "1.7500"),
+                ("Carry Terms", "15.0000"),
+                ("Fee Step-Down", "0.2500"),
+            ])
+        ]
+        documents.append({
+            "id": i,
+            "investorId": i % 500,
+            "title": f"Side Letter {i}",
+            "docType": "Side Letter",
+            "status": "Active",
+            "effectiveDate": effective,
+            "supersedesId": None,
+            "priority": 3,
+            "fileName": None,
+            "fileUrl": None,
+            "sourceText": SOURCE_TEXT,
+            "createdAt": created,
+            "updatedAt": created,
+            "clauses": clauses,
+        })
+    return documents
+
+
+def legacy_convert(value):
+    """What the old to_dict() methods did eagerly for every field."""
+    if isinstance(value, dict):
+        return {k: legacy_convert(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [legacy_convert(v) for v in value]
+    if isinstance(value, Decimal):
+        return float(value) if value else None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def legacy_dumps(listing):
+    return json.dumps(legacy_convert(listing), separators=(",", ":")).encode("utf-8")
+
+
+def best_of(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    listing = build_listing(args.documents)
+    print(f"Synthetic listing: {args.documents} documents, {args.documents * 3} clauses\n")
+
+    encoders = [
+        ("legacy (to_dict conversions + json)", lambda: legacy_dumps(listing)),
+        ("FastJSONProvider (stdlib json)", lambda: dumps_bytes(listing, use_orjson=False)),
+    ]
+    if ORJSON_AVAILABLE:
+        encoders.append(("FastJSONProvider (orjson)", lambda: dumps_bytes(listing, use_orjson=True)))
+    else:
+        print("orjson not installed; skipping the orjson path\n")
+
+    print(f"{'encoder':40} {'time (ms)':>10} {'bytes':>12}")
+    payload = None
+    for name, fn in encoders:
+        elapsed, payload = best_of(fn, args.repeat)
+        print(f"{name:40} {elapsed * 1000:10.1f} {len(payload):12,}")
+
+    print(f"\n{'content-coding':40} {'time (ms)':>10} {'bytes':>12} {'ratio':>8}")
+    print(f"{'identity':40} {0:10.1f} {len(payload):12,} {1:8.1f}")
+    for encoding in available_encodings():
+        elapsed, compressed = best_of(lambda: compress(payload, encoding), args.repeat)
+        ratio = len(payload) / len(compressed)
+        print(f"{encoding:40} {elapsed * 1000:10.1f} {len(compressed):12,} {ratio:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Startup-time benchmark.
+
+Imports the app in a fresh interpreter under `python -X importtime` and
+reports the total import time plus the slowest modules by cumulative time.
+Fails (exit code 1) if the import exceeds a budget or pulls in a module that
+should only load on first use, such as the provider SDKs.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--top 15] [--budget-ms 1500]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# Modules that must not be imported at app startup
+LAZY_MODULES = ("anthropic", "openai")
+
+
+def measure(target):
+    """Run one cold import and return [(module, self_us, cumulative_us, depth)]."""
+    env = dict(os.environ, FLASK_ENV=os.environ.get("FLASK_ENV", "testing"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"Importing {target} failed")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target", default="app", help="module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="fail if the best total import time exceeds this")
+    args = parser.parse_args()
+
+    runs = [measure(args.target) for _ in range(args.runs)]
+    # The target is the last top-level entry; its cumulative time is the total
+    totals = [next(e[2] for e in reversed(run) if e[0] == args.target) for run in runs]
+    best = min(range(len(runs)), key=lambda i: totals[i])
+    entries = runs[best]
+
+    print(f"import {args.target}: best {totals[best] / 1000:.1f} ms, "
+          f"median {sorted(totals)[len(totals) // 2] / 1000:.1f} ms over {args.runs} runs\n")
+
+    print(f"{'module':50} {'self (ms)':>10} {'cumulative (ms)':>16}")
+    top_level = [e for e in entries if e[3] <= 1]
+    for module, self_us, cumulative_us, _ in sorted(top_level, key=lambda e: -e[2])[:args.top]:
+        print(f"{module:50} {self_us / 1000:10.1f} {cumulative_us / 1000:16.1f}")
+
+    failed = False
+    imported = {e[0].split(".")[0] for e in entries}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        print(f"\nFAIL: imported at startup but should load lazily: {', '.join(eager)}")
+        failed = True
+
+    if args.budget_ms is not None and totals[best] / 1000 > args.budget_ms:
+        print(f"\nFAIL: import time {totals[best] / 1000:.1f} ms exceeds budget {args.budget_ms} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Terms resolution benchmark.
+
+Compares the previous dict-per-clause resolution loop (closure sort key and
+list-membership losers) with the terms_resolution core, on synthetic
+investors with thousands of clauses.
+
+Usage:
+    python benchmarks/bench_terms_engine.py [--clauses 5000] [--types 8] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from terms_resolution import Candidate, resolve
+
+
+def legacy_resolve(rows):
+    """The resolution loop as it was inlined in calculate_effective_terms."""
+    clauses_by_type = defaultdict(list)
+    for clause_id, doc_id, clause_type, priority, effective_date, superseded_by in rows:
+        clauses_by_type[clause_type].append({
+            "clause": clause_id,
+            "document": doc_id,
+            "priority": priority,
+            "effective_date": effective_date,
+            "is_superseded": superseded_by is not None,
+            "superseded_by_doc_id": superseded_by,
+        })
+
+    results = {}
+    for clause_type, candidates in clauses_by_type.items():
+        active_candidates = [c for c in candidates if not c["is_superseded"]]
+        if not active_candidates:
+            active_candidates = candidates
+
+        def sort_key(c):
+            priority = c["priority"] or 0
+            eff_date = c["effective_date"] or date.min
+            return (-priority, -eff_date.toordinal() if eff_date != date.min else float('inf'))
+
+        sorted_candidates = sorted(active_candidates, key=sort_key)
+        winner = sorted_candidates[0]
+        losers = sorted_candidates[1:] + [
+            c for c in candidates if c["is_superseded"] and c not in sorted_candidates
+        ]
+        results[clause_type] = (winner, losers)
+    return results
+
+
+def compact_resolve(rows):
+    return resolve([
+        Candidate(clause_id, doc_id, clause_type, priority, effective_date, superseded_by=superseded_by)
+        for clause_id, doc_id, clause_type, priority, effective_date, superseded_by in rows
+    ])
+
+
+def build_rows(n_clauses, n_types, superseded_fraction, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for clause_id in range(n_clauses):
+        doc_id = clause_id // 4
+        effective = date(2020, 1, 1) + timedelta(days=rng.randrange(2000)) if rng.random() > 0.1 else None
+        superseded_by = doc_id + 1 if rng.random() < superseded_fraction else None
+        rows.append((clause_id, doc_id, f"Type {clause_id % n_types}", rng.choice([1, 2, 3, 4]),
+                     effective, superseded_by))
+    return rows
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clauses", type=int, default=5000)
+    parser.add_argument("--types", type=int, default=8)
+    parser.add_argument("--superseded", type=float, default=0.3,
+                        help="fraction of clauses on superseded documents")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'clauses':>8} {'legacy (ms)':>12} {'compact (ms)':>13} {'speedup':>8}")
+    sizes = sorted({max(args.clauses // 10, 1), args.clauses // 2, args.clauses})
+    for n in sizes:
+        rows = build_rows(n, args.types, args.superseded)
+        legacy = best_of(lambda: legacy_resolve(rows), args.repeat)
+        compact = best_of(lambda: compact_resolve(rows), args.repeat)
+        print(f"{n:8} {legacy * 1000:12.2f} {compact * 1000:13.2f} {legacy / compact:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
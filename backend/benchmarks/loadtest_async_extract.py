@@ -0,0 +1,204 @@
+"""
+Load test for the ASGI serving mode against a local stub LLM.
+
+Starts an OpenAI-compatible stub that answers every completion after a fixed
+delay, boots the API (asgi:app under uvicorn, or app:app under gunicorn's sync
+worker for comparison) with one worker, then fires N concurrent POST /extract
+calls while probing GET /investors for CRUD latency.
+
+Reports extraction throughput, the peak number of calls the stub saw in flight
+at once, and CRUD latency percentiles during the burst.
+
+Usage:
+    python benchmarks/loadtest_async_extract.py [--server asgi|wsgi]
+        [--requests 300] [--latency 2.0] [--port 5055]
+
+Requires uvicorn (asgi), gunicorn (wsgi), httpx and the openai SDK.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.stats import summarize  # noqa: E402
+
+SAMPLE_TEXT = (
+    "SIDE LETTER AGREEMENT\n\n3.2 Reduced Rate. Notwithstanding Section 6.1 of the PPM, "
+    "the Management Fee payable by the Limited Partner shall be reduced to 1.75% per annum."
+)
+
+STUB_ANSWER = {
+    "document_info": {"detected_type": "Side Letter"},
+    "clauses": [{
+        "clause_type": "Management Fee",
+        "rate": 1.75,
+        "clause_text": "the Management Fee payable by the Limited Partner shall be reduced to 1.75% per annum",
+        "confidence": 0.9,
+    }],
+}
+
+
+class StubLLM:
+    """Minimal OpenAI-compatible /v1/chat/completions server with fixed latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers.get("content-length", 0)))
+
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.latency)
+            finally:
+                self.in_flight -= 1
+            self.completed += 1
+
+            body = json.dumps({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "stub",
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": json.dumps(STUB_ANSWER)},
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+def start_server(kind, port, env):
+    if kind == "asgi":
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port),
+               "--workers", "1", "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "app:app", "-w", "1",
+               "-b", f"127.0.0.1:{port}", "--timeout", "600"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+
+async def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit("API did not start in time")
+
+
+async def run(args):
+    stub = StubLLM(args.latency)
+    stub_server = await asyncio.start_server(stub.handle, "127.0.0.1", 0, backlog=4096)
+    stub_port = stub_server.sockets[0].getsockname()[1]
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    env = {k: v for k, v in os.environ.items() if k != "ANTHROPIC_API_KEY"}
+    env.update({
+        "FLASK_ENV": "development",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        "OPENAI_API_KEY": "stub-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "ASYNC_MAX_CONCURRENT_EXTRACTIONS": str(max(args.requests, 1)),
+    })
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"],
+                   cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = start_server(args.server, args.port, env)
+    try:
+        await wait_until_up(base_url)
+        limits = httpx.Limits(max_connections=args.requests + 10)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+            login = await client.post("/auth/login", json={
+                "email": "demo@agreement-tracker.com", "password": "Demo123!",
+            })
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            done = asyncio.Event()
+            crud_latencies = []
+
+            async def probe_crud():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await client.get("/investors", headers=headers)
+                    crud_latencies.append(time.perf_counter() - start)
+                    await asyncio.sleep(0.05)
+
+            async def extract():
+                start = time.perf_counter()
+                response = await client.post("/extract", json={"text": SAMPLE_TEXT}, headers=headers)
+                ok = response.status_code == 200 and not response.json().get("ai_error")
+                return ok, time.perf_counter() - start
+
+            probe = asyncio.create_task(probe_crud())
+            started = time.perf_counter()
+            results = await asyncio.gather(*(extract() for _ in range(args.requests)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await probe
+    finally:
+        server.terminate()
+        server.wait()
+        stub_server.close()
+
+    failures = sum(1 for ok, _ in results if not ok)
+    extraction = summarize([latency for _, latency in results])
+    crud = summarize(crud_latencies)
+
+    print(f"server: {args.server}, extractions: {args.requests}, stub latency: {args.latency}s")
+    print(f"wall time: {elapsed:.2f}s, throughput: {args.requests / elapsed:.1f} req/s, failures: {failures}")
+    print(f"peak provider calls in flight: {stub.peak_in_flight}")
+    print(f"extraction latency: p50 {extraction['p50_ms']:.0f} ms, p95 {extraction['p95_ms']:.0f} ms")
+    print(f"CRUD latency during burst ({crud['count']} probes): p50 {crud['p50_ms']:.0f} ms, "
+          f"p95 {crud['p95_ms']:.0f} ms, max {crud['max_ms']:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server", choices=["asgi", "wsgi"], default="asgi")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=2.0, help="stub LLM latency (seconds)")
+    parser.add_argument("--port", type=int, default=5055)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
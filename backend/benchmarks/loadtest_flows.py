@@ -0,0 +1,278 @@
+"""
+Load test replaying the PRD's core user flows with concurrent virtual users.
+
+Flows (picked per iteration by weight, see --mix):
+- upload:   POST /documents -> POST /extract -> POST /extract/apply
+- lookup:   GET /investors/:id -> GET /documents?investorId= -> GET /investors/:id/effective-terms
+- scenario: GET /investors -> GET /investors/:id/effective-terms (the fee
+            scenario itself is computed client-side from the effective terms)
+
+By default boots the API locally (app:app under gunicorn, or asgi:app under
+uvicorn) on a fresh SQLite database seeded with synthetic investors; pass
+--base-url to target an instance that is already running. Extraction uses
+mock mode, or --extraction stub to go through the provider path against a
+local OpenAI-compatible stub with fixed latency.
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint and per
+flow, and writes them as JSON (--output) for comparing runs (--compare).
+
+Usage:
+    python benchmarks/loadtest_flows.py [--users 20] [--duration 30]
+        [--mix upload=1,lookup=6,scenario=3] [--extraction mock|stub]
+        [--server wsgi|asgi] [--workers 2] [--base-url URL] [--seed-investors N]
+        [--output results.json] [--compare previous.json]
+
+Requires httpx, plus gunicorn (wsgi) or uvicorn (asgi) when booting locally.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.loadtest_async_extract import SAMPLE_TEXT, StubLLM, wait_until_up  # noqa: E402
+from benchmarks.stats import summarize  # noqa: E402
+
+DEFAULT_MIX = "upload=1,lookup=6,scenario=3"
+
+
+def parse_mix(value):
+    weights = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Recorder:
+    """Latencies and errors per endpoint and per flow."""
+
+    def __init__(self):
+        self.endpoints = defaultdict(list)  # label -> [(seconds, ok)]
+        self.flows = defaultdict(list)
+
+    async def call(self, client, method, path, label, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.endpoints[label].append((time.perf_counter() - start, ok))
+        if not ok:
+            raise FlowError(label)
+        return response.json()
+
+    def report(self, elapsed):
+        return {
+            "endpoints": {label: _stats(samples, elapsed) for label, samples in sorted(self.endpoints.items())},
+            "flows": {name: _stats(samples, elapsed) for name, samples in sorted(self.flows.items())},
+        }
+
+
+class FlowError(Exception):
+    """A step failed; the rest of the flow is skipped."""
+
+
+def _stats(samples, elapsed):
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        **summarize([seconds for seconds, _ in samples]),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+    }
+
+
+async def upload_flow(client, recorder, rng, investor_ids, mock):
+    investor_id = rng.choice(investor_ids)
+    document = await recorder.call(client, "POST", "/documents", "POST /documents", json={
+        "investorId": investor_id,
+        "title": "Load Test Side Letter",
+        "docType": "Side Letter",
+        "effectiveDate": "2024-06-01",
+    })
+    extraction = await recorder.call(client, "POST", "/extract", "POST /extract", json={
+        "text": SAMPLE_TEXT, "mock": mock,
+    })
+    await recorder.call(client, "POST", "/extract/apply", "POST /extract/apply", json={
+        "documentId": document["id"],
+        "clauses": extraction.get("clauses", []),
+        "sourceText": SAMPLE_TEXT,
+    })
+
+
+async def lookup_flow(client, recorder, rng, investor_ids, mock):
+    investor_id = rng.choice(investor_ids)
+    await recorder.call(client, "GET", f"/investors/{investor_id}", "GET /investors/:id")
+    await recorder.call(client, "GET", "/documents", "GET /documents?investorId=",
+                        params={"investorId": investor_id})
+    await recorder.call(client, "GET", f"/investors/{investor_id}/effective-terms",
+                        "GET /investors/:id/effective-terms")
+
+
+async def scenario_flow(client, recorder, rng, investor_ids, mock):
+    investors = await recorder.call(client, "GET", "/investors", "GET /investors")
+    investor_id = rng.choice([investor["id"] for investor in investors] or investor_ids)
+    await recorder.call(client, "GET", f"/investors/{investor_id}/effective-terms",
+                        "GET /investors/:id/effective-terms")
+
+
+FLOWS = {"upload": upload_flow, "lookup": lookup_flow, "scenario": scenario_flow}
+
+
+async def virtual_user(index, client, recorder, args, investor_ids, deadline):
+    rng = random.Random(args.seed + index)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            await FLOWS[name](client, recorder, rng, investor_ids, args.extraction == "mock")
+            ok = True
+        except FlowError:
+            ok = False
+        recorder.flows[name].append((time.perf_counter() - start, ok))
+
+
+def start_server(args, env):
+    if args.server == "asgi":
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(args.port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "app:app", "-w", str(args.workers),
+               "-b", f"127.0.0.1:{args.port}", "--timeout", "600"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+
+async def run(args):
+    stub_server = None
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        env = {k: v for k, v in os.environ.items() if k not in ("ANTHROPIC_API_KEY", "OPENAI_API_KEY")}
+        env.update({
+            "FLASK_ENV": "development",
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+            "CACHE_URL": os.path.join(workdir, "cache.sqlite3"),
+        })
+        if args.extraction == "stub":
+            stub = StubLLM(args.stub_latency)
+            stub_server = await asyncio.start_server(stub.handle, "127.0.0.1", 0, backlog=4096)
+            env["OPENAI_API_KEY"] = "stub-key"
+            env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_server.sockets[0].getsockname()[1]}/v1"
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"],
+                       cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args, env)
+
+    try:
+        await wait_until_up(base_url)
+        limits = httpx.Limits(max_connections=args.users + 10)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+            login = await client.post("/auth/login", json={"email": args.email, "password": args.password})
+            client.headers["Authorization"] = f"Bearer {login.json()['token']}"
+            seed_investors = args.seed_investors
+            if seed_investors is None:
+                seed_investors = 0 if args.base_url else 200
+            if seed_investors:
+                await client.post("/demo/seed", params={"investors": seed_investors})
+            investor_ids = [investor["id"] for investor in (await client.get("/investors")).json()]
+            if not investor_ids:
+                raise SystemExit("No investors to test against (use --seed-investors)")
+
+            recorder = Recorder()
+            started = time.perf_counter()
+            deadline = time.monotonic() + args.duration
+            await asyncio.gather(*(
+                virtual_user(i, client, recorder, args, investor_ids, deadline)
+                for i in range(args.users)
+            ))
+            elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if stub_server is not None:
+            stub_server.close()
+
+    return {
+        "run": {
+            "startedAt": datetime.utcnow().isoformat(),
+            "baseUrl": base_url,
+            "server": None if args.base_url else args.server,
+            "workers": None if args.base_url else args.workers,
+            "users": args.users,
+            "durationSeconds": elapsed,
+            "mix": args.mix,
+            "extraction": args.extraction,
+        },
+        **recorder.report(elapsed),
+    }
+
+
+def print_report(results, previous=None):
+    run = results["run"]
+    print(f"{run['users']} users for {run['durationSeconds']:.1f}s against {run['baseUrl']} "
+          f"(extraction: {run['extraction']})")
+    for section in ("flows", "endpoints"):
+        print(f"\n{section:<38} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for label, stats in results[section].items():
+            line = (f"{label:<38} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>8.1f} "
+                    f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['error_rate']:>7.1%}")
+            before = (previous or {}).get(section, {}).get(label)
+            if before and before["p95_ms"]:
+                change = stats["p95_ms"] / before["p95_ms"] - 1
+                line += f"  p95 {change:+.0%} vs previous"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", help="target a running instance instead of booting one")
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--extraction", choices=["mock", "stub"], default="mock")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="stub LLM latency (seconds)")
+    parser.add_argument("--seed-investors", type=int,
+                        help="synthetic investors to seed first (default: 200 when booting locally, else 0)")
+    parser.add_argument("--seed", type=int, default=7, help="random seed for flow choices")
+    parser.add_argument("--email", default="demo@agreement-tracker.com")
+    parser.add_argument("--password", default="Demo123!")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="results JSON from an earlier run to compare p95 against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(results, previous)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Clause Similarity
+
+Finds clauses with the same or nearly the same wording across investors
+without comparing every clause with every other, using MinHash signatures
+and locality-sensitive hashing (LSH).
+
+- A clause's text is lowercased and split into word 3-gram shingles. Its
+  MinHash signature holds the minimum of NUM_PERM random hash functions over
+  those shingles; the fraction of positions where two signatures agree
+  estimates the Jaccard similarity of the two shingle sets.
+- The signature is cut into BANDS bands of ROWS_PER_BAND values, and each band
+  is hashed to a bucket stored in clause_lsh_buckets, indexed by
+  (band, bucket). Signatures sharing a bucket with the query clause's are
+  the candidates, so a lookup is BANDS index probes plus scoring of the
+  candidates, however many clauses there are. Signatures are stored once
+  per distinct wording (clause_minhashes), so a template copied into
+  thousands of side letters is one candidate, not thousands.
+
+With 16 bands of 4 rows, a pair at similarity 0.7 is a candidate with
+probability 0.99, one at 0.5 with probability 0.64 and one at 0.3 with
+probability 0.12.
+
+Write endpoints call index_clauses() for clauses they create or whose text
+they change; models.delete_clauses() drops the entries with the clauses.
+Signatures no clause uses any more stay stored (another clause may take the
+same wording again) but are not returned as candidates.
+"""
+
+import hashlib
+import random
+import re
+import struct
+
+from sqlalchemy import Select, case, exists, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    Clause, ClauseBucket, ClauseMinHash, ClauseSignature, Document, Investor, db, unindex_clauses,
+)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+INDEX_BATCH_SIZE = 1000
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: stored signatures must stay comparable across processes and restarts
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_SIGNATURE = struct.Struct(f"<{NUM_PERM}Q")
+_BAND = struct.Struct(f"<{ROWS_PER_BAND}Q")
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def shingles(text):
+    """Word 3-grams of text (lowercased; punctuation ignored)."""
+    words = _WORD.findall((text or "").lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def minhash(text):
+    """MinHash signature of text as a tuple of NUM_PERM ints, or None if it has no words."""
+    hashes = [_hash64(shingle.encode("utf-8")) % _PRIME for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def band_buckets(signature):
+    """[(band, bucket)] for a signature; buckets are signed 64-bit hashes of each band."""
+    return [
+        (band, _hash64(_BAND.pack(*signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])) - (1 << 63))
+        for band in range(BANDS)
+    ]
+
+
+def estimated_similarity(a, b):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def _minhash_ids(signatures):
+    """
+    Ids of ClauseMinHash rows for packed signatures ({digest: packed}),
+    creating the missing ones with their LSH buckets.
+    """
+    def existing():
+        return dict(db.session.execute(
+            select(ClauseMinHash.digest, ClauseMinHash.id).where(ClauseMinHash.digest.in_(list(signatures)))
+        ).all())
+
+    ids = existing()
+    for _ in range(3):
+        missing = [digest for digest in signatures if digest not in ids]
+        if not missing:
+            break
+        try:
+            # Another writer may be adding the same signatures concurrently
+            with db.session.begin_nested():
+                db.session.execute(insert(ClauseMinHash), [
+                    {"digest": digest, "signature": signatures[digest]} for digest in missing
+                ])
+        except IntegrityError:
+            ids = existing()
+            continue
+        ids = existing()
+        db.session.execute(insert(ClauseBucket), [
+            {"band": band, "bucket": bucket, "minhash_id": ids[digest]}
+            for digest in missing
+            for band, bucket in band_buckets(_SIGNATURE.unpack(signatures[digest]))
+        ])
+    return ids
+
+
+def index_clauses(clause_ids):
+    """
+    (Re)build similarity index entries for clauses. The caller commits.
+
+    `clause_ids` may be a list or a select() of ids. Clauses whose text has
+    no words get no entry. Each distinct text is hashed once per batch and
+    each distinct signature is stored once, which keeps bulk loads of
+    templated clauses cheap.
+    """
+    if not isinstance(clause_ids, Select) and not clause_ids:
+        return
+    unindex_clauses(clause_ids)
+    ids = db.session.scalars(select(Clause.id).where(Clause.id.in_(clause_ids)).order_by(Clause.id)).all()
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        batch = ids[start:start + INDEX_BATCH_SIZE]
+        rows = db.session.execute(select(Clause.id, Clause.clause_text).where(Clause.id.in_(batch))).all()
+        digests = {}  # text -> signature digest, or None
+        signatures = {}  # digest -> packed signature
+        for _, text in rows:
+            if text in digests:
+                continue
+            signature = minhash(text)
+            if signature is None:
+                digests[text] = None
+                continue
+            packed = _SIGNATURE.pack(*signature)
+            digests[text] = hashlib.blake2b(packed, digest_size=16).digest()
+            signatures[digests[text]] = packed
+        if not signatures:
+            continue
+        minhash_ids = _minhash_ids(signatures)
+        db.session.execute(insert(ClauseSignature), [
+            {"clause_id": clause_id, "minhash_id": minhash_ids[digests[text]]}
+            for clause_id, text in rows if digests[text] is not None
+        ])
+
+
+def similar_clauses(clause_id, limit=20, min_similarity=0.5):
+    """
+    Clauses worded like clause_id, most similar first.
+
+    Returns (matches, candidates): matches are dicts with the estimated
+    similarity, the clause and its document and investor; candidates is how
+    many distinct signatures still in use shared an LSH bucket and were
+    scored. The matching clauses are read in one statement.
+    """
+    packed = db.session.scalar(
+        select(ClauseMinHash.signature)
+        .join(ClauseSignature, ClauseSignature.minhash_id == ClauseMinHash.id)
+        .where(ClauseSignature.clause_id == clause_id)
+    )
+    if packed is None:
+        return [], 0
+    signature = _SIGNATURE.unpack(packed)
+    # Signatures left behind by edited or deleted clauses are skipped
+    candidates = db.session.execute(
+        select(ClauseMinHash.id, ClauseMinHash.signature).where(
+            ClauseMinHash.id.in_(
+                select(ClauseBucket.minhash_id)
+                .where(tuple_(ClauseBucket.band, ClauseBucket.bucket).in_(band_buckets(signature)))
+            ),
+            exists().where(ClauseSignature.minhash_id == ClauseMinHash.id),
+        )
+    ).all()
+    scored = sorted(
+        (
+            (score, minhash_id)
+            for minhash_id, other in candidates
+            if (score := estimated_similarity(signature, _SIGNATURE.unpack(other))) >= min_similarity
+        ),
+        key=lambda item: (-item[0], item[1]),
+    )
+    # Every signature has a clause, so limit + 1 of them (one may be only
+    # the query clause's own) are enough to find limit clauses
+    top = scored[:limit + 1]
+    if not top:
+        return [], len(candidates)
+    scores = {minhash_id: score for score, minhash_id in top}
+
+    # Pick the clauses from the (minhash_id, clause_id) index alone, most
+    # similar signatures first, then join only those rows to their details
+    rank = case({minhash_id: i for i, (_, minhash_id) in enumerate(top)}, value=ClauseSignature.minhash_id)
+    picked = (
+        select(ClauseSignature.clause_id, ClauseSignature.minhash_id, rank.label("rank"))
+        .where(ClauseSignature.minhash_id.in_(list(scores)), ClauseSignature.clause_id != clause_id)
+        .order_by(rank, ClauseSignature.clause_id)
+        .limit(limit)
+        .subquery()
+    )
+
+    rows = db.session.execute(
+        select(Clause, picked.c.minhash_id, Document.title, Investor.id, Investor.name)
+        .join(picked, picked.c.clause_id == Clause.id)
+        .join(Document, Document.id == Clause.document_id)
+        .join(Investor, Investor.id == Document.investor_id)
+        .order_by(picked.c.rank, picked.c.clause_id)
+    )
+    matches = [
+        {
+            "similarity": round(scores[minhash_id], 3),
+            "clause": clause.to_dict(),
+            "documentTitle": document_title,
+            "investorId": investor_id,
+            "investorName": investor_name,
+        }
+        for clause, minhash_id, document_title, investor_id, investor_name in rows
+    ]
+    return matches, len(candidates)
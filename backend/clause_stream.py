@@ -0,0 +1,89 @@
+"""
+Incremental Clause Parser
+
+Parses the extraction model's JSON answer while it is still being generated
+and hands back each entry of the top-level "clauses" array as soon as its
+closing brace arrives. The rest of the answer (document_info,
+extraction_notes) is parsed once the stream ends.
+
+The scanner only tracks string/escape state and bracket depth, so each
+character is looked at once. Text outside the JSON value, such as markdown
+code fences, is ignored.
+"""
+
+import json
+
+
+class ClauseStreamParser:
+    """Feed model output in chunks; collect completed clause objects."""
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None  # last string closed at depth 1
+        self._expect_array = False
+        self._array_depth = None  # depth inside the clauses array
+        self._object_start = None
+        self.clauses_done = False
+
+    def feed(self, chunk):
+        """Add text; return the clauses completed by it, in order."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._string_start is not None:
+                        self._last_key = text[self._string_start + 1:pos]
+                    self._string_start = None
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos if self._depth == 1 else None
+            elif char == ":" and self._depth == 1:
+                self._expect_array = self._last_key == "clauses" and not self.clauses_done
+            elif char in "{[":
+                if char == "[" and self._expect_array and self._depth == 1:
+                    self._array_depth = self._depth + 1
+                elif char == "{" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._object_start = pos
+                self._expect_array = False
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._array_depth is not None:
+                    if char == "}" and self._depth == self._array_depth and self._object_start is not None:
+                        clause = self._decode(text[self._object_start:pos + 1])
+                        if clause is not None:
+                            completed.append(clause)
+                        self._object_start = None
+                    elif char == "]" and self._depth == self._array_depth - 1:
+                        self._array_depth = None
+                        self.clauses_done = True
+            elif not char.isspace() and self._depth == 1:
+                # A non-array value after "clauses": (e.g. null)
+                self._expect_array = False
+
+        self._pos = len(text)
+        return completed
+
+    @staticmethod
+    def _decode(raw):
+        try:
+            clause = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        return clause if isinstance(clause, dict) else None
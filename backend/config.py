@@ -9,6 +9,65 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-key")
     
+    # Response compression (gzip always; brotli/zstd when installed)
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    
+    # Seconds between keep-alive comments on server-sent event streams
+    SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+    # Open effective-terms streams per process (0 = unlimited); more get a 503
+    SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", 16))
+    # How often each process reads the change log for other workers' writes
+    SSE_POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", 2))
+    
+    # ASGI mode (asgi.py): cap on provider calls in flight per worker
+    ASYNC_MAX_CONCURRENT_EXTRACTIONS = int(os.getenv("ASYNC_MAX_CONCURRENT_EXTRACTIONS", 256))
+    ASYNC_WSGI_THREADS = int(os.getenv("ASYNC_WSGI_THREADS", 32))
+    
+    # Extraction provider routing (provider_router.py)
+    PROVIDER_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_TIMEOUT_SECONDS", 120))
+    PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", 5))
+    PROVIDER_BREAKER_RESET_SECONDS = float(os.getenv("PROVIDER_BREAKER_RESET_SECONDS", 30))
+    # Start the next provider when the first is slower than its p95
+    EXTRACTION_HEDGE = os.getenv("EXTRACTION_HEDGE", "false").lower() == "true"
+    EXTRACTION_HEDGE_DEFAULT_DELAY = float(os.getenv("EXTRACTION_HEDGE_DEFAULT_DELAY", 5))
+    # Per-provider calls per minute shared by all workers on a host (0 = unlimited)
+    PROVIDER_RATE_LIMIT_PER_MINUTE = int(os.getenv("PROVIDER_RATE_LIMIT_PER_MINUTE", 0))
+    PROVIDER_RATE_LIMIT_BURST = int(os.getenv("PROVIDER_RATE_LIMIT_BURST", 0))
+    PROVIDER_RATE_LIMIT_DB = os.getenv("PROVIDER_RATE_LIMIT_DB")
+    
+    # Shared read cache for all workers on a host (shared_cache.py): a SQLite
+    # file path (default: in the temp directory) or redis://host:port/db
+    CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_URL = os.getenv("CACHE_URL")
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+    CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 300))
+    # Reads record an entry's access time for LRU eviction at most this often
+    CACHE_TOUCH_INTERVAL_SECONDS = int(os.getenv("CACHE_TOUCH_INTERVAL_SECONDS", 60))
+    
+    # Users allowed to use the /admin endpoints and ?profile=1 (comma-separated)
+    ADMIN_EMAILS = {e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+    
+    # Request profiling (profiling.py): where ?profile=1 captures are written,
+    # and the fraction of requests sampled into the slow-request log
+    PROFILE_DIR = os.getenv("PROFILE_DIR")
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.001))
+    SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", 0))
+    SLOW_REQUEST_TOP_N = int(os.getenv("SLOW_REQUEST_TOP_N", 10))
+    
+    # File uploads (document_files.py): streamed to UPLOAD_DIR (default: temp
+    # directory), text extracted in up to FILE_EXTRACTION_WORKERS processes at a
+    # time, each killed after FILE_EXTRACTION_TIMEOUT seconds
+    UPLOAD_DIR = os.getenv("UPLOAD_DIR")
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+    # Longest file text accepted; what reaches a provider is still sent in
+    # pieces of at most extraction_service.MAX_TEXT_LENGTH characters
+    UPLOAD_MAX_TEXT_LENGTH = int(os.getenv("UPLOAD_MAX_TEXT_LENGTH", 1000000))
+    FILE_EXTRACTION_WORKERS = int(os.getenv("FILE_EXTRACTION_WORKERS", 2))
+    FILE_EXTRACTION_TIMEOUT = float(os.getenv("FILE_EXTRACTION_TIMEOUT", 60))
+    
+    # Upper bound for POST /demo/seed?investors=N
+    DEMO_SEED_MAX_INVESTORS = int(os.getenv("DEMO_SEED_MAX_INVESTORS", 100000))
+    
     # Demo credentials
     DEMO_EMAIL = "demo@agreement-tracker.com"
     DEMO_PASSWORD = "Demo123!"
@@ -17,6 +76,7 @@ class Config:
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
+    ADMIN_EMAILS = Config.ADMIN_EMAILS | {Config.DEMO_EMAIL}
     SQLALCHEMY_DATABASE_URI = os.getenv(
         "DATABASE_URL", 
         "sqlite:///agreement_tracker.db"
@@ -40,6 +100,10 @@ class TestingConfig(Config):
     TESTING = True
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    CACHE_URL = ":memory:"
+    ADMIN_EMAILS = {Config.DEMO_EMAIL}
+    # Tests poll the change log explicitly
+    SSE_POLL_SECONDS = 0
 
 
 config = {
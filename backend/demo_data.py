@@ -0,0 +1,521 @@
+"""
+Demo Data
+
+Templates for the demo investor books and the bulk loader that writes them.
+
+POST /demo/seed (and `flask --app app seed-demo`) inserts the three template
+books as-is. With ?investors=N it generates N synthetic books from the same
+templates: varied names, commitments and effective dates, with the clause
+structure kept intact so effective-terms resolution behaves like the demo.
+
+Rows are written with Core bulk inserts and primary keys assigned up front
+from the current max ids, so documents and clauses never need a flush to
+read back a parent id. The load holds the write lock on the three tables
+until it commits, so other writers wait rather than take the same ids.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+
+from clause_similarity import index_clauses
+from models import (
+    db, Investor, Document, Clause, derive_priority, intern_texts, record_changes, sync_commitments,
+)
+
+# Rows per executemany batch
+SEED_BATCH_SIZE = 2000
+
+
+# ----------------------------------------
+# Sample document texts
+# ----------------------------------------
+
+SAMPLE_PPM_TEXT = """PRIVATE PLACEMENT MEMORANDUM
+
+MOCK FUND I, LP
+
+Confidential Private Placement Memorandum dated January 1, 2024.
+
+SECTION 6. MANAGEMENT FEE AND EXPENSES
+
+6.1 Management Fee. The Management Fee shall be 2.00% per annum of each Limited Partner's Capital Commitment during the Investment Period. Following the Investment Period, the Management Fee shall be calculated based on invested capital.
+
+6.2 Payment. The Management Fee shall be payable quarterly in advance.
+
+6.3 Expenses. The Partnership shall bear all organizational expenses and operating expenses."""
+
+
+SAMPLE_SUBSCRIPTION_TEXT = """SUBSCRIPTION AGREEMENT
+
+This Subscription Agreement is entered into by and between the undersigned investor ("Limited Partner") and Mock Fund I GP, LLC ("General Partner").
+
+SECTION 4. ACKNOWLEDGMENTS
+
+4.1 PPM Review. The Limited Partner acknowledges receipt and review of the Private Placement Memorandum.
+
+4.2 Management Fee. Limited Partner acknowledges the Management Fee as set forth in the PPM.
+
+4.3 Commitment. The Limited Partner hereby commits to contribute capital as set forth in Schedule A."""
+
+
+SAMPLE_SIDE_LETTER_TEXT = """SIDE LETTER AGREEMENT
+
+This Side Letter Agreement ("Agreement") is entered into as of February 1, 2024.
+
+PARTIES:
+- Mock Capital LP ("Limited Partner")
+- Mock Fund I GP, LLC ("General Partner")
+
+SECTION 3. MANAGEMENT FEE REDUCTION
+
+3.1 Base Fee. The standard Management Fee is 2.00% per annum as set forth in the PPM.
+
+3.2 Reduced Rate. Notwithstanding Section 6.1 of the PPM, the Management Fee payable by the Limited Partner shall be reduced to 1.75% per annum of the Capital Commitment.
+
+3.3 Fee Step-Down. Beginning on the fourth anniversary of the final closing, the Management Fee shall be further reduced by 0.25% per annum.
+
+SECTION 5. MOST FAVORED NATION
+
+5.1 MFN Rights. If the Partnership enters into a side letter with any other Limited Partner granting more favorable economic terms, the Partnership shall promptly notify the Limited Partner and offer equivalent terms."""
+
+
+ATLAS_SUBSCRIPTION_TEXT = """SUBSCRIPTION AGREEMENT
+
+ATLAS FAMILY OFFICE
+
+This Subscription Agreement is entered into as of March 1, 2024.
+
+SECTION 4. TERMS AND CONDITIONS
+
+4.1 Capital Commitment. The Limited Partner commits to contribute $75,000,000.
+
+4.2 Management Fee. The Management Fee shall be as set forth in the PPM.
+
+4.3 Investment Period. The Investment Period shall be five years from the final closing."""
+
+
+ATLAS_SIDE_LETTER_TEXT = """SIDE LETTER AGREEMENT
+
+This Side Letter Agreement is entered into as of March 15, 2024.
+
+PARTIES:
+- Atlas Family Office ("Limited Partner")
+- Mock Fund I GP, LLC ("General Partner")
+
+SECTION 4. CO-INVESTMENT RIGHTS
+
+4.1 Co-Investment. The Limited Partner shall have the right to participate in co-investment opportunities alongside the Fund on a no-fee, no-carry basis, subject to allocation procedures determined by the General Partner.
+
+SECTION 5. MOST FAVORED NATION
+
+5.1 MFN Rights. The Limited Partner shall be entitled to receive the benefit of any more favorable terms granted to other Limited Partners with respect to management fees or carried interest.
+
+SECTION 6. PREFERRED RETURN
+
+6.1 Hurdle Rate. The Limited Partner shall receive a preferred return of 8% per annum, compounded annually, before any carried interest is payable to the General Partner."""
+
+
+MERIDIAN_SUBSCRIPTION_TEXT = """SUBSCRIPTION AGREEMENT
+
+MERIDIAN PENSION FUND
+
+This Subscription Agreement is entered into as of June 1, 2024.
+
+SECTION 4. TERMS AND CONDITIONS
+
+4.1 Capital Commitment. The Limited Partner commits to contribute $500,000,000 to Mock Fund II.
+
+4.2 Management Fee. In recognition of the Limited Partner's substantial commitment, the Management Fee shall be 1.50% per annum.
+
+4.3 Governance. All material amendments require board approval from the Limited Partner."""
+
+
+MERIDIAN_SIDE_LETTER_TEXT = """SIDE LETTER AGREEMENT
+
+This Side Letter Agreement is entered into as of June 15, 2024.
+
+PARTIES:
+- Meridian Pension Fund ("Limited Partner")
+- Mock Fund II GP, LLC ("General Partner")
+
+SECTION 3. FEE ARRANGEMENTS
+
+3.1 Volume Discount. As the Limited Partner's Capital Commitment equals or exceeds $500,000,000, the Management Fee shall be further reduced by 0.25%.
+
+SECTION 7. CARRIED INTEREST
+
+7.1 Standard Carry. The standard carried interest is 20% of net profits.
+
+7.2 Reduced Carry. The Carried Interest payable to the General Partner shall be reduced to 15% (from the standard 20%) of net profits."""
+
+
+# ----------------------------------------
+# Investor books
+# ----------------------------------------
+# "names" lists the strings in titles and texts that refer to the investor,
+# longest first, so synthetic books can substitute their own name.
+
+DEMO_BOOKS = [
+    # Mock Capital LP - Demonstrates Hierarchy
+    {
+        "names": ("Mock Capital LP", "Mock Capital"),
+        "investor": {
+            "name": "Mock Capital LP",
+            "investor_type": "Limited Partner",
+            "commitment_amount": 250000000,  # $250M
+            "currency": "USD",
+            "fund": "Mock Fund I",
+            "relationship_notes": "Long-standing institutional investor. Key relationship.",
+            "internal_notes": "Negotiated favorable terms due to anchor commitment.",
+        },
+        "documents": [
+            {
+                "title": "Mock Fund I PPM",
+                "doc_type": "PPM",
+                "effective_date": date(2024, 1, 1),
+                "source_text": SAMPLE_PPM_TEXT,
+                "clauses": [
+                    {
+                        "clause_type": "Management Fee",
+                        "rate": 2.0,
+                        "section_ref": "6.1",
+                        "page_number": 42,
+                        "clause_text": "The Management Fee shall be 2.00% per annum of each Limited Partner's Capital Commitment during the Investment Period.",
+                        "notes": "Standard PPM rate",
+                    },
+                ],
+            },
+            {
+                "title": "Mock Capital Subscription Agreement",
+                "doc_type": "Subscription Agreement",
+                "effective_date": date(2024, 1, 15),
+                "source_text": SAMPLE_SUBSCRIPTION_TEXT,
+                "clauses": [
+                    {
+                        "clause_type": "Management Fee",
+                        "rate": 2.0,
+                        "section_ref": "4.2",
+                        "page_number": 8,
+                        "clause_text": "Limited Partner acknowledges the Management Fee as set forth in the PPM.",
+                        "notes": "References PPM terms",
+                    },
+                ],
+            },
+            {
+                "title": "Mock Capital Side Letter",
+                "doc_type": "Side Letter",
+                "effective_date": date(2024, 2, 1),
+                "source_text": SAMPLE_SIDE_LETTER_TEXT,
+                "clauses": [
+                    {
+                        "clause_type": "Management Fee",
+                        "rate": 1.75,
+                        "section_ref": "3.2",
+                        "page_number": 2,
+                        "clause_text": "Notwithstanding Section 6.1 of the PPM, the Management Fee payable by the Limited Partner shall be reduced to 1.75% per annum of the Capital Commitment.",
+                        "notes": "Negotiated reduction for anchor investor",
+                    },
+                    {
+                        "clause_type": "Fee Step-Down",
+                        "discount": 0.25,
+                        "threshold": "Year 4",
+                        "section_ref": "3.3",
+                        "page_number": 2,
+                        "clause_text": "Beginning on the fourth anniversary of the final closing, the Management Fee shall be further reduced by 0.25% per annum.",
+                        "notes": "Time-based reduction",
+                    },
+                    {
+                        "clause_type": "MFN (Most Favored Nation)",
+                        "section_ref": "5.1",
+                        "page_number": 3,
+                        "clause_text": "If the Partnership enters into a side letter with any other Limited Partner granting more favorable economic terms, the Partnership shall promptly notify the Limited Partner and offer equivalent terms.",
+                        "notes": "Full MFN protection",
+                    },
+                ],
+            },
+        ],
+    },
+    # Atlas Family Office - Multiple Clause Types
+    {
+        "names": ("Atlas Family Office",),
+        "investor": {
+            "name": "Atlas Family Office",
+            "investor_type": "Family Office",
+            "commitment_amount": 75000000,  # $75M
+            "currency": "USD",
+            "fund": "Mock Fund I",
+            "relationship_notes": "Multi-generational family office. Focus on alternative investments.",
+            "internal_notes": "Interested in co-investment opportunities.",
+        },
+        "documents": [
+            {
+                "title": "Atlas Family Office Subscription Agreement",
+                "doc_type": "Subscription Agreement",
+                "effective_date": date(2024, 3, 1),
+                "source_text": ATLAS_SUBSCRIPTION_TEXT,
+                "clauses": [
+                    {
+                        "clause_type": "Management Fee",
+                        "rate": 2.0,
+                        "section_ref": "4.2",
+                        "page_number": 8,
+                        "clause_text": "The Management Fee shall be as set forth in the PPM.",
+                        "notes": "Standard terms",
+                    },
+                ],
+            },
+            {
+                "title": "Atlas Family Office Side Letter",
+                "doc_type": "Side Letter",
+                "effective_date": date(2024, 3, 15),
+                "source_text": ATLAS_SIDE_LETTER_TEXT,
+                "clauses": [
+                    {
+                        "clause_type": "Co-investment Rights",
+                        "section_ref": "4.1",
+                        "page_number": 2,
+                        "clause_text": "The Limited Partner shall have the right to participate in co-investment opportunities alongside the Fund on a no-fee, no-carry basis, subject to allocation procedures determined by the General Partner.",
+                        "notes": "Priority co-investment rights",
+                    },
+                    {
+                        "clause_type": "MFN (Most Favored Nation)",
+                        "section_ref": "5.1",
+                        "page_number": 3,
+                        "clause_text": "The Limited Partner shall be entitled to receive the benefit of any more favorable terms granted to other Limited Partners with respect to management fees or carried interest.",
+                        "notes": "Economic MFN only",
+                    },
+                    {
+                        "clause_type": "Preferred Return",
+                        "rate": 8.0,
+                        "section_ref": "6.1",
+                        "page_number": 4,
+                        "clause_text": "The Limited Partner shall receive a preferred return of 8% per annum, compounded annually, before any carried interest is payable to the General Partner.",
+                        "notes": "Standard hurdle rate",
+                    },
+                ],
+            },
+        ],
+    },
+    # Meridian Pension Fund - Large Institutional
+    {
+        "names": ("Meridian Pension Fund",),
+        "investor": {
+            "name": "Meridian Pension Fund",
+            "investor_type": "Pension Fund",
+            "commitment_amount": 500000000,  # $500M
+            "currency": "USD",
+            "fund": "Mock Fund II",
+            "relationship_notes": "State pension fund. Strict governance requirements.",
+            "internal_notes": "Largest LP in Fund II. Board approval required for all amendments.",
+        },
+        "documents": [
+            {
+                "title": "Meridian Pension Fund Subscription Agreement",
+                "doc_type": "Subscription Agreement",
+                "effective_date": date(2024, 6, 1),
+                "source_text": MERIDIAN_SUBSCRIPTION_TEXT,
+                "clauses": [
+                    {
+                        "clause_type": "Management Fee",
+                        "rate": 1.5,
+                        "section_ref": "4.2",
+                        "page_number": 12,
+                        "clause_text": "In recognition of the Limited Partner's substantial commitment, the Management Fee shall be 1.50% per annum.",
+                        "notes": "Reduced fee for large commitment",
+                    },
+                ],
+            },
+            {
+                "title": "Meridian Pension Fund Side Letter",
+                "doc_type": "Side Letter",
+                "effective_date": date(2024, 6, 15),
+                "source_text": MERIDIAN_SIDE_LETTER_TEXT,
+                "clauses": [
+                    {
+                        "clause_type": "Fee Waiver/Discount",
+                        "discount": 0.25,
+                        "threshold": "Commitment >= $500M",
+                        "section_ref": "3.1",
+                        "page_number": 1,
+                        "clause_text": "As the Limited Partner's Capital Commitment equals or exceeds $500,000,000, the Management Fee shall be further reduced by 0.25%.",
+                        "notes": "Volume discount",
+                    },
+                    {
+                        "clause_type": "Carry Terms",
+                        "rate": 15.0,
+                        "section_ref": "7.2",
+                        "page_number": 5,
+                        "clause_text": "The Carried Interest payable to the General Partner shall be reduced to 15% (from the standard 20%) of net profits.",
+                        "notes": "Reduced carry for anchor LP",
+                    },
+                ],
+            },
+        ],
+    },
+]
+
+
+# ----------------------------------------
+# Synthetic books
+# ----------------------------------------
+
+NAME_PREFIXES = (
+    "Harbor", "Summit", "Cedar", "Northgate", "Bluewater", "Granite",
+    "Evergreen", "Lakeshore", "Ironwood", "Silverline", "Redwood", "Keystone",
+)
+
+NAME_SUFFIXES = {
+    "Limited Partner": "Capital LP",
+    "Family Office": "Family Office",
+    "Pension Fund": "Pension Fund",
+}
+
+
+def _rename(value, names, new_name):
+    for old in names:
+        value = value.replace(old, new_name).replace(old.upper(), new_name.upper())
+    return value
+
+
+def synthetic_books(n_investors, seed=7):
+    """
+    Yield n_investors books cycling through DEMO_BOOKS.
+    
+    Each copy gets a unique name, a commitment scaled from the template and
+    effective dates shifted together (so document order, and therefore which
+    term wins, is preserved). Deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    for number in range(1, n_investors + 1):
+        template = DEMO_BOOKS[(number - 1) % len(DEMO_BOOKS)]
+        investor = dict(template["investor"])
+        suffix = NAME_SUFFIXES.get(investor["investor_type"], "Capital")
+        new_name = f"{rng.choice(NAME_PREFIXES)} {suffix} {number}"
+        investor["name"] = new_name
+        investor["commitment_amount"] = int(round(investor["commitment_amount"] * rng.uniform(0.2, 2.0), -6))
+
+        shift = timedelta(days=rng.randrange(0, 730))
+        documents = []
+        for doc in template["documents"]:
+            doc = dict(doc)
+            doc["title"] = _rename(doc["title"], template["names"], new_name)
+            doc["source_text"] = _rename(doc["source_text"], template["names"], new_name)
+            doc["effective_date"] = doc["effective_date"] + shift
+            documents.append(doc)
+        yield {"investor": investor, "documents": documents}
+
+
+# ----------------------------------------
+# Bulk loader
+# ----------------------------------------
+
+def _lock_tables():
+    """Keep other writers out of the tables until the caller commits."""
+    if db.session.get_bind().dialect.name == "postgresql":
+        db.session.execute(text("LOCK TABLE investors, documents, clauses IN SHARE ROW EXCLUSIVE MODE"))
+    else:
+        # SQLite allows one writer at a time; an empty write takes the lock now
+        db.session.execute(text("DELETE FROM investors WHERE 0"))
+
+
+def _next_id(model):
+    return (db.session.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def _insert_rows(rows):
+    # Clause text goes in as a reference to its interned row
+    text_ids = intern_texts(row.get("clause_text") for row in rows[Clause])
+    for row in rows[Clause]:
+        row["text_id"] = text_ids.get(row.pop("clause_text", None))
+    # Parents first so foreign keys resolve
+    for model in (Investor, Document, Clause):
+        if rows[model]:
+            db.session.execute(insert(model), rows[model])
+            rows[model] = []
+
+
+def _sync_sequences():
+    """Keys were assigned explicitly; move Postgres serial sequences past them."""
+    if db.session.get_bind().dialect.name != "postgresql":
+        return
+    for table in ("investors", "documents", "clauses"):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        ))
+
+
+def insert_books(books, batch_size=SEED_BATCH_SIZE):
+    """
+    Bulk insert investor books. Returns created counts; the caller commits.
+    
+    Ids are preassigned from the current max id of each table, read after
+    taking the tables' write lock, so every id from there on is this load's.
+    """
+    created = {"investors": 0, "documents": 0, "clauses": 0}
+    _lock_tables()
+    next_ids = {model: _next_id(model) for model in (Investor, Document, Clause)}
+    first_investor_id = next_ids[Investor]
+    first_document_id = next_ids[Document]
+    first_clause_id = next_ids[Clause]
+    rows = {Investor: [], Document: [], Clause: []}
+    now = datetime.utcnow()
+
+    for book in books:
+        investor_id = next_ids[Investor]
+        next_ids[Investor] += 1
+        rows[Investor].append({**book["investor"], "id": investor_id, "created_at": now, "updated_at": now})
+        created["investors"] += 1
+
+        for doc in book["documents"]:
+            document_id = next_ids[Document]
+            next_ids[Document] += 1
+            fields = {key: value for key, value in doc.items() if key != "clauses"}
+            rows[Document].append({
+                **fields,
+                "id": document_id,
+                "investor_id": investor_id,
+                "status": "Active",
+                "priority": derive_priority(doc["doc_type"]),
+                "created_at": now,
+                "updated_at": now,
+            })
+            created["documents"] += 1
+
+            for clause in doc["clauses"]:
+                rows[Clause].append({
+                    **clause,
+                    "id": next_ids[Clause],
+                    "document_id": document_id,
+                    "created_at": now,
+                })
+                next_ids[Clause] += 1
+                created["clauses"] += 1
+
+        if len(rows[Clause]) >= batch_size:
+            _insert_rows(rows)
+
+    _insert_rows(rows)
+    _sync_sequences()
+    sync_commitments(select(Investor.id).where(Investor.id >= first_investor_id))
+    index_clauses(select(Clause.id).where(Clause.id >= first_clause_id))
+    record_changes("investor", "upsert", select(Investor.id).where(Investor.id >= first_investor_id))
+    record_changes("document", "upsert", select(Document.id).where(Document.id >= first_document_id))
+    record_changes("clause", "upsert", select(Clause.id).where(Clause.id >= first_clause_id))
+    return created
+
+
+def seed_demo_investors():
+    """Create the three demo investors with documents and clauses."""
+    created = insert_books(DEMO_BOOKS)
+    db.session.commit()
+    return created
+
+
+def seed_synthetic_investors(n_investors, seed=7):
+    """Create n_investors synthetic investor books."""
+    created = insert_books(synthetic_books(n_investors, seed))
+    db.session.commit()
+    return created
@@ -0,0 +1,260 @@
+"""
+Document Files
+
+Uploaded agreement files: streamed to local disk as they arrive, then
+converted to text with page boundaries in a separate process.
+
+- Streaming: the multipart body is parsed with a stream factory that writes
+  each file part straight to UPLOAD_DIR, so an upload is never held whole in
+  memory. MAX_UPLOAD_BYTES caps the whole request body, however many parts
+  it has; plain form fields are held in memory and capped at
+  MAX_FORM_FIELD_BYTES each, with at most MAX_FORM_PARTS parts.
+- Text extraction runs in a child process per file, at most
+  FILE_EXTRACTION_WORKERS at a time, keeping PDF parsing off the request
+  thread and outside the worker's GIL. A conversion still running after
+  FILE_EXTRACTION_TIMEOUT is killed, so a slow or hostile file can't hold a
+  slot.
+  Pages come back as character ranges of the text, so a clause quoted from
+  the text can be given its page number.
+
+Supported: .pdf (needs the optional pypdf package), .docx (read with the
+standard library; pages are split at explicit and last-rendered page
+breaks) and .txt (pages split at form feeds).
+
+This module only uses the standard library at import time: conversions
+start their processes with "spawn" and they import it fresh.
+"""
+
+import bisect
+import importlib
+import importlib.util
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+import zipfile
+from xml.etree import ElementTree
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+PYPDF_AVAILABLE = importlib.util.find_spec("pypdf") is not None
+
+FILE_KINDS = {".pdf": "pdf", ".docx": "docx", ".txt": "txt"}
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Limits on the non-file parts of an upload request (only "mock" is expected).
+# werkzeug also applies the field limit to its parse buffer, which reads 64 KB
+# at a time, so it must stay well above that (500 KB is Flask's default)
+MAX_FORM_FIELD_BYTES = 500 * 1024
+MAX_FORM_PARTS = 16
+
+# Characters of clause_text tried when the full quote isn't found verbatim
+CLAUSE_PREFIX_CHARS = 60
+
+
+def file_kind(filename):
+    """"pdf", "docx" or "txt" from a file name, or None if unsupported."""
+    return FILE_KINDS.get(os.path.splitext(filename or "")[1].lower())
+
+
+# ----------------------------------------
+# Streaming upload
+# ----------------------------------------
+
+class UploadFile:
+    """Write target for one multipart file part, capped at max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.name = os.path.join(directory, uuid.uuid4().hex)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._file = open(self.name, "w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"File is larger than {self.max_bytes} bytes")
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        # seek, read, flush, close... as werkzeug's FileStorage expects
+        return getattr(self._file, name)
+
+
+def upload_stream_factory(directory, max_bytes, created):
+    """
+    A werkzeug stream_factory writing file parts to directory.
+
+    Every UploadFile made is appended to created, so the caller can remove
+    them even if parsing fails part-way.
+    """
+    def factory(total_content_length, content_type, filename, content_length=None):
+        upload = UploadFile(directory, max_bytes)
+        created.append(upload)
+        return upload
+    return factory
+
+
+def upload_limits(config):
+    """parse_form_data() keyword arguments bounding a whole upload request."""
+    return {
+        "max_content_length": config["MAX_UPLOAD_BYTES"] or None,
+        "max_form_memory_size": MAX_FORM_FIELD_BYTES,
+        "max_form_parts": MAX_FORM_PARTS,
+    }
+
+
+def upload_dir(config):
+    return config.get("UPLOAD_DIR") or os.path.join(tempfile.gettempdir(), "agreementtracker-uploads")
+
+
+def remove_uploads(uploads):
+    for upload in uploads:
+        try:
+            upload.close()
+            os.remove(upload.name)
+        except OSError:
+            pass
+
+
+# ----------------------------------------
+# Text extraction (runs in the pool's processes)
+# ----------------------------------------
+
+def _join_pages(page_texts):
+    """Concatenate page texts; returns (text, [{page, start, end}])."""
+    parts, pages, offset = [], [], 0
+    for number, page_text in enumerate(page_texts, start=1):
+        page_text = page_text.strip("\n")
+        if parts:
+            parts.append("\n\n")
+            offset += 2
+        parts.append(page_text)
+        pages.append({"page": number, "start": offset, "end": offset + len(page_text)})
+        offset += len(page_text)
+    return "".join(parts), pages
+
+
+def _pdf_pages(path):
+    if not PYPDF_AVAILABLE:
+        raise RuntimeError("PDF support needs the pypdf package")
+    reader = importlib.import_module("pypdf").PdfReader(path)
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def _docx_pages(path):
+    pages, current, paragraph = [], [], []
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == WORD_NS + "lastRenderedPageBreak" and (current or paragraph):
+                    current.append("".join(paragraph))
+                    pages.append("\n".join(current))
+                    current, paragraph = [], []
+                continue
+            if tag == WORD_NS + "t":
+                paragraph.append(element.text or "")
+            elif tag == WORD_NS + "tab":
+                paragraph.append("\t")
+            elif tag == WORD_NS + "br":
+                if element.get(WORD_NS + "type") == "page":
+                    current.append("".join(paragraph))
+                    pages.append("\n".join(current))
+                    current, paragraph = [], []
+                else:
+                    paragraph.append("\n")
+            elif tag == WORD_NS + "p":
+                current.append("".join(paragraph))
+                paragraph = []
+                element.clear()
+    if paragraph:
+        current.append("".join(paragraph))
+    if current or not pages:
+        pages.append("\n".join(current))
+    return pages
+
+
+def _txt_pages(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read().split("\f")
+
+
+PAGE_READERS = {"pdf": _pdf_pages, "docx": _docx_pages, "txt": _txt_pages}
+
+
+def extract_file_text(path, kind):
+    """Text of a file plus its page ranges: {"text", "pages": [{page, start, end}]}."""
+    text, pages = _join_pages(PAGE_READERS[kind](path))
+    return {"text": text, "pages": pages}
+
+
+# ----------------------------------------
+# Extraction processes and page numbers
+# ----------------------------------------
+
+def _extract_to_pipe(conn, path, kind):
+    """Child process body: send ("ok", result) or ("error", message) back."""
+    try:
+        conn.send(("ok", extract_file_text(path, kind)))
+    except Exception as e:
+        conn.send(("error", str(e) or type(e).__name__))
+    finally:
+        conn.close()
+
+
+class TextExtractor:
+    """Runs extract_file_text() in killable child processes, `workers` at a time."""
+
+    def __init__(self, workers=2, timeout=60.0):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers)
+        self._context = multiprocessing.get_context("spawn")
+
+    def extract(self, path, kind):
+        """Text and page ranges of a file; raises on failure or after the timeout."""
+        with self._slots:
+            receiver, sender = self._context.Pipe(duplex=False)
+            process = self._context.Process(target=_extract_to_pipe, args=(sender, path, kind), daemon=True)
+            process.start()
+            sender.close()
+            try:
+                if not receiver.poll(self.timeout):
+                    raise TimeoutError(f"text extraction took longer than {self.timeout:g}s")
+                status, value = receiver.recv()
+            except EOFError:
+                raise RuntimeError("text extraction process exited unexpectedly") from None
+            finally:
+                receiver.close()
+                if process.is_alive():
+                    process.kill()
+                process.join()
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+
+def page_for_offset(pages, offset):
+    """Page number containing a character offset of the joined text."""
+    starts = [page["start"] for page in pages]
+    index = bisect.bisect_right(starts, offset) - 1
+    return pages[index]["page"] if index >= 0 else None
+
+
+def assign_page_numbers(clauses, text, pages):
+    """Fill page_number on extracted clauses whose clause_text is found in text."""
+    if not pages:
+        return clauses
+    for clause in clauses:
+        quote = (clause.get("clause_text") or "").strip()
+        if clause.get("page_number") or not quote:
+            continue
+        offset = text.find(quote)
+        if offset < 0 and len(quote) > CLAUSE_PREFIX_CHARS:
+            offset = text.find(quote[:CLAUSE_PREFIX_CHARS])
+        if offset >= 0:
+            clause["page_number"] = page_for_offset(pages, offset)
+    return clauses
@@ -0,0 +1,170 @@
+"""
+Document Versions
+
+Section-level structure of a document's source text and diffs between
+versions, so that an amended document only has its changed sections
+re-extracted.
+
+A section is keyed by its heading (the first line, whitespace-collapsed,
+with "#2", "#3"... for repeated headings) and fingerprinted by a hash of its
+normalized text. Sections are split the same way as the extraction
+pre-filter (extraction_service.split_sections).
+
+Existing clauses are mapped to sections by finding their clause_text in the
+previous version, or else by their section_ref against the section headings.
+Clauses in unchanged sections are carried forward; those in changed or
+removed sections are replaced by the re-extraction. A clause that can't be
+located is replaced when the re-extraction produced a clause of its type,
+and otherwise kept and reported as unlocated for review.
+"""
+
+import hashlib
+import re
+
+from extraction_service import split_sections
+
+# Characters of clause_text tried when the full quote isn't found verbatim
+CLAUSE_PREFIX_CHARS = 60
+
+
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def section_index(text):
+    """[{key, heading, start, end, hash}] for every section of text."""
+    sections = []
+    seen = {}
+    for start, end in split_sections(text or ""):
+        body = text[start:end]
+        if not body.strip():
+            continue
+        heading = _normalize(body.strip().splitlines()[0])[:200]
+        seen[heading] = seen.get(heading, 0) + 1
+        key = heading if seen[heading] == 1 else f"{heading}#{seen[heading]}"
+        sections.append({
+            "key": key,
+            "heading": heading,
+            "start": start,
+            "end": end,
+            "hash": hashlib.sha1(_normalize(body).encode("utf-8")).hexdigest(),
+        })
+    return sections
+
+
+def diff_sections(old_sections, new_sections):
+    """
+    Compare two section indexes.
+
+    Returns {"unchanged", "changed", "added", "removed"}, each a list of
+    section keys (new keys, except for removed). A section whose text moved
+    under a different heading counts as unchanged.
+    """
+    old_by_key = {section["key"]: section for section in old_sections}
+    old_hashes = {section["hash"] for section in old_sections}
+    diff = {"unchanged": [], "changed": [], "added": [], "removed": []}
+    matched_old = set()
+
+    for section in new_sections:
+        old = old_by_key.get(section["key"])
+        if old is not None and old["hash"] == section["hash"]:
+            diff["unchanged"].append(section["key"])
+            matched_old.add(old["key"])
+        elif section["hash"] in old_hashes:
+            diff["unchanged"].append(section["key"])
+            matched_old.update(o["key"] for o in old_sections if o["hash"] == section["hash"])
+        elif old is not None:
+            diff["changed"].append(section["key"])
+            matched_old.add(old["key"])
+        else:
+            diff["added"].append(section["key"])
+
+    diff["removed"] = [s["key"] for s in old_sections if s["key"] not in matched_old]
+    return diff
+
+
+def locate_clause(clause_text, text, sections, section_ref=None):
+    """
+    Key of the section of text containing clause_text, or None.
+
+    When the text isn't found, a section_ref such as "Section 2" picks the
+    section whose heading starts with it.
+    """
+    offset = -1
+    if clause_text and text:
+        quote = clause_text.strip()
+        offset = text.find(quote)
+        if offset < 0 and len(quote) > CLAUSE_PREFIX_CHARS:
+            offset = text.find(quote[:CLAUSE_PREFIX_CHARS])
+    if offset >= 0:
+        for section in sections:
+            if section["start"] <= offset < section["end"]:
+                return section["key"]
+        return None
+    if section_ref and section_ref.strip():
+        # "Section 2" matches "SECTION 2. CARRIED INTEREST" but not "SECTION 21"
+        pattern = re.compile(re.escape(_normalize(section_ref)) + r"(?![0-9a-z])", re.IGNORECASE)
+        for section in sections:
+            if pattern.match(section["heading"]):
+                return section["key"]
+    return None
+
+
+def changed_text(text, sections, keys):
+    """Concatenate the sections with the given keys, in document order."""
+    wanted = set(keys)
+    return "\n\n".join(
+        text[section["start"]:section["end"]].strip()
+        for section in sections if section["key"] in wanted
+    )
+
+
+def plan_revision(old_text, old_sections, new_text, clauses):
+    """
+    Work out what an amendment needs.
+
+    clauses are the document's current Clause rows. Returns a dict with the
+    new section index, the diff, clauses to carry forward, stale clauses to
+    replace, and the text of the sections to re-extract.
+    """
+    new_sections = section_index(new_text)
+    diff = diff_sections(old_sections, new_sections)
+    replaced = set(diff["changed"]) | set(diff["removed"])
+
+    carried, stale, unlocated = [], [], []
+    for clause in clauses:
+        key = locate_clause(clause.clause_text, old_text, old_sections, clause.section_ref)
+        if key is None:
+            unlocated.append(clause)
+            carried.append(clause)
+        elif key in replaced:
+            stale.append(clause)
+        else:
+            carried.append(clause)
+
+    return {
+        "sections": new_sections,
+        "diff": diff,
+        "carried": carried,
+        "stale": stale,
+        "unlocated": unlocated,
+        "extract_text": changed_text(new_text, new_sections, diff["changed"] + diff["added"]),
+    }
+
+
+def settle_unlocated(plan, extracted_clauses):
+    """
+    Decide the clauses plan_revision() couldn't place, given the clauses
+    extracted from the changed and added sections.
+
+    An unlocated clause whose clause type was re-extracted is moved from
+    carried to stale, so the new version doesn't hold it next to its
+    replacement. The rest stay carried and in plan["unlocated"].
+    """
+    extracted_types = {clause.get("clause_type") for clause in extracted_clauses}
+    replaced = [clause for clause in plan["unlocated"] if clause.clause_type in extracted_types]
+    for clause in replaced:
+        plan["unlocated"].remove(clause)
+        plan["carried"].remove(clause)
+        plan["stale"].append(clause)
+    return plan
@@ -5,26 +5,37 @@ Uses Claude/OpenAI to extract clause information from legal document text.
 """
 
 import os
+import functools
 import json
 import re
-from typing import Optional
+import importlib
+import importlib.util
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 from dotenv import load_dotenv
+from clause_stream import ClauseStreamParser
 
 # Ensure environment variables are loaded
 load_dotenv()
 
-# Try to import anthropic, fall back to openai
-try:
-    import anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
+# Provider SDKs are heavy to import, so they are loaded on first use
+# rather than when this module (and therefore the app) is imported.
+_sdk_modules = {}
 
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+
+def load_sdk(name: str):
+    """Import a provider SDK ("anthropic" or "openai") on first use."""
+    if name not in _sdk_modules:
+        _sdk_modules[name] = importlib.import_module(name)
+    return _sdk_modules[name]
+
+
+def sdk_available(name: str) -> bool:
+    """Check whether a provider SDK is installed without importing it."""
+    return name in _sdk_modules or importlib.util.find_spec(name) is not None
 
 
 EXTRACTION_PROMPT = """You are a legal document analyst specializing in private equity fund agreements. 
@@ -89,25 +100,283 @@ Document text to analyze:
 """
 
 
-def extract_clauses_with_anthropic(text: str, api_key: str) -> dict:
-    """Extract clauses using Anthropic Claude API."""
-    client = anthropic.Anthropic(api_key=api_key)
+# Simple pattern matching for common clauses (mock extraction and pre-filter scoring)
+CLAUSE_PATTERNS = [
+    {
+        "type": "Management Fee",
+        "pattern": r"[Mm]anagement [Ff]ee[s]?\s*(?:shall be|of|:)?\s*(\d+\.?\d*)\s*%",
+        "field": "rate"
+    },
+    {
+        "type": "Preferred Return",
+        "pattern": r"[Pp]referred [Rr]eturn[s]?\s*(?:of|:)?\s*(\d+\.?\d*)\s*%",
+        "field": "rate"
+    },
+    {
+        "type": "Carry Terms",
+        "pattern": r"[Cc]arried [Ii]nterest\s*(?:of|:)?\s*(\d+\.?\d*)\s*%",
+        "field": "rate"
+    },
+    {
+        "type": "Fee Step-Down",
+        "pattern": r"(?:reduced|step.?down)\s*(?:by|of)?\s*(\d+\.?\d*)\s*%",
+        "field": "discount"
+    },
+]
+
+MFN_PATTERN = r"[Mm]ost [Ff]avored [Nn]ation|MFN"
+COINVEST_PATTERN = r"[Cc]o.?[Ii]nvestment"
+
+
+MAX_TEXT_LENGTH = 100000
+MIN_TEXT_LENGTH = 50
+# Provider calls in flight for one document sent in pieces (extract_in_chunks)
+EXTRACTION_CHUNK_WORKERS = 4
+
+
+def validate_extraction_text(text: str, max_length: int = MAX_TEXT_LENGTH) -> Optional[str]:
+    """Return an error message if the text can't be sent for extraction."""
+    if not text or len(text.strip()) < MIN_TEXT_LENGTH:
+        return "Document text is too short (minimum 50 characters)"
+    if len(text) > max_length:
+        return f"Document text is too long (maximum {max_length:,} characters)"
+    return None
+
+
+# ----------------------------------------
+# Pre-filter: send the model only the sections likely to hold clauses
+# ----------------------------------------
+# Sections are split at headings ("SECTION 6. MANAGEMENT FEE", "ARTICLE IV",
+# all-caps lines) or, failing that, at blank lines, then scored with the
+# same patterns mock extraction uses. The preamble is always kept so the
+# model can still detect document type, investor and fund. Excerpts carry
+# their character offsets in the original text.
+
+PREFILTER_ENABLED = os.environ.get("EXTRACTION_PREFILTER", "true").lower() != "false"
+
+# Keywords that make a section worth sending even without a matching value
+SECTION_KEYWORDS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r"management fee",
+        r"carried interest|\bcarry\b",
+        MFN_PATTERN,
+        COINVEST_PATTERN,
+        r"step.?down",
+        r"preferred return|hurdle",
+        r"fee waiver|discount|rebate|fee offset",
+    )
+]
+
+HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:(?:SECTION|Section|ARTICLE|Article)\s+[\dIVXLC]+\b.*|[A-Z][A-Z0-9 ,&'()\-./]{3,80})[ \t]*$",
+    re.MULTILINE,
+)
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+
+PREAMBLE_CHARS = 1500
+# Send the whole document unless the selection is at least this much smaller
+PREFILTER_MIN_SAVING = 0.2
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_sections(text: str) -> list:
+    """(start, end) offsets of each section, covering the whole text."""
+    starts = [m.start() for m in HEADING_PATTERN.finditer(text)]
+    if not starts:
+        starts = [m.end() for m in PARAGRAPH_BREAK.finditer(text)]
+    starts = sorted({0, *starts})
+    return list(zip(starts, starts[1:] + [len(text)]))
+
+
+def score_section(section: str) -> int:
+    """Clause values count three times as much as bare keywords."""
+    values = sum(len(re.findall(p["pattern"], section, re.IGNORECASE)) for p in CLAUSE_PATTERNS)
+    keywords = sum(1 for pattern in SECTION_KEYWORDS if pattern.search(section))
+    return 3 * values + keywords
+
+
+def prefilter_text(text: str) -> dict:
+    """
+    Pick the sections worth sending. Returns the text to send plus a report:
+    filtered, sections ([{start, end, score}]), and token estimates.
     
-    message = client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": EXTRACTION_PROMPT + text
-            }
+    Falls back to the whole document when nothing scores or the saving
+    would be small.
+    """
+    ranges = []
+    scored = []
+    for start, end in split_sections(text):
+        score = score_section(text[start:end])
+        if score:
+            ranges.append([start, end])
+            scored.append({"start": start, "end": end, "score": score})
+    
+    if scored:
+        ranges.append([0, min(PREAMBLE_CHARS, len(text))])
+        ranges.sort()
+        merged = [ranges[0]]
+        for start, end in ranges[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        excerpts = [
+            f"[excerpt {start}-{end}]\n{text[start:end].strip()}" for start, end in merged
         ]
-    )
+        selected = (
+            "Excerpts of the document selected for clause content; "
+            "[excerpt start-end] gives each excerpt's character offsets in the original.\n\n"
+            + "\n\n".join(excerpts)
+        )
     
-    # Parse the response
-    response_text = message.content[0].text
+    original_tokens = estimate_tokens(text)
+    if not scored or len(selected) > len(text) * (1 - PREFILTER_MIN_SAVING):
+        return {
+            "text": text, "filtered": False, "sections": scored,
+            "originalTokens": original_tokens, "sentTokens": original_tokens, "tokensSaved": 0,
+        }
     
-    # Try to extract JSON from the response
+    sent_tokens = estimate_tokens(selected)
+    return {
+        "text": selected, "filtered": True, "sections": scored,
+        "originalTokens": original_tokens, "sentTokens": sent_tokens,
+        "tokensSaved": original_tokens - sent_tokens,
+    }
+
+
+def select_extraction_text(text: str) -> tuple:
+    """Apply the pre-filter if enabled. Returns (selection, filter_ms)."""
+    start = time.perf_counter()
+    if PREFILTER_ENABLED:
+        selection = prefilter_text(text)
+    else:
+        tokens = estimate_tokens(text)
+        selection = {
+            "text": text, "filtered": False, "sections": [],
+            "originalTokens": tokens, "sentTokens": tokens, "tokensSaved": 0,
+        }
+    return selection, (time.perf_counter() - start) * 1000
+
+
+class ExtractionMetrics:
+    """
+    Recent per-document extraction metrics: prompt tokens sent and saved,
+    pre-filter and provider time, and an estimate of provider time saved.
+    
+    The estimate multiplies tokens saved by the provider milliseconds per
+    prompt token observed so far.
+    """
+    
+    def __init__(self, window=500):
+        self._entries = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._provider_ms = 0.0
+        self._sent_tokens = 0
+    
+    def record(self, selection: dict, filter_ms: float, provider_ms: float, provider=None) -> dict:
+        with self._lock:
+            ms_per_token = self._provider_ms / self._sent_tokens if self._sent_tokens else None
+            self._provider_ms += provider_ms
+            self._sent_tokens += selection["sentTokens"]
+            entry = {
+                "at": time.time(),
+                "provider": provider,
+                "filtered": selection["filtered"],
+                "sections": selection["sections"],
+                "originalTokens": selection["originalTokens"],
+                "sentTokens": selection["sentTokens"],
+                "tokensSaved": selection["tokensSaved"],
+                "filterMs": round(filter_ms, 3),
+                "providerMs": round(provider_ms, 3),
+                "estimatedMsSaved": (
+                    round(selection["tokensSaved"] * ms_per_token, 1) if ms_per_token is not None else None
+                ),
+            }
+            self._entries.append(entry)
+        return entry
+    
+    def summary(self, recent=20) -> dict:
+        with self._lock:
+            entries = list(self._entries)
+        estimated = [e["estimatedMsSaved"] for e in entries if e["estimatedMsSaved"] is not None]
+        return {
+            "documents": len(entries),
+            "filtered": sum(1 for e in entries if e["filtered"]),
+            "originalTokens": sum(e["originalTokens"] for e in entries),
+            "sentTokens": sum(e["sentTokens"] for e in entries),
+            "tokensSaved": sum(e["tokensSaved"] for e in entries),
+            "providerMs": sum(e["providerMs"] for e in entries),
+            "estimatedMsSaved": sum(estimated) if estimated else None,
+            "recent": entries[-recent:],
+        }
+
+
+extraction_metrics = ExtractionMetrics()
+
+
+def extract_with_prefilter(text: str, extract) -> dict:
+    """
+    Run extract(prompt_text) on the pre-filtered text and record metrics.
+    
+    The result gains a "prefilter" entry with the selected sections' offsets
+    and the token counts.
+    """
+    selection, filter_ms = select_extraction_text(text)
+    start = time.perf_counter()
+    result = extract(selection["text"])
+    provider_ms = (time.perf_counter() - start) * 1000
+    result["prefilter"] = extraction_metrics.record(
+        selection, filter_ms, provider_ms, provider=result.get("provider")
+    )
+    return result
+
+
+def split_for_extraction(text: str, max_length: int = MAX_TEXT_LENGTH) -> list:
+    """Cut text into pieces of at most max_length characters, at paragraph breaks where possible."""
+    chunks = []
+    while len(text) > max_length:
+        cut = text.rfind("\n\n", 0, max_length)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, max_length)
+        if cut <= 0:
+            cut = max_length
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+def extract_in_chunks(text: str, extract, max_length: int = MAX_TEXT_LENGTH) -> dict:
+    """
+    extract(text) for text longer than one provider call may carry.
+    
+    Each piece from split_for_extraction() is extracted (up to
+    EXTRACTION_CHUNK_WORKERS at once) and the clauses are merged, with
+    document_info from the first piece that succeeded. Failed pieces are
+    listed in "chunk_errors"; the result is an error only if all failed.
+    """
+    chunks = split_for_extraction(text, max_length)
+    if len(chunks) == 1:
+        return extract(text)
+    with ThreadPoolExecutor(max_workers=min(len(chunks), EXTRACTION_CHUNK_WORKERS)) as pool:
+        results = list(pool.map(extract, chunks))
+    good = [result for result in results if result.get("clauses") or "error" not in result]
+    errors = [result["error"] for result in results if "error" in result and not result.get("clauses")]
+    if not good:
+        return {"error": "; ".join(errors), "document_info": {}, "clauses": []}
+    merged = {**good[0], "clauses": [clause for result in good for clause in result.get("clauses", [])]}
+    merged["chunks"] = len(chunks)
+    if errors:
+        merged["chunk_errors"] = errors
+    return merged
+
+
+def parse_model_json(response_text: str) -> dict:
+    """Parse the model's JSON answer, tolerating markdown code fences."""
     try:
         # Handle potential markdown code blocks
         if "```json" in response_text:
@@ -127,13 +396,25 @@ def extract_clauses_with_anthropic(text: str, api_key: str) -> dict:
         }
 
 
-def extract_clauses_with_openai(text: str, api_key: str) -> dict:
-    """Extract clauses using OpenAI API."""
-    client = openai.OpenAI(api_key=api_key)
-    
-    response = client.chat.completions.create(
-        model="gpt-4-turbo-preview",
-        messages=[
+def anthropic_request(text: str) -> dict:
+    """Keyword arguments for an Anthropic messages.create() call."""
+    return {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 4096,
+        "messages": [
+            {
+                "role": "user",
+                "content": EXTRACTION_PROMPT + text
+            }
+        ],
+    }
+
+
+def openai_request(text: str) -> dict:
+    """Keyword arguments for an OpenAI chat.completions.create() call."""
+    return {
+        "model": "gpt-4-turbo-preview",
+        "messages": [
             {
                 "role": "system",
                 "content": "You are a legal document analyst. Return only valid JSON."
@@ -143,43 +424,57 @@ def extract_clauses_with_openai(text: str, api_key: str) -> dict:
                 "content": EXTRACTION_PROMPT + text
             }
         ],
-        response_format={"type": "json_object"},
-        max_tokens=4096
-    )
-    
-    response_text = response.choices[0].message.content
-    
-    try:
-        return json.loads(response_text)
-    except json.JSONDecodeError as e:
-        return {
-            "error": f"Failed to parse AI response: {str(e)}",
-            "raw_response": response_text[:1000]
-        }
+        "response_format": {"type": "json_object"},
+        "max_tokens": 4096,
+    }
 
 
-def extract_clauses(text: str, provider: str = "auto") -> dict:
+def client_options(timeout: float = None) -> dict:
     """
-    Extract clauses from document text using AI.
+    SDK client arguments for a per-call timeout.
     
-    Args:
-        text: The document text to analyze
-        provider: "anthropic", "openai", or "auto" (tries anthropic first)
+    The router does its own failover, so the SDK's retries are turned off
+    and a hung call gives its thread back after `timeout` seconds.
+    """
+    if timeout is None:
+        return {}
+    return {"timeout": timeout, "max_retries": 0}
+
+
+def extract_clauses_with_anthropic(text: str, api_key: str, timeout: float = None) -> dict:
+    """Extract clauses using Anthropic Claude API."""
+    anthropic = load_sdk("anthropic")
+    client = anthropic.Anthropic(api_key=api_key, **client_options(timeout))
+    message = client.messages.create(**anthropic_request(text))
+    return parse_model_json(message.content[0].text)
+
+
+def extract_clauses_with_openai(text: str, api_key: str, timeout: float = None) -> dict:
+    """Extract clauses using OpenAI API."""
+    openai = load_sdk("openai")
+    client = openai.OpenAI(api_key=api_key, **client_options(timeout))
+    response = client.chat.completions.create(**openai_request(text))
+    return parse_model_json(response.choices[0].message.content)
+
+
+def select_provider(provider: str = "auto"):
+    """
+    Resolve which provider to call.
     
-    Returns:
-        Extracted clause information as a dict
+    Returns (provider, api_key, error) where error is an extraction-result
+    dict when no usable provider is configured.
     """
     # Check for API keys
     anthropic_key = os.environ.get("ANTHROPIC_API_KEY")
     openai_key = os.environ.get("OPENAI_API_KEY")
     
     if provider == "auto":
-        if anthropic_key and ANTHROPIC_AVAILABLE:
+        if anthropic_key and sdk_available("anthropic"):
             provider = "anthropic"
-        elif openai_key and OPENAI_AVAILABLE:
+        elif openai_key and sdk_available("openai"):
             provider = "openai"
         else:
-            return {
+            return None, None, {
                 "error": "No AI provider available. Set ANTHROPIC_API_KEY or OPENAI_API_KEY environment variable.",
                 "document_info": {},
                 "clauses": []
@@ -187,20 +482,203 @@ def extract_clauses(text: str, provider: str = "auto") -> dict:
     
     if provider == "anthropic":
         if not anthropic_key:
-            return {"error": "ANTHROPIC_API_KEY not set", "document_info": {}, "clauses": []}
-        if not ANTHROPIC_AVAILABLE:
-            return {"error": "anthropic package not installed", "document_info": {}, "clauses": []}
-        return extract_clauses_with_anthropic(text, anthropic_key)
+            return None, None, {"error": "ANTHROPIC_API_KEY not set", "document_info": {}, "clauses": []}
+        if not sdk_available("anthropic"):
+            return None, None, {"error": "anthropic package not installed", "document_info": {}, "clauses": []}
+        return provider, anthropic_key, None
     
     elif provider == "openai":
         if not openai_key:
-            return {"error": "OPENAI_API_KEY not set", "document_info": {}, "clauses": []}
-        if not OPENAI_AVAILABLE:
-            return {"error": "openai package not installed", "document_info": {}, "clauses": []}
-        return extract_clauses_with_openai(text, openai_key)
+            return None, None, {"error": "OPENAI_API_KEY not set", "document_info": {}, "clauses": []}
+        if not sdk_available("openai"):
+            return None, None, {"error": "openai package not installed", "document_info": {}, "clauses": []}
+        return provider, openai_key, None
+    
+    return None, None, {"error": f"Unknown provider: {provider}", "document_info": {}, "clauses": []}
+
+
+def extract_clauses(text: str, provider: str = "auto") -> dict:
+    """
+    Extract clauses from document text using AI.
+    
+    Args:
+        text: The document text to analyze
+        provider: "anthropic", "openai", or "auto" (tries anthropic first)
+    
+    Returns:
+        Extracted clause information as a dict
+    """
+    provider, api_key, error = select_provider(provider)
+    if error:
+        return error
+    
+    if provider == "anthropic":
+        return extract_with_prefilter(text, lambda prompt_text: extract_clauses_with_anthropic(prompt_text, api_key))
+    return extract_with_prefilter(text, lambda prompt_text: extract_clauses_with_openai(prompt_text, api_key))
+
+
+def configured_providers(timeout: float = None) -> dict:
+    """
+    {name: callable(text)} for every provider with a key and an installed SDK,
+    in the order "auto" prefers them. Used by the provider router; `timeout`
+    bounds each SDK call.
+    """
+    providers = {}
+    anthropic_key = os.environ.get("ANTHROPIC_API_KEY")
+    openai_key = os.environ.get("OPENAI_API_KEY")
+    if anthropic_key and sdk_available("anthropic"):
+        providers["anthropic"] = lambda text: extract_clauses_with_anthropic(text, anthropic_key, timeout)
+    if openai_key and sdk_available("openai"):
+        providers["openai"] = lambda text: extract_clauses_with_openai(text, openai_key, timeout)
+    return providers
+
+
+def with_mock_fallback(result: dict, text: str) -> dict:
+    """Fall back to pattern matching when the AI call produced nothing."""
+    if "error" in result and not result.get("clauses"):
+        mock_result = mock_extract_clauses(text)
+        mock_result["ai_error"] = result.get("error")
+        return mock_result
+    return result
+
+
+# Async clients hold a connection pool, so one is kept per (provider, key, timeout)
+_async_clients = {}
+
+
+def _async_client(provider: str, api_key: str, timeout: float = None):
+    key = (provider, api_key, timeout)
+    if key not in _async_clients:
+        sdk = load_sdk(provider)
+        if provider == "anthropic":
+            _async_clients[key] = sdk.AsyncAnthropic(api_key=api_key, **client_options(timeout))
+        else:
+            _async_clients[key] = sdk.AsyncOpenAI(api_key=api_key, **client_options(timeout))
+    return _async_clients[key]
+
+
+async def extract_clauses_with_provider_async(provider: str, api_key: str, text: str,
+                                              timeout: float = None) -> dict:
+    """Async variant of extract_clauses_with_anthropic() / _openai()."""
+    client = _async_client(provider, api_key, timeout)
+    if provider == "anthropic":
+        message = await client.messages.create(**anthropic_request(text))
+        return parse_model_json(message.content[0].text)
+    response = await client.chat.completions.create(**openai_request(text))
+    return parse_model_json(response.choices[0].message.content)
+
+
+def configured_async_providers(timeout: float = None) -> dict:
+    """configured_providers() as async callables, for ProviderRouter.extract_async()."""
+    providers = {}
+    for name, key_var in (("anthropic", "ANTHROPIC_API_KEY"), ("openai", "OPENAI_API_KEY")):
+        api_key = os.environ.get(key_var)
+        if api_key and sdk_available(name):
+            providers[name] = functools.partial(
+                extract_clauses_with_provider_async, name, api_key, timeout=timeout
+            )
+    return providers
+
+
+async def extract_with_prefilter_async(text: str, extract) -> dict:
+    """extract_with_prefilter() for an async extract(prompt_text)."""
+    selection, filter_ms = select_extraction_text(text)
+    start = time.perf_counter()
+    result = await extract(selection["text"])
+    provider_ms = (time.perf_counter() - start) * 1000
+    result["prefilter"] = extraction_metrics.record(
+        selection, filter_ms, provider_ms, provider=result.get("provider")
+    )
+    return result
+
+
+def stream_anthropic_text(text: str, api_key: str, timeout: float = None) -> Iterator[str]:
+    """Yield the model's answer in text deltas as Anthropic streams them."""
+    anthropic = load_sdk("anthropic")
+    client = anthropic.Anthropic(api_key=api_key, **client_options(timeout))
+    with client.messages.stream(**anthropic_request(text)) as stream:
+        yield from stream.text_stream
+
+
+def stream_openai_text(text: str, api_key: str, timeout: float = None) -> Iterator[str]:
+    """Yield the model's answer in text deltas as OpenAI streams them."""
+    openai = load_sdk("openai")
+    client = openai.OpenAI(api_key=api_key, **client_options(timeout))
+    for chunk in client.chat.completions.create(**openai_request(text), stream=True):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def configured_stream_providers(timeout: float = None) -> dict:
+    """configured_providers() as text-delta streams, for ProviderRouter.stream()."""
+    providers = {}
+    anthropic_key = os.environ.get("ANTHROPIC_API_KEY")
+    openai_key = os.environ.get("OPENAI_API_KEY")
+    if anthropic_key and sdk_available("anthropic"):
+        providers["anthropic"] = lambda text: stream_anthropic_text(text, anthropic_key, timeout)
+    if openai_key and sdk_available("openai"):
+        providers["openai"] = lambda text: stream_openai_text(text, openai_key, timeout)
+    return providers
+
+
+def stream_extract_clauses(text: str, stream, mock: bool = False) -> Iterator[tuple]:
+    """
+    Streaming variant of extract_clauses().
     
+    `stream` is ProviderRouter.stream (or anything with its contract).
+    Yields ("clause", clause) as soon as each object in the model's clauses
+    array is complete, then one ("done", info) with document_info,
+    extraction_notes and, if it happened, the provider error. Falls back to
+    pattern matching, like with_mock_fallback(), when no provider produces
+    any clause.
+    """
+    if mock:
+        result = mock_extract_clauses(text)
     else:
-        return {"error": f"Unknown provider: {provider}", "document_info": {}, "clauses": []}
+        result = yield from _stream_from_provider(text, stream)
+    
+    for clause in result.pop("clauses", None) or []:
+        yield "clause", clause
+    yield "done", result
+
+
+def _stream_from_provider(text: str, stream):
+    """Yield clauses while streaming; return what is left to send."""
+    selection, filter_ms = select_extraction_text(text)
+    start = time.perf_counter()
+    parser = ClauseStreamParser()
+    count = 0
+    deltas = stream(selection["text"])
+    try:
+        while True:
+            for clause in parser.feed(next(deltas)):
+                count += 1
+                yield "clause", clause
+    except StopIteration as stop:
+        # The router's outcome: the provider that answered, or why none did
+        outcome = stop.value
+    except Exception as e:
+        if not count:
+            return with_mock_fallback({"error": f"Streaming extraction failed: {e}"}, text)
+        return {"document_info": {}, "error": f"Stream interrupted: {e}"}
+    if "error" in outcome:
+        return with_mock_fallback(outcome, text)
+    
+    result = parse_model_json(parser.text)
+    if "error" in result and not count:
+        return with_mock_fallback(result, text)
+    
+    provider_ms = (time.perf_counter() - start) * 1000
+    result.update(outcome)
+    result["prefilter"] = extraction_metrics.record(
+        selection, filter_ms, provider_ms, provider=outcome["provider"]
+    )
+    result.pop("raw_response", None)
+    if not count:
+        # No incremental clauses (e.g. an unexpected layout); send the parsed ones
+        return result
+    result.pop("clauses", None)
+    return result
 
 
 def mock_extract_clauses(text: str) -> dict:
@@ -210,31 +688,7 @@ def mock_extract_clauses(text: str) -> dict:
     """
     clauses = []
     
-    # Simple pattern matching for common clauses
-    patterns = [
-        {
-            "type": "Management Fee",
-            "pattern": r"[Mm]anagement [Ff]ee[s]?\s*(?:shall be|of|:)?\s*(\d+\.?\d*)\s*%",
-            "field": "rate"
-        },
-        {
-            "type": "Preferred Return",
-            "pattern": r"[Pp]referred [Rr]eturn[s]?\s*(?:of|:)?\s*(\d+\.?\d*)\s*%",
-            "field": "rate"
-        },
-        {
-            "type": "Carry Terms",
-            "pattern": r"[Cc]arried [Ii]nterest\s*(?:of|:)?\s*(\d+\.?\d*)\s*%",
-            "field": "rate"
-        },
-        {
-            "type": "Fee Step-Down",
-            "pattern": r"(?:reduced|step.?down)\s*(?:by|of)?\s*(\d+\.?\d*)\s*%",
-            "field": "discount"
-        },
-    ]
-    
-    for p in patterns:
+    for p in CLAUSE_PATTERNS:
         matches = re.finditer(p["pattern"], text, re.IGNORECASE)
         for match in matches:
             value = float(match.group(1))
@@ -259,7 +713,7 @@ def mock_extract_clauses(text: str) -> dict:
             clauses.append(clause)
     
     # Check for MFN
-    if re.search(r"[Mm]ost [Ff]avored [Nn]ation|MFN", text):
+    if re.search(MFN_PATTERN, text):
         mfn_match = re.search(r"(.{0,200}[Mm]ost [Ff]avored [Nn]ation.{0,200}|.{0,200}MFN.{0,200})", text)
         if mfn_match:
             clauses.append({
@@ -277,7 +731,7 @@ def mock_extract_clauses(text: str) -> dict:
             })
     
     # Check for co-investment
-    if re.search(r"[Cc]o.?[Ii]nvestment", text):
+    if re.search(COINVEST_PATTERN, text):
         coinvest_match = re.search(r"(.{0,200}[Cc]o.?[Ii]nvestment.{0,200})", text)
         if coinvest_match:
             clauses.append({
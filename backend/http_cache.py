@@ -0,0 +1,85 @@
+"""
+HTTP Caching Helpers
+
+Strong ETags and Last-Modified validators for the read endpoints.
+
+Validators are derived from row updated_at timestamps. Document and clause
+writes bump their parent rows (see models.touch_investor), so:
+- a document's updated_at covers the document and its clauses
+- an investor's updated_at covers the investor and everything beneath it
+
+That lets a conditional GET be answered with a 304 before any to_dict()
+or calculate_effective_terms() work is done.
+"""
+
+import hashlib
+from datetime import timezone
+from flask import request, make_response
+from sqlalchemy import func
+from models import db, Investor
+from http_compression import CONTENT_ENCODINGS, encoded_etag
+
+
+def make_etag(kind, *parts):
+    """Build an opaque strong ETag from a resource kind and its version parts."""
+    raw = "|".join([kind] + [_stamp(p) for p in parts])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _stamp(value):
+    if value is None:
+        return "-"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def listing_validators(investor_id=None):
+    """
+    Return (etag, last_modified) for a listing, optionally scoped to one investor.
+
+    The unscoped form aggregates over all investors: the count changes when an
+    investor is removed, and max(updated_at) moves on any other write.
+    """
+    query = db.session.query(func.count(Investor.id), func.max(Investor.updated_at))
+    if investor_id is not None:
+        query = query.filter(Investor.id == investor_id)
+    count, last_modified = query.one()
+    return make_etag("listing", investor_id, count, last_modified), last_modified
+
+
+def is_not_modified(etag, last_modified=None):
+    """Check the request's conditional headers against the current validators."""
+    if request.if_none_match:
+        # The client may hold a compressed variant of the same representation
+        candidates = [etag] + [encoded_etag(etag, enc) for enc in CONTENT_ENCODINGS]
+        return any(request.if_none_match.contains_weak(tag) for tag in candidates)
+
+    if last_modified is not None and request.if_modified_since is not None:
+        current = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        return current <= request.if_modified_since
+
+    return False
+
+
+def conditional(etag, last_modified, render):
+    """
+    Answer a GET conditionally.
+
+    `render` is only called when the client's copy is stale, so expensive
+    serialization is skipped entirely on a 304.
+    """
+    if is_not_modified(etag, last_modified):
+        response = make_response("", 304)
+    else:
+        response = render()
+        if response.status_code != 200:
+            # Errors (e.g. a supersedes cycle) must not be revalidated as current
+            return response
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # Responses are per-user (token auth); always revalidate before reuse
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,148 @@
+"""
+Response Compression
+
+Negotiates zstd / brotli / gzip from the Accept-Encoding header and
+compresses JSON and text responses above a size threshold.
+
+gzip is always available. brotli (brotli or brotlicffi) and zstd
+(compression.zstd on Python 3.14+, or zstandard) are used when installed.
+"""
+
+import gzip
+from flask import request
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi as brotli
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+try:
+    from compression import zstd as _zstd
+
+    def _zstd_compress(data, level):
+        return _zstd.compress(data, level=level)
+
+    ZSTD_AVAILABLE = True
+except ImportError:
+    try:
+        import zstandard
+
+        def _zstd_compress(data, level):
+            return zstandard.ZstdCompressor(level=level).compress(data)
+
+        ZSTD_AVAILABLE = True
+    except ImportError:
+        ZSTD_AVAILABLE = False
+
+
+# Server preference order when the client weights encodings equally
+CONTENT_ENCODINGS = ("zstd", "br", "gzip")
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "text/plain",
+    "text/html",
+    "text/csv",
+}
+
+
+def available_encodings():
+    """Return the encodings this process can produce, in preference order."""
+    available = {"gzip": True, "br": BROTLI_AVAILABLE, "zstd": ZSTD_AVAILABLE}
+    return [enc for enc in CONTENT_ENCODINGS if available[enc]]
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes with the given content-coding."""
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level or 6, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=level or 5)
+    if encoding == "zstd":
+        return _zstd_compress(data, level or 3)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def encoded_etag(etag, encoding):
+    """ETag of an encoded representation (strong ETags must differ per encoding)."""
+    return f"{etag}-{encoding}"
+
+
+def negotiate_encoding(accept_encodings, allowed):
+    """Pick the best encoding the client accepts, or None for identity."""
+    best, best_quality = None, 0
+    for encoding in allowed:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def init_compression(app):
+    """Register the compression hook on an app."""
+    app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    app.config.setdefault("COMPRESS_ALGORITHMS", CONTENT_ENCODINGS)
+    app.config.setdefault("COMPRESS_LEVELS", {})
+
+    @app.after_request
+    def compress_response(response):
+        return _compress_response(app, response)
+
+
+def _compress_response(app, response):
+    if response.status_code == 304:
+        _echo_encoded_etag(response)
+        return response
+
+    if (
+        response.status_code < 200
+        or response.status_code >= 300
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    data = response.get_data()
+    if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    allowed = [
+        enc for enc in available_encodings()
+        if enc in app.config["COMPRESS_ALGORITHMS"]
+    ]
+    encoding = negotiate_encoding(request.accept_encodings, allowed)
+    if encoding is None:
+        return response
+
+    level = app.config["COMPRESS_LEVELS"].get(encoding)
+    response.set_data(compress(data, encoding, level))
+    response.headers["Content-Encoding"] = encoding
+
+    etag, is_weak = response.get_etag()
+    if etag:
+        response.set_etag(encoded_etag(etag, encoding), weak=is_weak)
+
+    return response
+
+
+def _echo_encoded_etag(response):
+    """On a 304, repeat whichever encoded variant of the ETag the client holds."""
+    etag, is_weak = response.get_etag()
+    if not etag or not request.if_none_match:
+        return
+    for encoding in CONTENT_ENCODINGS:
+        variant = encoded_etag(etag, encoding)
+        if request.if_none_match.contains_weak(variant):
+            response.set_etag(variant, weak=is_weak)
+            response.vary.add("Accept-Encoding")
+            return
@@ -1,9 +1,17 @@
+import hashlib
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Select, delete, func, insert, literal, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.hybrid import hybrid_property
 
 db = SQLAlchemy()
 
 
+# to_dict() methods return raw Decimal / date / datetime values;
+# serialization.FastJSONProvider converts them when the response is encoded.
+
+
 class User(db.Model):
     """User model for authentication."""
     __tablename__ = "users"
@@ -18,7 +26,7 @@ class User(db.Model):
             "id": self.id,
             "email": self.email,
             "displayName": self.display_name,
-            "createdAt": self.created_at.isoformat() if self.created_at else None,
+            "createdAt": self.created_at,
         }
 
 
@@ -45,13 +53,13 @@ class Investor(db.Model):
             "id": self.id,
             "name": self.name,
             "investorType": self.investor_type,
-            "commitmentAmount": float(self.commitment_amount) if self.commitment_amount else None,
+            "commitmentAmount": self.commitment_amount,
             "currency": self.currency,
             "fund": self.fund,
             "relationshipNotes": self.relationship_notes,
             "internalNotes": self.internal_notes,
-            "createdAt": self.created_at.isoformat() if self.created_at else None,
-            "updatedAt": self.updated_at.isoformat() if self.updated_at else None,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
         }
 
 
@@ -60,7 +68,7 @@ class Document(db.Model):
     __tablename__ = "documents"
     
     id = db.Column(db.Integer, primary_key=True)
-    investor_id = db.Column(db.Integer, db.ForeignKey("investors.id"), nullable=False)
+    investor_id = db.Column(db.Integer, db.ForeignKey("investors.id"), nullable=False, index=True)
     title = db.Column(db.String(255), nullable=False)
     doc_type = db.Column(db.String(100))  # Side Letter, Amendment, Subscription Agreement, PPM
     status = db.Column(db.String(50), default="Active")  # Draft, Active, Superseded
@@ -77,23 +85,41 @@ class Document(db.Model):
     clauses = db.relationship("Clause", backref="document", lazy=True, cascade="all, delete-orphan")
     supersedes = db.relationship("Document", remote_side=[id], backref="superseded_by")
     
-    def to_dict(self):
-        return {
+    def to_dict(self, include_source_text=True):
+        data = {
             "id": self.id,
             "investorId": self.investor_id,
             "title": self.title,
             "docType": self.doc_type,
             "status": self.status,
-            "effectiveDate": self.effective_date.isoformat() if self.effective_date else None,
+            "effectiveDate": self.effective_date,
             "supersedesId": self.supersedes_id,
             "priority": self.priority,
             "fileName": self.file_name,
             "fileUrl": self.file_url,
-            "sourceText": self.source_text,
-            "createdAt": self.created_at.isoformat() if self.created_at else None,
-            "updatedAt": self.updated_at.isoformat() if self.updated_at else None,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
             "clauses": [clause.to_dict() for clause in self.clauses],
         }
+        if include_source_text:
+            # Left out of listings that defer the column, so it isn't loaded
+            data["sourceText"] = self.source_text
+        return data
+
+
+class ClauseText(db.Model):
+    """
+    A distinct clause wording, stored once however many clauses quote it.
+    
+    Keyed by the SHA-256 of the normalized text (see normalize_clause_text),
+    so templated PPM and subscription language is one row per fund book.
+    """
+    __tablename__ = "clause_texts"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), nullable=False, unique=True)
+    text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 class Clause(db.Model):
@@ -103,7 +129,11 @@ class Clause(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey("documents.id"), nullable=False)
     clause_type = db.Column(db.String(100))  # Management Fee, Carry, MFN, Fee Waiver, etc.
-    clause_text = db.Column(db.Text)  # Original text from document
+    # Original text from document, interned in clause_texts (see clause_text below)
+    text_id = db.Column(db.Integer, db.ForeignKey("clause_texts.id"), index=True)
+    text_ref = db.relationship("ClauseText", lazy="joined")
+    # Text stored inline before clause_texts existed; init-db moves it over
+    legacy_text = db.Column("clause_text", db.Text)
     
     # Structured term fields
     rate = db.Column(db.Numeric(10, 4))  # Percentage rate
@@ -119,19 +149,508 @@ class Clause(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @hybrid_property
+    def clause_text(self):
+        if self.text_ref is not None:
+            return self.text_ref.text
+        return self.legacy_text
+    
+    @clause_text.inplace.setter
+    def _clause_text_setter(self, value):
+        self.text_ref = intern_text(value)
+        self.legacy_text = None
+    
+    @clause_text.inplace.expression
+    @classmethod
+    def _clause_text_expression(cls):
+        return func.coalesce(
+            select(ClauseText.text).where(ClauseText.id == cls.text_id).scalar_subquery(),
+            cls.legacy_text,
+        )
+    
     def to_dict(self):
         return {
             "id": self.id,
             "documentId": self.document_id,
             "clauseType": self.clause_type,
             "clauseText": self.clause_text,
-            "rate": float(self.rate) if self.rate else None,
+            "rate": self.rate,
             "threshold": self.threshold,
-            "thresholdAmount": float(self.threshold_amount) if self.threshold_amount else None,
-            "discount": float(self.discount) if self.discount else None,
-            "effectiveDate": self.effective_date.isoformat() if self.effective_date else None,
+            "thresholdAmount": self.threshold_amount,
+            "discount": self.discount,
+            "effectiveDate": self.effective_date,
             "notes": self.notes,
             "pageNumber": self.page_number,
             "sectionRef": self.section_ref,
-            "createdAt": self.created_at.isoformat() if self.created_at else None,
+            "createdAt": self.created_at,
+        }
+
+
+class ClauseMinHash(db.Model):
+    """
+    A distinct MinHash signature and, via ClauseBucket, its LSH buckets (see
+    clause_similarity). Clauses with the same wording share one row.
+    """
+    __tablename__ = "clause_minhashes"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.LargeBinary(16), nullable=False, unique=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+
+
+class ClauseBucket(db.Model):
+    """One LSH band bucket of a signature."""
+    __tablename__ = "clause_lsh_buckets"
+    
+    band = db.Column(db.SmallInteger, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    minhash_id = db.Column(db.Integer, db.ForeignKey("clause_minhashes.id"), primary_key=True)
+
+
+class ClauseSignature(db.Model):
+    """Which signature a clause's text has."""
+    __tablename__ = "clause_signatures"
+    
+    clause_id = db.Column(db.Integer, primary_key=True)
+    minhash_id = db.Column(db.Integer, db.ForeignKey("clause_minhashes.id"), nullable=False, index=True)
+
+
+class DocumentVersion(db.Model):
+    """A stored revision of a document's source text and its section index."""
+    __tablename__ = "document_versions"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey("documents.id"), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    source_text = db.Column(db.Text)
+    # [{"key", "heading", "start", "end", "hash"}] - see document_versions.section_index
+    sections = db.Column(db.JSON, nullable=False, default=list)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint("document_id", "version"),)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "documentId": self.document_id,
+            "version": self.version,
+            "sections": self.sections,
+            "createdAt": self.created_at,
+        }
+
+
+class Fund(db.Model):
+    """A fund or vehicle investors commit to."""
+    __tablename__ = "funds"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False, unique=True)
+    vehicle_type = db.Column(db.String(100))
+    vintage_year = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "vehicleType": self.vehicle_type,
+            "vintageYear": self.vintage_year,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
+        }
+
+
+class Commitment(db.Model):
+    """An investor's commitment to one fund; investors can commit to many."""
+    __tablename__ = "commitments"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    investor_id = db.Column(db.Integer, db.ForeignKey("investors.id"), nullable=False)
+    fund_id = db.Column(db.Integer, db.ForeignKey("funds.id"), nullable=False)
+    amount = db.Column(db.Numeric(18, 2))
+    currency = db.Column(db.String(10), default="USD")
+    commitment_date = db.Column(db.Date)
+    status = db.Column(db.String(50), default="Active")
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Investor -> funds lookups use the unique index. Fund -> investors
+        # lookups and per-fund totals are answered from this one alone
+        db.UniqueConstraint("investor_id", "fund_id"),
+        db.Index("ix_commitments_fund_investor", "fund_id", "investor_id", "amount"),
+    )
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "investorId": self.investor_id,
+            "fundId": self.fund_id,
+            "amount": self.amount,
+            "currency": self.currency,
+            "commitmentDate": self.commitment_date,
+            "status": self.status,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
+        }
+
+
+class Change(db.Model):
+    """
+    Append-only log of investor, document and clause writes, for consumers
+    that catch up incrementally (GET /changes?since=<id>).
+    
+    Rows are added by record_changes() in the same transaction as the write
+    they describe, and never updated or deleted. The id is the cursor.
+    """
+    __tablename__ = "changes"
+    __table_args__ = {"sqlite_autoincrement": True}  # ids are never reused
+    
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # investor, document, clause
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete
+    document_id = db.Column(db.Integer)
+    investor_id = db.Column(db.Integer)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "entity": self.entity,
+            "entityId": self.entity_id,
+            "op": self.op,
+            "documentId": self.document_id,
+            "investorId": self.investor_id,
+            "changedAt": self.changed_at,
         }
+
+
+def sync_commitments(investor_ids=None):
+    """
+    Mirror the legacy Investor.fund / commitment_amount fields into Fund and
+    Commitment rows, set-based. The caller commits.
+    
+    Funds are matched by name and created when missing; an investor gets a
+    commitment to its named fund if it has none, and an existing one takes
+    the investor's amount and currency. `investor_ids` (a list or a select())
+    limits this to some investors; by default the whole book is synced.
+    """
+    if investor_ids is not None and _no_ids(investor_ids):
+        return
+    named = (Investor.fund.is_not(None), Investor.fund != "")
+    scope = () if investor_ids is None else (Investor.id.in_(investor_ids),)
+    now = datetime.utcnow()
+    
+    db.session.execute(insert(Fund).from_select(
+        ["name", "created_at", "updated_at"],
+        select(Investor.fund, literal(now), literal(now))
+        .where(*named, *scope, Investor.fund.not_in(select(Fund.name)))
+        .distinct(),
+    ))
+    
+    # The investor's named fund, and its existing commitment there if any
+    db.session.execute(insert(Commitment).from_select(
+        ["investor_id", "fund_id", "amount", "currency", "status", "created_at", "updated_at"],
+        select(Investor.id, Fund.id, Investor.commitment_amount,
+               func.coalesce(Investor.currency, "USD"), literal("Active"), literal(now), literal(now))
+        .join(Fund, Fund.name == Investor.fund)
+        .outerjoin(Commitment, (Commitment.investor_id == Investor.id) & (Commitment.fund_id == Fund.id))
+        .where(*scope, Commitment.id.is_(None)),
+    ))
+    db.session.execute(
+        update(Commitment)
+        .where(
+            Commitment.investor_id == Investor.id,
+            Commitment.fund_id == Fund.id,
+            Fund.name == Investor.fund,
+            *scope,
+        )
+        .values(
+            amount=Investor.commitment_amount,
+            currency=func.coalesce(Investor.currency, "USD"),
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def move_commitment(investor_id, old_fund):
+    """
+    Follow a change of an investor's legacy `fund` from old_fund: its
+    commitment to old_fund moves to the fund now named, or is removed if the
+    investor names no fund or already has a commitment there. Run it before
+    sync_commitments(), which then brings the amount in line. The caller
+    commits.
+    """
+    if not old_fund:
+        return
+    commitment = db.session.scalar(
+        select(Commitment)
+        .join(Fund, Fund.id == Commitment.fund_id)
+        .where(Commitment.investor_id == investor_id, Fund.name == old_fund)
+    )
+    if commitment is None:
+        return
+    new_name = db.session.get(Investor, investor_id).fund
+    fund = db.session.scalar(select(Fund).where(Fund.name == new_name)) if new_name else None
+    if new_name and fund is None:
+        fund = Fund(name=new_name)
+        db.session.add(fund)
+        db.session.flush()
+    if fund is None or db.session.scalar(
+        select(Commitment.id).where(Commitment.investor_id == investor_id, Commitment.fund_id == fund.id)
+    ):
+        db.session.delete(commitment)
+    else:
+        commitment.fund_id = fund.id
+    db.session.flush()
+
+
+def normalize_clause_text(text):
+    """The form clause text is interned in: line endings unified, ends trimmed."""
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def clause_text_digest(text):
+    return hashlib.sha256(normalize_clause_text(text).encode("utf-8")).hexdigest()
+
+
+def intern_text(text):
+    """
+    The ClauseText row for text, inserted if it is new; None for None.
+    
+    The insert runs in a savepoint, so a concurrent writer interning the
+    same text first is picked up instead of failing the transaction.
+    """
+    if text is None:
+        return None
+    digest = clause_text_digest(text)
+    lookup = select(ClauseText).where(ClauseText.digest == digest)
+    row = db.session.scalar(lookup)
+    if row is None:
+        try:
+            with db.session.begin_nested():
+                row = ClauseText(digest=digest, text=normalize_clause_text(text))
+                db.session.add(row)
+        except IntegrityError:
+            row = db.session.scalar(lookup)
+    return row
+
+
+def intern_texts(texts):
+    """
+    intern_text for many texts, set-based: {text: ClauseText id}.
+    
+    Used by writes that set text_id directly (bulk loads, extraction
+    results, PATCH): one lookup plus at most one insert for the batch. The
+    caller commits.
+    """
+    by_digest = {}
+    for text in texts:
+        if text is not None:
+            by_digest.setdefault(clause_text_digest(text), []).append(text)
+    if not by_digest:
+        return {}
+    
+    def existing():
+        return dict(db.session.execute(
+            select(ClauseText.digest, ClauseText.id).where(ClauseText.digest.in_(list(by_digest)))
+        ).all())
+    
+    ids = existing()
+    missing = [digest for digest in by_digest if digest not in ids]
+    if missing:
+        now = datetime.utcnow()
+        try:
+            with db.session.begin_nested():
+                ids.update(db.session.execute(
+                    insert(ClauseText).returning(ClauseText.digest, ClauseText.id),
+                    [
+                        {"digest": digest, "text": normalize_clause_text(by_digest[digest][0]), "created_at": now}
+                        for digest in missing
+                    ],
+                ).all())
+        except IntegrityError:
+            # Interned concurrently: insert whatever is still missing one at a time
+            for digest in missing:
+                intern_text(by_digest[digest][0])
+            ids = existing()
+    return {text: ids[digest] for digest, group in by_digest.items() for text in group}
+
+
+def migrate_clause_texts(batch_size=2000):
+    """Move clause text still stored inline on clauses into clause_texts. The caller commits."""
+    while True:
+        rows = db.session.execute(
+            select(Clause.id, Clause.legacy_text)
+            .where(Clause.text_id.is_(None), Clause.legacy_text.is_not(None))
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        ids = intern_texts(text for _, text in rows)
+        db.session.execute(update(Clause), [
+            {"id": clause_id, "text_id": ids[text], "legacy_text": None} for clause_id, text in rows
+        ])
+
+
+def derive_priority(doc_type):
+    """Derive document priority based on type."""
+    priority_map = {
+        "Amendment": 4,
+        "Side Letter": 3,
+        "Fee Schedule": 3,
+        "Subscription Agreement": 2,
+        "PPM": 1,
+    }
+    return priority_map.get(doc_type, 1)
+
+
+def touch_investor(investor_id, document_id=None):
+    """
+    Bump updated_at on an investor and, optionally, one of its documents.
+    
+    Clause and document writes call this so that a parent's timestamp moves
+    whenever anything beneath it changes. HTTP validators (see http_cache)
+    are derived from these timestamps.
+    """
+    now = datetime.utcnow()
+    if document_id is not None:
+        db.session.execute(
+            update(Document).where(Document.id == document_id).values(updated_at=now)
+        )
+    if investor_id is not None:
+        db.session.execute(
+            update(Investor).where(Investor.id == investor_id).values(updated_at=now)
+        )
+
+
+def touch_investors(investor_ids, document_ids=()):
+    """touch_investor for many investors and documents: one UPDATE per table."""
+    now = datetime.utcnow()
+    if document_ids:
+        db.session.execute(
+            update(Document).where(Document.id.in_(document_ids)).values(updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    if investor_ids:
+        db.session.execute(
+            update(Investor).where(Investor.id.in_(investor_ids)).values(updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def record_changes(entity, op, ids):
+    """
+    Append change-log rows for investors, documents or clauses, set-based.
+    
+    `ids` may be a list or a select() of ids. One INSERT ... SELECT per call,
+    reading parent ids from the rows themselves, so deletes are recorded
+    before the rows go. The caller commits, which makes the entries visible
+    together with the write.
+    """
+    if _no_ids(ids):
+        return
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Serialize log writers so ids become visible in commit order and a
+        # consumer's cursor never skips a row committed late
+        db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext('changes'))"))
+    now = datetime.utcnow()
+    source = {
+        "investor": select(Investor.id, literal(None, db.Integer), Investor.id)
+        .where(Investor.id.in_(ids)),
+        "document": select(Document.id, Document.id, Document.investor_id)
+        .where(Document.id.in_(ids)),
+        "clause": select(Clause.id, Clause.document_id, Document.investor_id)
+        .join(Document, Document.id == Clause.document_id)
+        .where(Clause.id.in_(ids)),
+    }[entity]
+    db.session.execute(insert(Change).from_select(
+        ["entity_id", "document_id", "investor_id", "entity", "op", "changed_at"],
+        source.add_columns(literal(entity), literal(op), literal(now)),
+    ))
+
+
+def _no_ids(ids):
+    """True for an empty id list (a select() of ids is never skipped)."""
+    return not isinstance(ids, Select) and not ids
+
+
+def unindex_clauses(clause_ids):
+    """
+    Drop clauses (a list or a select() of ids) from the similarity index.
+    
+    Their signatures stay: they are shared with any clause of the same
+    wording, and an unreferenced one only costs a row.
+    """
+    if _no_ids(clause_ids):
+        return
+    db.session.execute(
+        delete(ClauseSignature).where(ClauseSignature.clause_id.in_(clause_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def delete_clauses(clause_ids):
+    """
+    Delete clauses (a list or a select() of ids) with their similarity index
+    entries, recording the deletes in the change log.
+    """
+    if _no_ids(clause_ids):
+        return
+    record_changes("clause", "delete", clause_ids)
+    unindex_clauses(clause_ids)
+    db.session.execute(
+        delete(Clause).where(Clause.id.in_(clause_ids)).execution_options(synchronize_session=False)
+    )
+
+
+def delete_documents(document_ids):
+    """
+    Delete documents with their clauses and versions, set-based.
+    
+    `document_ids` may be a list or a select() of ids. Nothing is loaded into
+    the session: clauses and their similarity index entries go in one
+    DELETE ... WHERE ... IN (...) each, and documents elsewhere that
+    supersede a deleted one have supersedes_id cleared first, as the ORM
+    relationship did on delete.
+    """
+    if _no_ids(document_ids):
+        return
+    options = {"synchronize_session": False}
+    db.session.execute(
+        update(Document)
+        .where(Document.supersedes_id.in_(document_ids), Document.id.not_in(document_ids))
+        .values(supersedes_id=None)
+        .execution_options(**options)
+    )
+    delete_clauses(select(Clause.id).where(Clause.document_id.in_(document_ids)))
+    record_changes("document", "delete", document_ids)
+    db.session.execute(
+        delete(DocumentVersion)
+        .where(DocumentVersion.document_id.in_(document_ids))
+        .execution_options(**options)
+    )
+    db.session.execute(
+        delete(Document).where(Document.id.in_(document_ids)).execution_options(**options)
+    )
+
+
+def delete_investors(investor_ids):
+    """Delete investors (a list or a select() of ids) with their commitments, documents and clauses."""
+    if _no_ids(investor_ids):
+        return
+    delete_documents(select(Document.id).where(Document.investor_id.in_(investor_ids)))
+    record_changes("investor", "delete", investor_ids)
+    db.session.execute(
+        delete(Commitment)
+        .where(Commitment.investor_id.in_(investor_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(Investor)
+        .where(Investor.id.in_(investor_ids))
+        .execution_options(synchronize_session=False)
+    )
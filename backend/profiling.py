@@ -0,0 +1,239 @@
+"""
+Request Profiling
+
+Two opt-in tools for finding where a slow request spends its time:
+
+- On demand: an admin adds ?profile=1 (or an X-Profile: 1 header) to any
+  request. A sampling profiler records the request thread's stack every
+  PROFILE_SAMPLE_INTERVAL seconds while the view runs, and every SQL
+  statement is timed. The profile is written to PROFILE_DIR as folded stacks
+  ("frame;frame;frame count" lines, the input format of flamegraph.pl,
+  speedscope and inferno) plus a JSON summary, and the response carries an
+  X-Profile-Id header for GET /admin/profiles/<id>.
+- In the background: with SLOW_REQUEST_SAMPLE_RATE > 0, that fraction of
+  requests has its SQL recorded, and the slowest SLOW_REQUEST_TOP_N per route
+  are kept for GET /admin/slow-requests. This log is per worker process.
+
+Both add a Server-Timing header with total and SQL time.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Statements recorded for the current request, or None when not recording
+_sql_log = ContextVar("sql_log", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _sql_log.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _sql_log.get()
+    if log is not None and conn.info.get("profile_query_start"):
+        elapsed = time.perf_counter() - conn.info["profile_query_start"].pop()
+        log.append({"statement": statement, "ms": round(elapsed * 1000, 3)})
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's call stack on a background thread."""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def folded(self):
+        """Flamegraph input: one "stack count" line per distinct stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class SlowRequestLog:
+    """The slowest N sampled requests per route."""
+
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        self._routes = defaultdict(list)  # route -> min-heap of (ms, seq, entry)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, route, duration_ms, entry):
+        with self._lock:
+            heap = self._routes[route]
+            item = (duration_ms, next(self._seq), entry)
+            if len(heap) < self.top_n:
+                heapq.heappush(heap, item)
+            elif duration_ms > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: [entry for _, _, entry in sorted(heap, key=lambda item: -item[0])]
+                for route, heap in sorted(self._routes.items())
+            }
+
+
+def profile_dir(config):
+    return config.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "agreementtracker-profiles")
+
+
+def load_profile(config, profile_id):
+    """(summary dict, folded stacks) for a stored profile, or None."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    base = os.path.join(profile_dir(config), profile_id)
+    try:
+        with open(base + ".json") as f:
+            summary = json.load(f)
+        with open(base + ".folded") as f:
+            folded = f.read()
+    except FileNotFoundError:
+        return None
+    return summary, folded
+
+
+def list_profiles(config, limit=50):
+    directory = profile_dir(config)
+    if not os.path.isdir(directory):
+        return []
+    paths = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")),
+        key=os.path.getmtime, reverse=True,
+    )
+    profiles = []
+    for path in paths[:limit]:
+        with open(path) as f:
+            profiles.append(json.load(f))
+    return profiles
+
+
+def _wants_profile():
+    return request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+
+
+def init_profiling(app, is_admin):
+    """
+    Register the profiling hooks on an app.
+
+    is_admin() is called with the request context active and decides who may
+    profile; everyone else's ?profile=1 is ignored.
+    """
+    app.config.setdefault("PROFILE_SAMPLE_INTERVAL", 0.001)
+    app.config.setdefault("SLOW_REQUEST_SAMPLE_RATE", 0.0)
+    app.config.setdefault("SLOW_REQUEST_TOP_N", 10)
+    app.extensions["slow_requests"] = SlowRequestLog(app.config["SLOW_REQUEST_TOP_N"])
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def start_profiling():
+        profile = _wants_profile() and is_admin()
+        sampled = random.random() < app.config["SLOW_REQUEST_SAMPLE_RATE"]
+        if not (profile or sampled):
+            return
+        g.profile_sql = []
+        g.profile_token = _sql_log.set(g.profile_sql)
+        g.profile_started = time.perf_counter()
+        if profile:
+            g.profile_sampler = StackSampler(
+                threading.get_ident(), app.config["PROFILE_SAMPLE_INTERVAL"]
+            ).start()
+
+    @app.after_request
+    def finish_profiling(response):
+        if "profile_started" not in g:
+            return response
+        duration_ms = (time.perf_counter() - g.profile_started) * 1000
+        sql_ms = sum(query["ms"] for query in g.profile_sql)
+        response.headers["Server-Timing"] = f"app;dur={duration_ms:.1f}, sql;dur={sql_ms:.1f}"
+        summary = {
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "route": request.url_rule.rule if request.url_rule else request.path,
+            "status": response.status_code,
+            "durationMs": round(duration_ms, 3),
+            "sqlMs": round(sql_ms, 3),
+            "sqlCount": len(g.profile_sql),
+            "sql": g.profile_sql,
+            "recordedAt": datetime.utcnow().isoformat(),
+        }
+
+        sampler = g.pop("profile_sampler", None)
+        if sampler is not None:
+            sampler.stop()
+            summary["id"] = uuid.uuid4().hex
+            summary["samples"] = sum(sampler.stacks.values())
+            _store_profile(summary, sampler.folded())
+            response.headers["X-Profile-Id"] = summary["id"]
+        else:
+            current_app.extensions["slow_requests"].record(summary["route"], duration_ms, summary)
+        return response
+
+    @app.teardown_request
+    def stop_recording(exc=None):
+        token = g.pop("profile_token", None)
+        if token is not None:
+            _sql_log.reset(token)
+        sampler = g.pop("profile_sampler", None)
+        if sampler is not None:
+            # The view raised before after_request ran
+            sampler.stop()
+
+
+def _store_profile(summary, folded):
+    directory = profile_dir(current_app.config)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, summary["id"])
+    with open(base + ".folded", "w") as f:
+        f.write(folded)
+    # Summary last: a profile is listed once both files exist
+    with open(base + ".json", "w") as f:
+        json.dump(summary, f)
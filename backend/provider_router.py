@@ -0,0 +1,470 @@
+"""
+Extraction Provider Router
+
+Routes extraction calls across the configured AI providers:
+
+- Latency tracking: a sliding window of successful call latencies per
+  provider, used for p50/p95.
+- Circuit breaker: after consecutive failures a provider is skipped until a
+  cool-down passes, then one trial call is let through (half-open).
+- Failover: when a provider fails, errors or times out, the next one is tried.
+- Hedging (optional): if the first provider hasn't answered within its p95
+  latency, the next provider is started as well and the first good answer wins.
+- Rate limiting (optional): a token bucket per provider, stored in a SQLite
+  file so every worker process on a host draws from the same bucket.
+
+Providers are plain callables text -> result dict, so tests can swap in
+fakes that inject latency and errors. extract_async() is the same routing for
+the ASGI serving mode: it awaits async variants of the providers where given
+(and runs the plain callables on threads otherwise), so a call in flight
+doesn't hold a thread. stream() routes streamed extraction: failover only
+happens before the first text delta reaches the caller.
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies (seconds)."""
+
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after a cool-down."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Whether a call may go out now (reserves the half-open trial)."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a half-open trial reserved by allow() that wasn't used."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                # A failed half-open trial re-opens for another cool-down
+                self._opened_at = self._clock()
+
+
+class SQLiteTokenBucket:
+    """
+    Token buckets kept in a SQLite file shared by all workers on a host.
+
+    Each acquire() is one short BEGIN IMMEDIATE transaction, which SQLite
+    serializes across processes.
+    """
+
+    def __init__(self, path, rate_per_second, capacity, clock=time.time):
+        self.path = path
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._clock = clock
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets "
+                "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+
+    def acquire(self, name, tokens=1.0):
+        """Take tokens if available; returns False when the bucket is empty."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = self._clock()
+            row = conn.execute(
+                "SELECT tokens, updated FROM token_buckets WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                available = self.capacity
+            else:
+                available = min(self.capacity, row[0] + (now - row[1]) * self.rate)
+            allowed = available >= tokens
+            if allowed:
+                available -= tokens
+            conn.execute(
+                "INSERT INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (name, available, now),
+            )
+            conn.execute("COMMIT")
+            return allowed
+        finally:
+            conn.close()
+
+
+class ProviderRouter:
+    """Failover, hedging, circuit breaking and rate limiting across providers."""
+
+    def __init__(self, providers, hedge=False, hedge_default_delay=5.0, hedge_min_samples=20,
+                 timeout=120.0, breaker_failures=5, breaker_reset_seconds=30.0,
+                 rate_limiter=None, max_workers=8, clock=time.monotonic, async_providers=None,
+                 stream_providers=None):
+        # providers: {name: callable(text) -> result dict}, in preference order
+        self.providers = dict(providers)
+        # async_providers: {name: async callable(text) -> result dict}, used by extract_async()
+        self.async_providers = dict(async_providers or {})
+        # stream_providers: {name: callable(text) -> iterator of text deltas}, used by stream()
+        self.stream_providers = dict(stream_providers or {})
+        self.hedge = hedge
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self._clock = clock
+        self.latency = {name: LatencyTracker() for name in self.providers}
+        self.breakers = {
+            name: CircuitBreaker(breaker_failures, breaker_reset_seconds, clock=clock)
+            for name in self.providers
+        }
+        # One pool per provider, so calls stuck on a slow provider can't queue
+        # the others; a provider whose pool is full of unfinished calls is skipped
+        self.max_workers = max_workers
+        self._pools = {
+            name: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"extract-{name}")
+            for name in self.providers
+        }
+        self._in_flight = {name: 0 for name in self.providers}
+        self._in_flight_lock = threading.Lock()
+        # Tasks extract_async() returned without awaiting (asyncio only keeps weak references)
+        self._background = set()
+
+    def hedge_delay(self, name):
+        """How long to wait on a provider before hedging: its p95, once known."""
+        if len(self.latency[name]) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return self.latency[name].percentile(95)
+
+    def status(self):
+        return {
+            name: {
+                "state": self.breakers[name].state,
+                "samples": len(self.latency[name]),
+                "p50": self.latency[name].percentile(50),
+                "p95": self.latency[name].percentile(95),
+            }
+            for name in self.providers
+        }
+
+    def _available(self, names=None):
+        """Providers to try now, in order; each one returned has passed its checks."""
+        for name in self.providers:
+            if names is not None and name not in names:
+                continue
+            if self._in_flight[name] >= self.max_workers:
+                continue
+            breaker = self.breakers[name]
+            # Only spend a rate-limit token on a provider the breaker lets through
+            if not breaker.allow():
+                continue
+            if self.rate_limiter is not None and not self.rate_limiter.acquire(name):
+                breaker.release()
+                continue
+            yield name
+
+    async def _available_async(self):
+        """_available() for extract_async(): the rate limiter's blocking I/O runs off the loop."""
+        for name in self.providers:
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            if self.rate_limiter is not None and not await asyncio.to_thread(self.rate_limiter.acquire, name):
+                breaker.release()
+                continue
+            yield name
+
+    def _submit(self, name, text):
+        with self._in_flight_lock:
+            self._in_flight[name] += 1
+        return self._pools[name].submit(self._call, name, text)
+
+    def _call(self, name, text):
+        start = self._clock()
+        try:
+            result = self.providers[name](text)
+        except Exception as e:
+            self.breakers[name].record_failure()
+            return {"error": f"{name}: {e}", "document_info": {}, "clauses": []}
+        finally:
+            with self._in_flight_lock:
+                self._in_flight[name] -= 1
+        return self._record(name, start, result)
+
+    async def _call_async(self, name, text):
+        start = self._clock()
+        try:
+            if name in self.async_providers:
+                result = await self.async_providers[name](text)
+            else:
+                result = await asyncio.to_thread(self.providers[name], text)
+        except Exception as e:
+            self.breakers[name].record_failure()
+            return {"error": f"{name}: {e}", "document_info": {}, "clauses": []}
+        return self._record(name, start, result)
+
+    def _record(self, name, start, result):
+        if "error" in result and not result.get("clauses"):
+            self.breakers[name].record_failure()
+            return result
+        self.latency[name].record(self._clock() - start)
+        self.breakers[name].record_success()
+        result["provider"] = name
+        return result
+
+    def _no_providers(self):
+        return {
+            "error": "No AI provider available. Set ANTHROPIC_API_KEY or OPENAI_API_KEY environment variable.",
+            "document_info": {},
+            "clauses": [],
+        }
+
+    def _failed(self, errors):
+        if not errors:
+            errors.append("All providers are unavailable (circuit open or rate limited)")
+        return {"error": "; ".join(errors), "document_info": {}, "clauses": []}
+
+    def extract(self, text):
+        """Return the first good result, or an error dict naming every failure."""
+        if not self.providers:
+            return self._no_providers()
+
+        errors = []
+        attempted = []
+        candidates = self._available()
+        pending = {}  # future -> provider name
+        deadline = self._clock() + self.timeout
+        hedge_exhausted = False  # no provider left to hedge with
+
+        def start_next():
+            name = next(candidates, None)
+            if name is not None:
+                attempted.append(name)
+                pending[self._submit(name, text)] = name
+            return name
+
+        start_next()
+        while pending:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                break
+            can_hedge = self.hedge and len(pending) == 1 and not hedge_exhausted
+            wait_for = min(remaining, self.hedge_delay(*pending.values())) if can_hedge else remaining
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Past the p95: hedge with the next provider, if there is one
+                if can_hedge and start_next() is None:
+                    hedge_exhausted = True
+                continue
+
+            for future in done:
+                pending.pop(future)
+                result = future.result()
+                if "error" in result and not result.get("clauses"):
+                    errors.append(result["error"])
+                    continue
+                if len(attempted) > 1:
+                    result["routing"] = {"attempted": attempted, "failed": errors}
+                return result
+
+            if not pending:
+                # Failover to the next provider
+                start_next()
+
+        for future, name in pending.items():
+            # A queued call is dropped; a running one is ended by the SDK timeout
+            if future.cancel():
+                with self._in_flight_lock:
+                    self._in_flight[name] -= 1
+            self.breakers[name].record_failure()
+            errors.append(f"{name}: timed out after {self.timeout:g}s")
+        return self._failed(errors)
+
+    def stream(self, text):
+        """
+        Yield the answer's text deltas from the first provider that starts one.
+
+        Providers pass the same breaker, rate-limit and pool checks as in
+        extract(). One that fails before its first delta counts as a failure
+        and the next is tried; after that the error is raised, since the
+        caller has already passed deltas on. Returns {"provider": name} (with
+        "routing" after a failover) or an error dict.
+        """
+        if not self.stream_providers:
+            return self._no_providers()
+
+        errors = []
+        attempted = []
+        for name in self._available(self.stream_providers):
+            attempted.append(name)
+            breaker = self.breakers[name]
+            deltas = iter(self.stream_providers[name](text))
+            try:
+                first = next(deltas, None)
+            except Exception as e:
+                breaker.record_failure()
+                errors.append(f"{name}: {e}")
+                continue
+            try:
+                if first is not None:
+                    yield first
+                    yield from deltas
+            except GeneratorExit:
+                # The client went away; that says nothing about the provider
+                breaker.release()
+                raise
+            except Exception:
+                breaker.record_failure()
+                raise
+            finally:
+                if hasattr(deltas, "close"):
+                    deltas.close()
+            breaker.record_success()
+            outcome = {"provider": name}
+            if len(attempted) > 1:
+                outcome["routing"] = {"attempted": attempted, "failed": errors}
+            return outcome
+        return self._failed(errors)
+
+    async def extract_async(self, text):
+        """extract() on the event loop: same failover, hedging and timeout."""
+        if not self.providers:
+            return self._no_providers()
+
+        errors = []
+        attempted = []
+        candidates = self._available_async()
+        pending = {}  # task -> provider name
+        deadline = self._clock() + self.timeout
+        hedge_exhausted = False
+
+        async def start_next():
+            name = await anext(candidates, None)
+            if name is not None:
+                attempted.append(name)
+                pending[asyncio.ensure_future(self._call_async(name, text))] = name
+            return name
+
+        await start_next()
+        while pending:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                break
+            can_hedge = self.hedge and len(pending) == 1 and not hedge_exhausted
+            wait_for = min(remaining, self.hedge_delay(*pending.values())) if can_hedge else remaining
+            done, _ = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                if can_hedge and await start_next() is None:
+                    hedge_exhausted = True
+                continue
+
+            for task in done:
+                pending.pop(task)
+                result = task.result()
+                if "error" in result and not result.get("clauses"):
+                    errors.append(result["error"])
+                    continue
+                # A hedged loser is left to finish so its latency is recorded
+                for other in pending:
+                    self._background.add(other)
+                    other.add_done_callback(self._background.discard)
+                if len(attempted) > 1:
+                    result["routing"] = {"attempted": attempted, "failed": errors}
+                return result
+
+            if not pending:
+                await start_next()
+
+        for task, name in pending.items():
+            task.cancel()
+            self.breakers[name].record_failure()
+            errors.append(f"{name}: timed out after {self.timeout:g}s")
+        return self._failed(errors)
+
+
+def build_router(config, providers, async_providers=None, stream_providers=None):
+    """Create a router from app config for the given {name: callable} providers."""
+    rate_limiter = None
+    per_minute = config.get("PROVIDER_RATE_LIMIT_PER_MINUTE") or 0
+    if per_minute > 0:
+        path = config.get("PROVIDER_RATE_LIMIT_DB") or os.path.join(
+            tempfile.gettempdir(), "agreementtracker-ratelimit.sqlite3"
+        )
+        rate_limiter = SQLiteTokenBucket(
+            path, per_minute / 60.0, config.get("PROVIDER_RATE_LIMIT_BURST") or per_minute
+        )
+    return ProviderRouter(
+        providers,
+        hedge=config.get("EXTRACTION_HEDGE", False),
+        hedge_default_delay=config.get("EXTRACTION_HEDGE_DEFAULT_DELAY", 5.0),
+        timeout=config.get("PROVIDER_TIMEOUT_SECONDS", 120.0),
+        breaker_failures=config.get("PROVIDER_BREAKER_FAILURES", 5),
+        breaker_reset_seconds=config.get("PROVIDER_BREAKER_RESET_SECONDS", 30.0),
+        rate_limiter=rate_limiter,
+        async_providers=async_providers,
+        stream_providers=stream_providers,
+    )
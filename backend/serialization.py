@@ -0,0 +1,102 @@
+"""
+JSON Serialization
+
+A Flask JSON provider that serializes Decimal, date and datetime values
+natively, so model to_dict() methods can hand over raw column values.
+Numeric columns are sent as numbers whatever their value: a zero rate or
+amount is 0.0, and only a NULL column is null.
+
+with_text_refs() rewrites a payload so each distinct clause text is sent
+once, for responses where the same boilerplate repeats across clauses.
+
+Uses orjson when it is installed and falls back to the standard library.
+Both encoders turn non-string dict keys (e.g. ids) into strings.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+except ImportError:
+    ORJSON_AVAILABLE = False
+    ORJSON_OPTIONS = 0
+
+
+def json_default(value):
+    """Convert values the JSON encoders don't handle on their own."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj, use_orjson=None):
+    """Serialize to UTF-8 JSON bytes using the fastest available encoder."""
+    if use_orjson is None:
+        use_orjson = ORJSON_AVAILABLE
+    if use_orjson:
+        return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+    return json.dumps(
+        obj, default=json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def with_text_refs(payload, field="clauseText"):
+    """
+    Copy of payload with each distinct `field` string sent once.
+
+    Every {"clauseText": text} becomes {"clauseTextRef": n}, where n indexes
+    a "clauseTexts" list added at the top level. A list payload is wrapped
+    as {"items": [...], "clauseTexts": [...]}.
+    """
+    texts, refs = [], {}
+
+    def walk(value):
+        if isinstance(value, dict):
+            out = {}
+            for key, item in value.items():
+                if key == field and isinstance(item, str):
+                    if item not in refs:
+                        refs[item] = len(texts)
+                        texts.append(item)
+                    out[field + "Ref"] = refs[item]
+                else:
+                    out[key] = walk(item)
+            return out
+        if isinstance(value, list):
+            return [walk(item) for item in value]
+        return value
+
+    body = walk(payload)
+    if isinstance(body, dict):
+        return {**body, field + "s": texts}
+    return {"items": body, field + "s": texts}
+
+
+class FastJSONProvider(JSONProvider):
+    """JSON provider used by jsonify() and request.get_json()."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        if ORJSON_AVAILABLE and not kwargs:
+            return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS).decode("utf-8")
+        kwargs.setdefault("default", json_default)
+        kwargs.setdefault("ensure_ascii", False)
+        kwargs.setdefault("separators", (",", ":"))
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if ORJSON_AVAILABLE and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,246 @@
+"""
+Shared Response Cache
+
+A cache tier shared by every worker process on a host, for the hot read
+endpoints (investor, document, effective terms). Under gunicorn each worker
+is its own process, so an in-process memo would be duplicated per worker and
+go stale independently.
+
+The store is a client with a small Redis-compatible surface (get, set with
+ex=, delete, sadd, smembers, flushdb). By default it is SQLiteCache, a
+SQLite file in the temp directory that all local workers open; set
+CACHE_URL=redis://... to use a Redis server instead (needs the redis
+package).
+
+Entries are keyed by the resource's ETag, which already changes whenever the
+resource does, so a stale entry is never served. Keys are prefixed with a
+hash of SQLALCHEMY_DATABASE_URI: apps on one host backed by different
+databases (dev and staging, or a test run) share the store but never each
+other's entries, even where ids and timestamps coincide. Each entry is also tagged
+with its investor, and investors_changed() drops every entry under the
+investor after a write, so replaced versions don't sit in the cache until
+they are evicted. SQLiteCache evicts least recently used entries beyond
+CACHE_MAX_ENTRIES, and entries expire after CACHE_TTL_SECONDS either way.
+A read refreshes an entry's last access time only once it is
+CACHE_TOUCH_INTERVAL_SECONDS old, so hot entries are served without a write.
+"""
+
+import hashlib
+import importlib
+import importlib.util
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from flask import current_app
+
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class SQLiteCache:
+    """
+    Redis-style key/value and set commands over a SQLite file.
+
+    Safe across processes (SQLite locking) and threads (one connection per
+    process, used under a lock). Values come back as bytes, as from Redis.
+    Recency is tracked to touch_interval seconds: eviction order among
+    entries read within that window of each other is arbitrary.
+    """
+
+    def __init__(self, path, max_entries=10000, clock=time.time, touch_interval=60.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # A connection inherited across fork (gunicorn --preload) can't be reused
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   check_same_thread=False)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, "
+                "value BLOB NOT NULL, expires_at REAL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires ON cache_entries (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_sets (key TEXT NOT NULL, member TEXT NOT NULL, "
+                "PRIMARY KEY (key, member))"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed FROM cache_entries WHERE key = ?", (_text(key),)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                conn.execute("DELETE FROM cache_entries WHERE key = ?", (_text(key),))
+                return None
+            if now - row[2] >= self.touch_interval:
+                conn.execute("UPDATE cache_entries SET accessed = ? WHERE key = ?", (now, _text(key)))
+            return bytes(row[0])
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        now = self._clock()
+        expires_at = now + ex if ex else None
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO cache_entries (key, value, expires_at, accessed) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                    "expires_at = excluded.expires_at, accessed = excluded.accessed",
+                    (_text(key), value, expires_at, now),
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE key IN "
+                "(SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)", (excess,)
+            )
+
+    def delete(self, *keys):
+        if not keys:
+            return 0
+        names = [_text(key) for key in keys]
+        marks = ",".join("?" * len(names))
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = conn.execute(f"DELETE FROM cache_entries WHERE key IN ({marks})", names).rowcount
+            deleted += conn.execute(
+                f"SELECT COUNT(DISTINCT key) FROM cache_sets WHERE key IN ({marks})", names
+            ).fetchone()[0]
+            conn.execute(f"DELETE FROM cache_sets WHERE key IN ({marks})", names)
+            conn.execute("COMMIT")
+        return deleted
+
+    def sadd(self, key, *members):
+        with self._lock:
+            conn = self._connection()
+            return conn.executemany(
+                "INSERT OR IGNORE INTO cache_sets (key, member) VALUES (?, ?)",
+                [(_text(key), _text(member)) for member in members],
+            ).rowcount
+
+    def smembers(self, key):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT member FROM cache_sets WHERE key = ?", (_text(key),)
+            ).fetchall()
+        return {row[0].encode("utf-8") for row in rows}
+
+    def flushdb(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache_entries")
+            conn.execute("DELETE FROM cache_sets")
+        return True
+
+
+class SharedCache:
+    """Tagged cache entries on top of a Redis-compatible client."""
+
+    def __init__(self, client, prefix="agreementtracker:", ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, tags=()):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+        for tag in tags:
+            self.client.sadd(self.prefix + "tag:" + tag, key)
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying any of the tags."""
+        for tag in tags:
+            tag_key = self.prefix + "tag:" + tag
+            keys = [self.prefix + _text(key) for key in self.client.smembers(tag_key)]
+            self.client.delete(*keys, tag_key)
+
+
+def investor_tag(investor_id):
+    return f"investor:{investor_id}"
+
+
+def cached_render(key, investor_id, render):
+    """
+    Wrap a JSON render callable for conditional() with the shared cache.
+
+    key must change with the resource (use its ETag). Only 200 responses are
+    stored. If the cache store fails, the response is rendered as usual.
+    """
+    cache = current_app.extensions.get("shared_cache")
+    if cache is None:
+        return render
+
+    def render_cached():
+        try:
+            body = cache.get(key)
+        except Exception as e:
+            current_app.logger.warning("Shared cache read failed: %s", e)
+            return render()
+        if body is not None:
+            return current_app.response_class(body, mimetype="application/json")
+        response = render()
+        if response.status_code == 200:
+            try:
+                cache.set(key, response.get_data(), tags=[investor_tag(investor_id)])
+            except Exception as e:
+                current_app.logger.warning("Shared cache write failed: %s", e)
+        return response
+
+    return render_cached
+
+
+def build_cache(config):
+    """SharedCache for app config, or None when CACHE_ENABLED is off."""
+    if not config.get("CACHE_ENABLED", True):
+        return None
+    url = config.get("CACHE_URL") or os.path.join(
+        tempfile.gettempdir(), "agreementtracker-cache.sqlite3"
+    )
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("CACHE_URL points at Redis but the redis package is not installed")
+        client = importlib.import_module("redis").Redis.from_url(url)
+    else:
+        client = SQLiteCache(url, max_entries=config.get("CACHE_MAX_ENTRIES", 10000),
+                             touch_interval=config.get("CACHE_TOUCH_INTERVAL_SECONDS", 60))
+    database = config.get("SQLALCHEMY_DATABASE_URI") or ""
+    prefix = f"agreementtracker:{hashlib.sha1(database.encode('utf-8')).hexdigest()[:12]}:"
+    return SharedCache(client, prefix=prefix, ttl=config.get("CACHE_TTL_SECONDS", 300))
@@ -0,0 +1,299 @@
+"""
+Columnar Snapshot Export
+
+Writes investors, documents, clauses and the resolved effective terms as
+columnar tables for offline analysis. The default format is Arrow IPC files,
+which can be memory-mapped (pyarrow.memory_map + pyarrow.ipc.open_file).
+Parquet is also supported.
+
+Rows are read with yield_per and written one record batch at a time, so
+memory stays bounded by the batch size whatever the size of the book.
+Effective terms are resolved one batch of investors at a time.
+
+Every export records a snapshot version: the investor listing validator,
+which changes on any write (see http_cache). It goes in each file's schema
+metadata and in manifest.json. The manifest is written last, so a directory
+without one is incomplete, and only once the version read after the last
+table still matches, so the files agree with it.
+
+pyarrow is optional and only imported when an export runs, so it adds
+nothing to worker startup; without it the export command and endpoint
+report that it is missing.
+"""
+
+import importlib
+import importlib.util
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import select
+
+from analytics import resolve_winners
+from http_cache import listing_validators
+from models import db, Investor, Document, Clause
+
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_BATCH_SIZE = 10000
+# Exports are rewritten when a write lands while the tables are being read
+SNAPSHOT_ATTEMPTS = 3
+SNAPSHOT_FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+# Column types are named here and mapped to Arrow types on use, so this
+# module imports without pyarrow. Numeric columns are exported as float64.
+TABLES = {
+    "investors": [
+        ("id", Investor.id, "int64"),
+        ("name", Investor.name, "string"),
+        ("investor_type", Investor.investor_type, "string"),
+        ("commitment_amount", Investor.commitment_amount, "float64"),
+        ("currency", Investor.currency, "string"),
+        ("fund", Investor.fund, "string"),
+        ("relationship_notes", Investor.relationship_notes, "string"),
+        ("internal_notes", Investor.internal_notes, "string"),
+        ("created_at", Investor.created_at, "timestamp"),
+        ("updated_at", Investor.updated_at, "timestamp"),
+    ],
+    "documents": [
+        ("id", Document.id, "int64"),
+        ("investor_id", Document.investor_id, "int64"),
+        ("title", Document.title, "string"),
+        ("doc_type", Document.doc_type, "string"),
+        ("status", Document.status, "string"),
+        ("effective_date", Document.effective_date, "date"),
+        ("supersedes_id", Document.supersedes_id, "int64"),
+        ("priority", Document.priority, "int32"),
+        ("file_name", Document.file_name, "string"),
+        ("file_url", Document.file_url, "string"),
+        ("source_text", Document.source_text, "string"),
+        ("created_at", Document.created_at, "timestamp"),
+        ("updated_at", Document.updated_at, "timestamp"),
+    ],
+    "clauses": [
+        ("id", Clause.id, "int64"),
+        ("document_id", Clause.document_id, "int64"),
+        ("clause_type", Clause.clause_type, "string"),
+        ("clause_text", Clause.clause_text, "string"),
+        ("rate", Clause.rate, "float64"),
+        ("threshold", Clause.threshold, "string"),
+        ("threshold_amount", Clause.threshold_amount, "float64"),
+        ("discount", Clause.discount, "float64"),
+        ("effective_date", Clause.effective_date, "date"),
+        ("notes", Clause.notes, "string"),
+        ("page_number", Clause.page_number, "int32"),
+        ("section_ref", Clause.section_ref, "string"),
+        ("created_at", Clause.created_at, "timestamp"),
+    ],
+}
+
+EFFECTIVE_TERMS_COLUMNS = [
+    ("investor_id", "int64"),
+    ("clause_type", "string"),
+    ("clause_id", "int64"),
+    ("document_id", "int64"),
+    ("priority", "int32"),
+    ("rate", "float64"),
+    ("discount", "float64"),
+    ("threshold", "string"),
+    ("threshold_amount", "float64"),
+    ("effective_date", "date"),
+    ("document_effective_date", "date"),
+]
+
+TABLE_NAMES = tuple(TABLES) + ("effective_terms",)
+
+
+def _pyarrow():
+    return importlib.import_module("pyarrow")
+
+
+def _arrow_type(name):
+    pa = _pyarrow()
+    return {
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "string": pa.string(),
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+    }[name]
+
+
+def table_schema(table, version):
+    pa = _pyarrow()
+    if table == "effective_terms":
+        columns = EFFECTIVE_TERMS_COLUMNS
+    else:
+        columns = [(name, type_name) for name, _, type_name in TABLES[table]]
+    metadata = {
+        "snapshot_version": version,
+        "snapshot_format_version": str(SNAPSHOT_FORMAT_VERSION),
+        "table": table,
+    }
+    return pa.schema([(name, _arrow_type(type_name)) for name, type_name in columns], metadata=metadata)
+
+
+def _to_batch(schema, rows):
+    pa = _pyarrow()
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_floating(field.type):
+            # Numeric columns arrive as Decimal
+            values = [float(v) if v is not None else None for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _table_rows(table, batch_size):
+    columns = [column for _, column, _ in TABLES[table]]
+    statement = select(*columns).order_by(columns[0]).execution_options(yield_per=batch_size)
+    for partition in db.session.execute(statement).partitions():
+        yield partition
+
+
+def _by_type(item):
+    return item[0] or ""
+
+
+def _effective_terms_rows(batch_size):
+    """Resolve investors in id batches; yields lists of effective-term rows."""
+    investor_ids = db.session.scalars(select(Investor.id).order_by(Investor.id)).all()
+    # Investors have a handful of terms each, so batch by investor count
+    step = max(batch_size // 10, 1)
+    for start in range(0, len(investor_ids), step):
+        chunk = investor_ids[start:start + step]
+        documents = db.session.execute(
+            select(Document.id, Document.investor_id, Document.priority,
+                   Document.effective_date, Document.supersedes_id)
+            .where(Document.investor_id.in_(chunk))
+        ).all()
+        clauses = db.session.execute(
+            select(Clause.id, Clause.document_id, Clause.clause_type, Clause.rate,
+                   Clause.discount, Clause.threshold, Clause.threshold_amount,
+                   Clause.effective_date)
+            .join(Document, Clause.document_id == Document.id)
+            .where(Document.investor_id.in_(chunk))
+        )
+        winners, _ = resolve_winners(documents, clauses)
+
+        rows = []
+        for investor_id in chunk:
+            for clause_type, winner in sorted(winners.get(investor_id, {}).items(), key=_by_type):
+                clause = winner.payload
+                rows.append((
+                    investor_id, clause_type, clause.id, clause.document_id, winner.priority,
+                    clause.rate, clause.discount, clause.threshold, clause.threshold_amount,
+                    clause.effective_date, winner.effective_date,
+                ))
+        yield rows
+
+
+def record_batches(table, version, batch_size=SNAPSHOT_BATCH_SIZE):
+    """Yield the schema, then RecordBatches of at most ~batch_size rows."""
+    schema = table_schema(table, version)
+    yield schema
+    if table == "effective_terms":
+        row_batches = _effective_terms_rows(batch_size)
+    else:
+        row_batches = _table_rows(table, batch_size)
+    for rows in row_batches:
+        if rows:
+            yield _to_batch(schema, rows)
+
+
+def snapshot_version():
+    """Current book version, shared with the investor listing ETag."""
+    return listing_validators()
+
+
+def write_snapshot(output_dir, fmt="arrow", batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Write every table to output_dir and then manifest.json.
+
+    Returns the manifest. Tables are read with separate statements, so the
+    files only match snapshotVersion if nothing was written meanwhile: on
+    PostgreSQL the export runs in one REPEATABLE READ transaction when it
+    can start one, and everywhere the version is read again at the end and
+    the tables are rewritten (up to SNAPSHOT_ATTEMPTS times) if it moved.
+    """
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed")
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format: {fmt}")
+
+    pa = _pyarrow()
+    pq = importlib.import_module("pyarrow.parquet")
+    os.makedirs(output_dir, exist_ok=True)
+    if db.session.get_bind().dialect.name == "postgresql" and not db.session.in_transaction():
+        db.session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+    for _ in range(SNAPSHOT_ATTEMPTS):
+        version, last_modified = snapshot_version()
+        manifest = {
+            "snapshotVersion": version,
+            "formatVersion": SNAPSHOT_FORMAT_VERSION,
+            "format": fmt,
+            "lastModified": last_modified.isoformat() if last_modified else None,
+            "generatedAt": datetime.utcnow().isoformat(),
+            "tables": {},
+        }
+
+        for table in TABLE_NAMES:
+            file_name = table + SNAPSHOT_FORMATS[fmt]
+            batches = record_batches(table, version, batch_size)
+            schema = next(batches)
+            rows = 0
+            path = os.path.join(output_dir, file_name)
+            if fmt == "arrow":
+                writer = pa.ipc.new_file(path, schema)
+            else:
+                writer = pq.ParquetWriter(path, schema)
+            with writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+            manifest["tables"][table] = {"file": file_name, "rows": rows}
+
+        if snapshot_version()[0] == version:
+            with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=2)
+            return manifest
+    raise RuntimeError(f"The book changed during each of {SNAPSHOT_ATTEMPTS} export attempts")
+
+
+class _ChunkSink:
+    """Write target for an IPC stream writer that hands back what was written."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def arrow_stream(table, version, batch_size=SNAPSHOT_BATCH_SIZE):
+    """Encode one table as an Arrow IPC stream, yielding bytes per batch."""
+    pa = _pyarrow()
+    batches = record_batches(table, version, batch_size)
+    schema = next(batches)
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,136 @@
+"""
+Supersedes Graph
+
+Resolves amendment chains across an investor's documents. An edge A -> B
+means document A supersedes document B (A.supersedes_id == B.id); each
+document supersedes at most one other, so chains are walked in linear time.
+
+For every document the graph records:
+- depth: how many documents it transitively supersedes (originals are 0)
+- superseded_by: the document that directly supersedes it
+- latest: the document at the head of its chain, i.e. the one in force
+and a topological order with superseding documents before the ones they
+replace. Cycles raise SupersedesCycleError.
+
+Graphs are cached per (investor, version) so repeated resolutions of long
+chains don't redo the walk.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class SupersedesCycleError(ValueError):
+    """Raised when supersedes links form a loop (e.g. A -> B -> A)."""
+
+    def __init__(self, cycle):
+        self.cycle = cycle
+        path = " -> ".join(str(doc_id) for doc_id in cycle + cycle[:1])
+        super().__init__(f"Supersedes cycle detected between documents {path}")
+
+
+class SupersedesGraph:
+    """Transitive supersedes information for one set of documents."""
+
+    __slots__ = ("depth", "superseded_by", "latest", "order")
+
+    def __init__(self, depth, superseded_by, latest, order):
+        self.depth = depth
+        self.superseded_by = superseded_by
+        self.latest = latest
+        self.order = order
+
+    def is_superseded(self, doc_id):
+        return doc_id in self.superseded_by
+
+
+def build_supersedes_graph(supersedes):
+    """
+    Build the graph from {doc_id: supersedes_id or None}.
+
+    Links to documents outside the mapping (another investor's, or ones
+    filtered out by an as-of date) are ignored.
+    """
+    edges = {
+        doc_id: target for doc_id, target in supersedes.items()
+        if target is not None and target in supersedes
+    }
+
+    # Direct superseder of each document; first one wins if several claim it
+    superseded_by = {}
+    for doc_id, target in edges.items():
+        superseded_by.setdefault(target, doc_id)
+
+    # depth(doc) = depth(target) + 1, computed by walking each chain once
+    UNVISITED, IN_PROGRESS, DONE = 0, 1, 2
+    state = dict.fromkeys(supersedes, UNVISITED)
+    depth = {}
+    for start in supersedes:
+        if state[start] == DONE:
+            continue
+        path = []
+        node = start
+        while node is not None and state[node] == UNVISITED:
+            state[node] = IN_PROGRESS
+            path.append(node)
+            node = edges.get(node)
+        if node is not None and state[node] == IN_PROGRESS:
+            raise SupersedesCycleError(path[path.index(node):])
+        base = depth[node] + 1 if node is not None else 0
+        for offset, doc_id in enumerate(reversed(path)):
+            depth[doc_id] = base + offset
+            state[doc_id] = DONE
+
+    # latest: follow superseded_by upward to the head of each chain
+    latest = {}
+    for doc_id in supersedes:
+        path = []
+        node = doc_id
+        while node not in latest and node in superseded_by:
+            path.append(node)
+            node = superseded_by[node]
+        head = latest.get(node, node)
+        latest[node] = head
+        for visited in path:
+            latest[visited] = head
+
+    # Deepest (most recent amendment) first: superseding before superseded
+    buckets = {}
+    for doc_id in supersedes:
+        buckets.setdefault(depth[doc_id], []).append(doc_id)
+    order = [doc_id for level in sorted(buckets, reverse=True) for doc_id in buckets[level]]
+
+    return SupersedesGraph(depth, superseded_by, latest, order)
+
+
+class SupersedesGraphCache:
+    """Small thread-safe LRU of graphs keyed by (investor_id, version)."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._graphs = OrderedDict()
+
+    def get_or_build(self, investor_id, version, supersedes):
+        key = (investor_id, version)
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is not None:
+                self._graphs.move_to_end(key)
+                return graph
+
+        graph = build_supersedes_graph(supersedes)
+
+        with self._lock:
+            self._graphs[key] = graph
+            self._graphs.move_to_end(key)
+            while len(self._graphs) > self.maxsize:
+                self._graphs.popitem(last=False)
+        return graph
+
+    def clear(self):
+        with self._lock:
+            self._graphs.clear()
+
+
+graph_cache = SupersedesGraphCache()
@@ -8,115 +8,73 @@ Priority Rules:
 1. Document type hierarchy: Amendment (4) > Side Letter (3) > Fee Schedule (3) > Subscription (2) > PPM (1)
 2. For same priority: Most recent effective date wins
 3. Supersedes relationship: If doc A supersedes doc B, A's clauses override B's
+
+The ranking itself lives in terms_resolution; this module loads documents,
+builds candidates and formats the results.
 """
 
-from collections import defaultdict
-from datetime import date
-from models import Document, Clause
+from sqlalchemy.orm import selectinload
+from models import Document
+from supersedes_graph import build_supersedes_graph, graph_cache
+from terms_resolution import Candidate, resolve
 
 
-def calculate_effective_terms(investor_id):
+def calculate_effective_terms(investor_id, as_of=None, version=None):
     """
     Calculate the effective terms for an investor by resolving conflicts
     across all their documents.
     
+    Pass the investor's updated_at as `version` to reuse a cached
+    supersedes graph. Raises SupersedesCycleError on circular supersedes links.
+    
     Returns a dict with:
     - terms: Dict of clause_type -> winning clause info
     - overridden: Dict of clause_type -> list of overridden clauses
     """
-    # Get all documents for this investor, ordered by priority desc, then date desc
-    documents = Document.query.filter_by(investor_id=investor_id).all()
+    documents = (
+        Document.query
+        .filter_by(investor_id=investor_id)
+        .options(selectinload(Document.clauses))
+        .all()
+    )
+    return effective_terms_for_documents(
+        documents, as_of=as_of, cache_key=(investor_id, version) if version else None
+    )
+
+
+def effective_terms_for_documents(documents, as_of=None, cache_key=None):
+    """
+    Resolve effective terms from already-loaded documents (with clauses).
+    
+    If as_of is given, documents with a later effective date are ignored,
+    giving the terms that were in force on that date.
+    """
+    if as_of is not None:
+        documents = [
+            doc for doc in documents
+            if doc.effective_date is None or doc.effective_date <= as_of
+        ]
     
     if not documents:
         return {"terms": {}, "overridden": {}, "summary": {}}
     
-    # Build supersedes map (doc_id -> superseded_doc_id)
-    supersedes_map = {}
-    superseded_by_map = {}  # reverse: doc_id -> doc that supersedes it
-    for doc in documents:
-        if doc.supersedes_id:
-            supersedes_map[doc.id] = doc.supersedes_id
-            superseded_by_map[doc.supersedes_id] = doc.id
+    supersedes = {doc.id: doc.supersedes_id for doc in documents}
+    if cache_key is not None and as_of is None:
+        graph = graph_cache.get_or_build(*cache_key, supersedes)
+    else:
+        graph = build_supersedes_graph(supersedes)
     
-    # Collect all clauses grouped by type
-    clauses_by_type = defaultdict(list)
+    candidates = build_candidates(documents, graph)
     
-    for doc in documents:
-        for clause in doc.clauses:
-            clauses_by_type[clause.clause_type].append({
-                "clause": clause,
-                "document": doc,
-                "priority": doc.priority,
-                "effective_date": doc.effective_date,
-                "is_superseded": doc.id in superseded_by_map,
-                "superseded_by_doc_id": superseded_by_map.get(doc.id),
-            })
-    
-    # Resolve conflicts for each clause type
     effective_terms = {}
     overridden_terms = {}
     
-    for clause_type, candidates in clauses_by_type.items():
-        if not candidates:
-            continue
-        
-        # Filter out superseded documents (unless they're the only source)
-        active_candidates = [c for c in candidates if not c["is_superseded"]]
-        if not active_candidates:
-            active_candidates = candidates  # Fall back to superseded if no active
-        
-        # Sort by priority (desc), then effective_date (desc, nulls last)
-        def sort_key(c):
-            priority = c["priority"] or 0
-            eff_date = c["effective_date"] or date.min
-            return (-priority, -eff_date.toordinal() if eff_date != date.min else float('inf'))
-        
-        sorted_candidates = sorted(active_candidates, key=sort_key)
-        
-        # Winner is the first one
-        winner = sorted_candidates[0]
-        losers = sorted_candidates[1:] + [c for c in candidates if c["is_superseded"] and c not in sorted_candidates]
-        
-        # Build the effective term entry
-        effective_terms[clause_type] = {
-            "clauseId": winner["clause"].id,
-            "clauseType": clause_type,
-            "rate": float(winner["clause"].rate) if winner["clause"].rate else None,
-            "discount": float(winner["clause"].discount) if winner["clause"].discount else None,
-            "threshold": winner["clause"].threshold,
-            "thresholdAmount": float(winner["clause"].threshold_amount) if winner["clause"].threshold_amount else None,
-            "effectiveDate": winner["clause"].effective_date.isoformat() if winner["clause"].effective_date else None,
-            "clauseText": winner["clause"].clause_text,
-            "notes": winner["clause"].notes,
-            "sectionRef": winner["clause"].section_ref,
-            "source": {
-                "documentId": winner["document"].id,
-                "documentTitle": winner["document"].title,
-                "documentType": winner["document"].doc_type,
-                "priority": winner["priority"],
-                "effectiveDate": winner["document"].effective_date.isoformat() if winner["document"].effective_date else None,
-            }
-        }
-        
-        # Build overridden list
+    for clause_type, (winner, losers) in resolve(candidates).items():
+        effective_terms[clause_type] = format_effective_term(clause_type, winner)
         if losers:
-            overridden_terms[clause_type] = []
-            for loser in losers:
-                overridden_terms[clause_type].append({
-                    "clauseId": loser["clause"].id,
-                    "rate": float(loser["clause"].rate) if loser["clause"].rate else None,
-                    "discount": float(loser["clause"].discount) if loser["clause"].discount else None,
-                    "threshold": loser["clause"].threshold,
-                    "clauseText": loser["clause"].clause_text,
-                    "source": {
-                        "documentId": loser["document"].id,
-                        "documentTitle": loser["document"].title,
-                        "documentType": loser["document"].doc_type,
-                        "priority": loser["priority"],
-                        "effectiveDate": loser["document"].effective_date.isoformat() if loser["document"].effective_date else None,
-                    },
-                    "reason": get_override_reason(winner, loser),
-                })
+            overridden_terms[clause_type] = [
+                format_overridden_term(loser, winner) for loser in losers
+            ]
     
     # Build summary for quick display
     summary = build_terms_summary(effective_terms)
@@ -128,17 +86,87 @@ def calculate_effective_terms(investor_id):
     }
 
 
+def build_candidates(documents, graph):
+    """Turn ORM documents and clauses into resolution candidates."""
+    candidates = []
+    for doc in documents:
+        # Point superseded documents at the head of their amendment chain
+        superseded_by = graph.latest[doc.id] if graph.is_superseded(doc.id) else None
+        for clause in doc.clauses:
+            candidates.append(Candidate(
+                clause.id,
+                doc.id,
+                clause.clause_type,
+                doc.priority,
+                doc.effective_date,
+                superseded_by=superseded_by,
+                payload=(clause, doc),
+            ))
+    return candidates
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _date(value):
+    return value.isoformat() if value is not None else None
+
+
+def format_source(candidate):
+    """Source document block shared by winning and overridden entries."""
+    _, doc = candidate.payload
+    return {
+        "documentId": doc.id,
+        "documentTitle": doc.title,
+        "documentType": doc.doc_type,
+        "priority": candidate.priority,
+        "effectiveDate": _date(doc.effective_date),
+    }
+
+
+def format_effective_term(clause_type, winner):
+    clause, _ = winner.payload
+    return {
+        "clauseId": clause.id,
+        "clauseType": clause_type,
+        "rate": _float(clause.rate),
+        "discount": _float(clause.discount),
+        "threshold": clause.threshold,
+        "thresholdAmount": _float(clause.threshold_amount),
+        "effectiveDate": _date(clause.effective_date),
+        "clauseText": clause.clause_text,
+        "notes": clause.notes,
+        "sectionRef": clause.section_ref,
+        "source": format_source(winner),
+    }
+
+
+def format_overridden_term(loser, winner):
+    clause, _ = loser.payload
+    return {
+        "clauseId": clause.id,
+        "rate": _float(clause.rate),
+        "discount": _float(clause.discount),
+        "threshold": clause.threshold,
+        "clauseText": clause.clause_text,
+        "source": format_source(loser),
+        "supersededBy": loser.superseded_by,
+        "reason": get_override_reason(winner, loser),
+    }
+
+
 def get_override_reason(winner, loser):
     """Generate a human-readable reason why this clause was overridden."""
-    if loser.get("is_superseded"):
-        return f"Superseded by {winner['document'].title}"
+    if loser.is_superseded:
+        return f"Superseded by {winner.payload[1].title}"
     
-    if winner["priority"] > loser["priority"]:
-        return f"Lower priority document type ({loser['document'].doc_type})"
+    if winner.priority > loser.priority:
+        return f"Lower priority document type ({loser.payload[1].doc_type})"
     
-    if winner["priority"] == loser["priority"]:
-        winner_date = winner["effective_date"]
-        loser_date = loser["effective_date"]
+    if winner.priority == loser.priority:
+        winner_date = winner.effective_date
+        loser_date = loser.effective_date
         if winner_date and loser_date and winner_date > loser_date:
             return f"Older effective date ({loser_date.isoformat()})"
         elif winner_date and not loser_date:
@@ -156,7 +184,7 @@ def build_terms_summary(effective_terms):
         term = effective_terms["Management Fee"]
         rate = term.get("rate")
         summary["managementFee"] = {
-            "value": f"{rate}%" if rate else "—",
+            "value": f"{rate}%" if rate is not None else "—",
             "source": term["source"]["documentTitle"],
             "documentType": term["source"]["documentType"],
         }
@@ -167,7 +195,7 @@ def build_terms_summary(effective_terms):
         threshold = term.get("threshold") or "—"
         discount = term.get("discount")
         value = f"{threshold}" if threshold != "—" else "—"
-        if discount:
+        if discount is not None:
             value = f"−{discount}% at {threshold}" if threshold != "—" else f"−{discount}%"
         summary["feeStepDown"] = {
             "value": value,
@@ -189,7 +217,7 @@ def build_terms_summary(effective_terms):
         term = effective_terms["Carry Terms"]
         rate = term.get("rate")
         summary["carryTerms"] = {
-            "value": f"{rate}%" if rate else "—",
+            "value": f"{rate}%" if rate is not None else "—",
             "source": term["source"]["documentTitle"],
             "documentType": term["source"]["documentType"],
         }
@@ -199,7 +227,7 @@ def build_terms_summary(effective_terms):
         term = effective_terms["Preferred Return"]
         rate = term.get("rate")
         summary["preferredReturn"] = {
-            "value": f"{rate}%" if rate else "—",
+            "value": f"{rate}%" if rate is not None else "—",
             "source": term["source"]["documentTitle"],
             "documentType": term["source"]["documentType"],
         }
@@ -209,7 +237,7 @@ def build_terms_summary(effective_terms):
         term = effective_terms["Fee Waiver/Discount"]
         discount = term.get("discount")
         summary["feeWaiver"] = {
-            "value": f"{discount}% discount" if discount else "—",
+            "value": f"{discount}% discount" if discount is not None else "—",
             "source": term["source"]["documentTitle"],
             "documentType": term["source"]["documentType"],
         }
@@ -0,0 +1,201 @@
+"""
+Effective Terms Change Feed
+
+In-process pub/sub that pushes a compact diff of an investor's winning terms
+to server-sent-event subscribers whenever a write changes them.
+
+Terms are only recomputed for investors that currently have subscribers, so
+writes to everyone else cost nothing extra. A write publishes straight to the
+subscribers of its own process; ChangePoller picks up writes committed by
+other workers (or hosts) from the change log every SSE_POLL_SECONDS.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from models import db, Change
+
+# Fields of a winning term that clients care about; a change to any of them
+# (or to which clause wins) produces an event.
+TERM_FIELDS = ("clauseId", "rate", "discount", "threshold", "thresholdAmount", "effectiveDate")
+
+
+def winners_from_terms(terms):
+    """Reduce calculate_effective_terms()["terms"] to {clause_type: compact term}."""
+    winners = {}
+    for clause_type, term in terms.items():
+        compact = {field: term.get(field) for field in TERM_FIELDS}
+        compact["documentId"] = term["source"]["documentId"]
+        winners[clause_type] = compact
+    return winners
+
+
+def diff_winners(old, new):
+    """List the clause types whose winning term changed, was added or removed."""
+    changes = []
+    for clause_type in sorted(set(old) | set(new)):
+        before, after = old.get(clause_type), new.get(clause_type)
+        if before == after:
+            continue
+        changes.append({
+            "clauseType": clause_type,
+            "previousClauseId": before["clauseId"] if before else None,
+            "term": after,  # None when the clause type no longer applies
+        })
+    return changes
+
+
+def format_sse(event, data):
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """One client's queue of pending events for an investor."""
+
+    def __init__(self, investor_id):
+        self.investor_id = investor_id
+        self.events = queue.Queue()
+
+    def get(self, timeout):
+        """Next (event, data) tuple, or None if nothing arrived within timeout."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class TermsFeed:
+    """
+    Tracks subscribers and the last published winners per investor.
+    
+    max_subscribers caps open streams per process (0 = unlimited): each one
+    holds a worker thread in the WSGI server.
+    """
+
+    def __init__(self, max_subscribers=0):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}  # investor_id -> set of Subscription
+        self._winners = {}  # investor_id -> winners last seen by subscribers
+        self._count = 0
+
+    def subscribe(self, investor_id, current_winners):
+        """Returns the Subscription, or None when the feed is full."""
+        subscription = Subscription(investor_id)
+        with self._lock:
+            if self.max_subscribers and self._count >= self.max_subscribers:
+                return None
+            self._count += 1
+            self._subscribers.setdefault(investor_id, set()).add(subscription)
+            self._winners.setdefault(investor_id, current_winners)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.investor_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            self._count -= 1
+            if not subscribers:
+                del self._subscribers[subscription.investor_id]
+                self._winners.pop(subscription.investor_id, None)
+
+    def has_subscribers(self, investor_id):
+        return investor_id in self._subscribers
+
+    def subscribed_investors(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def investor_changed(self, investor_id, compute_winners):
+        """
+        Called after a committed write under an investor.
+
+        compute_winners is only invoked when someone is listening.
+        """
+        if not self.has_subscribers(investor_id):
+            return None
+
+        new = compute_winners()
+        with self._lock:
+            subscribers = list(self._subscribers.get(investor_id, ()))
+            old = self._winners.get(investor_id, {})
+            changes = diff_winners(old, new)
+            if not changes or not subscribers:
+                return None
+            self._winners[investor_id] = new
+
+        event = ("terms-changed", {"investorId": investor_id, "changes": changes})
+        for subscription in subscribers:
+            subscription.events.put(event)
+        return changes
+
+    def publish(self, investor_id, event, data):
+        """Send one event to the investor's current subscribers."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(investor_id, ()))
+        for subscription in subscribers:
+            subscription.events.put((event, data))
+
+
+class ChangePoller:
+    """
+    Feeds writes committed by other processes into a TermsFeed.
+    
+    Each poll reads the change log past its cursor and calls
+    on_change(investor_id), in an app context, for the investors that have
+    subscribers. investor_changed diffs against what subscribers last saw,
+    so a write this process already published sends no second event.
+    """
+
+    def __init__(self, app, feed, on_change, interval):
+        self.app = app
+        self.feed = feed
+        self.on_change = on_change
+        self.interval = interval  # 0 = no background thread; call poll()
+        self.cursor = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Set the cursor to the end of the log and start polling, once."""
+        with self._lock:
+            if self.cursor is None:
+                with self.app.app_context():
+                    self.cursor = db.session.scalar(select(func.max(Change.id))) or 0
+            if self.interval and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="terms-poller", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                self.app.logger.warning("Terms feed poll failed: %s", e)
+
+    def poll(self):
+        """Publish changes logged since the last poll; returns the investor ids."""
+        with self._lock, self.app.app_context():
+            # Read the end of the log before the subscribers: a subscriber
+            # added after this read sees later entries on the next poll
+            latest = db.session.scalar(select(func.max(Change.id))) or 0
+            investor_ids = self.feed.subscribed_investors()
+            changed = []
+            if investor_ids and self.cursor is not None and latest > self.cursor:
+                changed = db.session.scalars(
+                    select(Change.investor_id).distinct()
+                    .where(Change.id > self.cursor, Change.id <= latest)
+                    .where(Change.investor_id.in_(investor_ids))
+                ).all()
+            self.cursor = latest
+            for investor_id in changed:
+                self.on_change(investor_id)
+            return changed
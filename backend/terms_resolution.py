@@ -0,0 +1,88 @@
+"""
+Terms Resolution Core
+
+The conflict-resolution step of the effective terms engine, kept free of the
+ORM and JSON layers so it can be benchmarked and reused (batch resolution,
+as-of queries).
+
+Each clause is a compact Candidate with a precomputed integer sort key:
+    priority * 2**22 + effective_date ordinal   (0 when undated)
+Date ordinals are < 2**22, so a higher key means higher priority, then the
+more recent effective date, with undated documents last.
+"""
+
+from collections import defaultdict
+
+DATE_BITS = 22
+PRIORITY_WEIGHT = 1 << DATE_BITS
+
+
+def candidate_sort_key(priority, effective_date):
+    """Integer ordering key; larger wins."""
+    ordinal = effective_date.toordinal() if effective_date else 0
+    return (priority or 0) * PRIORITY_WEIGHT + ordinal
+
+
+class Candidate:
+    """One clause competing to be the effective term for its clause type."""
+
+    __slots__ = (
+        "clause_id",
+        "document_id",
+        "clause_type",
+        "priority",
+        "effective_date",
+        "sort_key",
+        "is_superseded",
+        "superseded_by",
+        "payload",
+    )
+
+    def __init__(self, clause_id, document_id, clause_type, priority, effective_date,
+                 superseded_by=None, payload=None):
+        self.clause_id = clause_id
+        self.document_id = document_id
+        self.clause_type = clause_type
+        self.priority = priority or 0
+        self.effective_date = effective_date
+        self.sort_key = candidate_sort_key(priority, effective_date)
+        self.superseded_by = superseded_by
+        self.is_superseded = superseded_by is not None
+        # Opaque reference for the caller (e.g. the ORM rows); never inspected here
+        self.payload = payload
+
+    def __repr__(self):
+        return f"<Candidate clause={self.clause_id} type={self.clause_type!r} key={self.sort_key}>"
+
+
+def _sort_key(candidate):
+    return candidate.sort_key
+
+
+def resolve_group(candidates):
+    """
+    Resolve one clause type. Returns (winner, losers).
+
+    Superseded candidates only win when nothing else is left. Losers are the
+    ranked active candidates after the winner, then any superseded ones.
+    Ties keep input order.
+    """
+    active = [c for c in candidates if not c.is_superseded] or candidates
+    ranked = sorted(active, key=_sort_key, reverse=True)
+
+    ranked_ids = {c.clause_id for c in ranked}
+    losers = ranked[1:] + [c for c in candidates if c.clause_id not in ranked_ids]
+    return ranked[0], losers
+
+
+def resolve(candidates):
+    """Resolve every clause type. Returns {clause_type: (winner, losers)}."""
+    by_type = defaultdict(list)
+    for candidate in candidates:
+        by_type[candidate.clause_type].append(candidate)
+    return {clause_type: resolve_group(group) for clause_type, group in by_type.items()}
+
+
+def resolve_many(candidates_by_key):
+    """Batch form of resolve(), e.g. keyed by investor id."""
+    return {key: resolve(candidates) for key, candidates in candidates_by_key.items()}
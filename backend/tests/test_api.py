@@ -3,15 +3,38 @@ Unit tests for Agreement Tracker API
 Tests all CRUD endpoints for investors, documents, and clauses.
 """
 import pytest
+import asyncio
+import gzip
+import io
 import json
 import sys
 import os
+import sqlite3
+import subprocess
+import threading
+import time
+import zipfile
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import event, insert
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app
-from models import db, User, Investor, Document, Clause
+from config import config
+from demo_data import DEMO_BOOKS, insert_books
+from http_cache import listing_validators
+from models import db, User, Investor, Document, Clause, ClauseText, migrate_clause_texts, record_changes
+from serialization import dumps_bytes
+from snapshot_export import ARROW_AVAILABLE
+from clause_stream import ClauseStreamParser
+import document_versions
+import extraction_service
+from provider_router import CircuitBreaker, ProviderRouter, SQLiteTokenBucket
+from shared_cache import SharedCache, SQLiteCache, build_cache
+from terms_feed import TermsFeed
 
 
 @pytest.fixture
@@ -542,5 +565,2139 @@ class TestEdgeCases:
         assert response.status_code == 404
 
 
+class TestConditionalRequests:
+    """Test ETag / Last-Modified handling on read endpoints."""
+    
+    @pytest.fixture
+    def document(self, client, auth_headers):
+        """Create a test investor and document."""
+        inv_response = client.post('/investors',
+            data=json.dumps({'name': 'ETag Investor', 'investorType': 'LP'}),
+            headers=auth_headers
+        )
+        investor = json.loads(inv_response.data)
+        doc_response = client.post('/documents',
+            data=json.dumps({
+                'investorId': investor['id'],
+                'title': 'ETag Side Letter',
+                'docType': 'Side Letter'
+            }),
+            headers=auth_headers
+        )
+        return json.loads(doc_response.data)
+    
+    def test_etag_returns_304_when_unchanged(self, client, auth_headers, document):
+        """Test that a matching If-None-Match yields 304 with no body."""
+        url = f'/investors/{document["investorId"]}/effective-terms'
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert etag
+        
+        cached = client.get(url, headers={**auth_headers, 'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.data == b''
+        assert cached.headers['ETag'] == etag
+    
+    def test_clause_write_changes_validators(self, client, auth_headers, document):
+        """Test that a clause write invalidates document, investor and terms ETags."""
+        urls = [
+            f'/documents/{document["id"]}',
+            f'/investors/{document["investorId"]}',
+            f'/investors/{document["investorId"]}/effective-terms',
+            f'/documents?investorId={document["investorId"]}',
+        ]
+        before = {url: client.get(url, headers=auth_headers).headers['ETag'] for url in urls}
+        
+        client.post(f'/documents/{document["id"]}/clauses',
+            data=json.dumps({'clauseType': 'Management Fee', 'rate': 1.5}),
+            headers=auth_headers
+        )
+        
+        for url in urls:
+            response = client.get(url, headers={**auth_headers, 'If-None-Match': before[url]})
+            assert response.status_code == 200, url
+            assert response.headers['ETag'] != before[url]
+    
+    def test_listing_last_modified(self, client, auth_headers, document):
+        """Test If-Modified-Since on the document listing."""
+        response = client.get('/documents', headers=auth_headers)
+        assert response.status_code == 200
+        last_modified = response.headers['Last-Modified']
+        
+        cached = client.get('/documents',
+            headers={**auth_headers, 'If-Modified-Since': last_modified})
+        assert cached.status_code == 304
+    
+    def test_investor_delete_changes_listing_etag(self, client, auth_headers, document):
+        """Test that removing an investor changes the unscoped listing ETag."""
+        etag = client.get('/documents', headers=auth_headers).headers['ETag']
+        client.delete(f'/investors/{document["investorId"]}', headers=auth_headers)
+        response = client.get('/documents', headers={**auth_headers, 'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data) == []
+
+
+class TestResponseCompression:
+    """Test negotiated response compression and JSON encoding."""
+    
+    @pytest.fixture
+    def document(self, client, auth_headers):
+        """Create a document large enough to be compressed."""
+        inv_response = client.post('/investors',
+            data=json.dumps({'name': 'Compression Investor', 'investorType': 'LP'}),
+            headers=auth_headers
+        )
+        investor = json.loads(inv_response.data)
+        doc_response = client.post('/documents',
+            data=json.dumps({
+                'investorId': investor['id'],
+                'title': 'Long Side Letter',
+                'docType': 'Side Letter',
+                'effectiveDate': '2024-02-01',
+                'sourceText': 'The Management Fee shall be 1.75% per annum. ' * 200
+            }),
+            headers=auth_headers
+        )
+        return json.loads(doc_response.data)
+    
+    def test_gzip_when_accepted(self, client, auth_headers, document):
+        """Test that large JSON payloads are gzip-encoded on request."""
+        response = client.get(f'/documents/{document["id"]}',
+            headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        data = json.loads(gzip.decompress(response.data))
+        assert data['effectiveDate'] == '2024-02-01'
+    
+    def test_identity_without_accept_encoding(self, client, auth_headers, document):
+        """Test that responses are sent uncompressed by default."""
+        response = client.get(f'/documents/{document["id"]}', headers=auth_headers)
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(response.data)['title'] == 'Long Side Letter'
+    
+    def test_small_payload_not_compressed(self, client, auth_headers):
+        """Test that payloads under the threshold are left alone."""
+        response = client.get('/auth/me', headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+    
+    def test_encoded_etag_revalidates(self, client, auth_headers, document):
+        """Test that the per-encoding ETag still yields a 304."""
+        headers = {**auth_headers, 'Accept-Encoding': 'gzip'}
+        url = f'/documents/{document["id"]}'
+        etag = client.get(url, headers=headers).headers['ETag']
+        assert etag.endswith('-gzip"')
+        
+        cached = client.get(url, headers={**headers, 'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.headers['ETag'] == etag
+    
+    def test_decimal_and_date_encoding(self):
+        """Test that raw column values are encoded by the JSON provider."""
+        payload = {'rate': Decimal('1.7500'), 'effectiveDate': date(2024, 2, 1)}
+        assert json.loads(dumps_bytes(payload, use_orjson=False)) == {
+            'rate': 1.75, 'effectiveDate': '2024-02-01'
+        }
+    
+    def test_orjson_matches_stdlib(self):
+        """Test that the orjson path encodes like the standard library, int keys included."""
+        pytest.importorskip('orjson')
+        payload = {
+            'rate': Decimal('0.0000'), 'effectiveDate': date(2024, 2, 1),
+            'byFund': {7: {'investors': 2}}, 'name': 'Fonds Étoile',
+        }
+        expected = {
+            'rate': 0.0, 'effectiveDate': '2024-02-01',
+            'byFund': {'7': {'investors': 2}}, 'name': 'Fonds Étoile',
+        }
+        assert json.loads(dumps_bytes(payload, use_orjson=True)) == expected
+        assert json.loads(dumps_bytes(payload, use_orjson=False)) == expected
+
+
+class TestStartup:
+    """Test application startup behaviour."""
+    
+    def test_provider_sdks_not_imported_at_startup(self):
+        """Test that importing the app does not load the LLM provider SDKs."""
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, '-c',
+             'import sys, app; print(sorted(m for m in ("anthropic", "openai") if m in sys.modules))'],
+            cwd=backend_dir, env={**os.environ, 'FLASK_ENV': 'testing'},
+            capture_output=True, text=True
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == '[]'
+    
+    def test_init_db_command(self):
+        """Test that schema creation is an explicit CLI step."""
+        app = create_app('testing')
+        with app.app_context():
+            assert 'investors' not in db.inspect(db.engine).get_table_names()
+        
+        result = app.test_cli_runner().invoke(args=['init-db'])
+        assert result.exit_code == 0
+        with app.app_context():
+            assert 'investors' in db.inspect(db.engine).get_table_names()
+
+
+def call_asgi(asgi_app, method, path, body=b'', headers=None):
+    """Drive an ASGI app for one request; returns (status, headers, body)."""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+    
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+    
+    async def send(message):
+        sent.append(message)
+    
+    asyncio.run(asgi_app(scope, receive, send))
+    start = next(m for m in sent if m['type'] == 'http.response.start')
+    payload = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return start['status'], dict(start['headers']), payload
+
+
+class TestAsgiMode:
+    """Test the ASGI entry point."""
+    
+    @pytest.fixture
+    def asgi_app(self, app):
+        from asgi import AgreementTrackerASGI
+        return AgreementTrackerASGI(app, wsgi_threads=2)
+    
+    def test_native_extract_route(self, asgi_app, auth_headers):
+        """Test that POST /extract is served by the async implementation."""
+        body = json.dumps({'text': 'The Management Fee shall be 1.75% per annum. ' * 3, 'mock': True})
+        status, _, payload = call_asgi(asgi_app, 'POST', '/extract', body.encode(), auth_headers)
+        assert status == 200
+        clauses = json.loads(payload)['clauses']
+        assert clauses[0]['clause_type'] == 'Management Fee'
+    
+    def test_extract_requires_token(self, asgi_app):
+        """Test that the async route enforces authentication."""
+        status, _, payload = call_asgi(asgi_app, 'POST', '/extract', b'{}')
+        assert status == 401
+        assert 'error' in json.loads(payload)
+
+    def test_extract_runs_flask_response_hooks(self, app, asgi_app, auth_headers):
+        """Test that the async route gets CORS, compression and Server-Timing like Flask routes."""
+        app.config['SLOW_REQUEST_SAMPLE_RATE'] = 1.0
+        body = json.dumps({'text': 'The Management Fee shall be 1.75% per annum. ' * 100, 'mock': True})
+        status, headers, payload = call_asgi(asgi_app, 'POST', '/extract', body.encode(), {
+            **auth_headers, 'Origin': 'https://app.example.com', 'Accept-Encoding': 'gzip',
+        })
+        app.config['SLOW_REQUEST_SAMPLE_RATE'] = 0.0
+        assert status == 200
+        assert headers[b'access-control-allow-origin'] == b'https://app.example.com'
+        assert headers[b'content-encoding'] == b'gzip'
+        assert int(headers[b'content-length']) == len(payload)
+        assert b'app;dur=' in headers[b'server-timing']
+        assert json.loads(gzip.decompress(payload))['clauses']
+        with app.app_context():
+            assert '/extract' in app.extensions['slow_requests'].snapshot()
+
+    def test_extract_goes_through_router(self, app, asgi_app, auth_headers):
+        """Test that the async route fails over through the app's provider router."""
+        app.extensions['provider_router'] = ProviderRouter({
+            'primary': fake_provider('primary', error=RuntimeError('boom')),
+            'secondary': fake_provider('secondary'),
+        })
+        body = json.dumps({'text': 'The Management Fee shall be 1.75% per annum. ' * 3})
+        status, _, payload = call_asgi(asgi_app, 'POST', '/extract', body.encode(), auth_headers)
+        assert status == 200
+        result = json.loads(payload)
+        assert result['provider'] == 'secondary'
+        assert result['routing']['attempted'] == ['primary', 'secondary']
+        assert app.extensions['provider_router'].status()['secondary']['samples'] == 1
+    
+    def test_extract_prefilters_and_records_metrics(self, app, client, asgi_app, auth_headers):
+        """Test that the async route sends pre-filtered text and records metrics."""
+        prompts = []
+
+        def provider(prompt_text):
+            prompts.append(prompt_text)
+            return {'document_info': {}, 'clauses': [{'clause_type': 'Management Fee', 'rate': 1.5}]}
+
+        app.extensions['provider_router'] = ProviderRouter({'fake': provider})
+        text = boilerplate_document()
+        body = json.dumps({'text': text}).encode()
+        status, _, payload = call_asgi(asgi_app, 'POST', '/extract', body, auth_headers)
+        assert status == 200
+        assert len(prompts[0]) < len(text) / 2
+        assert json.loads(payload)['prefilter']['provider'] == 'fake'
+        metrics = json.loads(client.get('/extract/metrics', headers=auth_headers).data)
+        assert metrics['documents'] >= 1
+    
+    def test_other_routes_served_by_flask(self, asgi_app, auth_headers):
+        """Test that CRUD routes go through the WSGI bridge."""
+        body = json.dumps({'name': 'ASGI Investor'}).encode()
+        status, _, payload = call_asgi(asgi_app, 'POST', '/investors', body, auth_headers)
+        assert status == 201
+        status, headers, payload = call_asgi(asgi_app, 'GET', '/investors', headers=auth_headers)
+        assert status == 200
+        assert headers[b'etag']
+        assert [inv['name'] for inv in json.loads(payload)] == ['ASGI Investor']
+
+
+class TestTermsFeed:
+    """Test the server-sent events feed of effective-terms changes."""
+    
+    @pytest.fixture
+    def document(self, client, auth_headers):
+        """Create a test investor with a PPM fee clause."""
+        inv_response = client.post('/investors',
+            data=json.dumps({'name': 'Feed Investor', 'investorType': 'LP'}),
+            headers=auth_headers
+        )
+        investor = json.loads(inv_response.data)
+        doc_response = client.post('/documents',
+            data=json.dumps({'investorId': investor['id'], 'title': 'Feed PPM', 'docType': 'PPM'}),
+            headers=auth_headers
+        )
+        document = json.loads(doc_response.data)
+        client.post(f'/documents/{document["id"]}/clauses',
+            data=json.dumps({'clauseType': 'Management Fee', 'rate': 2.0}),
+            headers=auth_headers
+        )
+        return document
+    
+    @staticmethod
+    def read_event(chunks):
+        """Read the next non-heartbeat event from a streamed response."""
+        for chunk in chunks:
+            text = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if text.startswith('event:'):
+                event_line, data_line = text.strip().split('\n')
+                return event_line.split(': ', 1)[1], json.loads(data_line.split(': ', 1)[1])
+    
+    def test_stream_pushes_winner_changes(self, client, auth_headers, document):
+        """Test that a side letter overriding the fee produces a diff event."""
+        token = auth_headers['Authorization'].split(' ')[1]
+        response = client.get(
+            f'/investors/{document["investorId"]}/effective-terms/stream?token={token}',
+            buffered=False
+        )
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        chunks = iter(response.response)
+        
+        event, data = self.read_event(chunks)
+        assert event == 'snapshot'
+        assert data['terms']['Management Fee']['rate'] == 2.0
+        
+        side_letter = json.loads(client.post('/documents',
+            data=json.dumps({
+                'investorId': document['investorId'],
+                'title': 'Feed Side Letter',
+                'docType': 'Side Letter'
+            }),
+            headers=auth_headers
+        ).data)
+        client.post(f'/documents/{side_letter["id"]}/clauses',
+            data=json.dumps({'clauseType': 'Management Fee', 'rate': 1.5}),
+            headers=auth_headers
+        )
+        
+        event, data = self.read_event(chunks)
+        assert event == 'terms-changed'
+        assert len(data['changes']) == 1
+        assert data['changes'][0]['clauseType'] == 'Management Fee'
+        assert data['changes'][0]['previousClauseId'] is not None
+        assert data['changes'][0]['term']['rate'] == 1.5
+        assert data['changes'][0]['term']['documentId'] == side_letter['id']
+        response.close()
+    
+    def test_supersedes_cycle_sends_cycle_event(self, app, client, auth_headers, document):
+        """Test that a write leaving a supersedes cycle succeeds and reports the cycle."""
+        token = auth_headers['Authorization'].split(' ')[1]
+        url = f'/investors/{document["investorId"]}/effective-terms/stream'
+        response = client.get(f'{url}?token={token}', buffered=False)
+        chunks = iter(response.response)
+        assert self.read_event(chunks)[0] == 'snapshot'
+        
+        amendment = json.loads(client.post('/documents',
+            data=json.dumps({
+                'investorId': document['investorId'],
+                'title': 'Feed Amendment',
+                'docType': 'Amendment',
+                'supersedesId': document['id']
+            }),
+            headers=auth_headers
+        ).data)
+        with app.app_context():
+            db.session.get(Document, document['id']).supersedes_id = amendment['id']
+            db.session.commit()
+        
+        created = client.post(f'/documents/{amendment["id"]}/clauses',
+            data=json.dumps({'clauseType': 'Carry Terms', 'rate': 20.0}),
+            headers=auth_headers
+        )
+        assert created.status_code == 201
+        event, data = self.read_event(chunks)
+        assert event == 'terms-cycle'
+        assert sorted(data['cycle']) == sorted([document['id'], amendment['id']])
+        response.close()
+        
+        assert client.get(f'{url}?token={token}').status_code == 409
+    
+    def test_stream_requires_token(self, client, document):
+        """Test that the stream rejects unauthenticated clients."""
+        response = client.get(f'/investors/{document["investorId"]}/effective-terms/stream')
+        assert response.status_code == 401
+
+    def test_writes_from_other_processes_arrive_by_polling(self, app, client, auth_headers, document):
+        """Test that a clause committed without this process publishing it reaches the stream."""
+        token = auth_headers['Authorization'].split(' ')[1]
+        response = client.get(
+            f'/investors/{document["investorId"]}/effective-terms/stream?token={token}',
+            buffered=False
+        )
+        chunks = iter(response.response)
+        assert self.read_event(chunks)[0] == 'snapshot'
+        poller = app.extensions['terms_poller']
+        assert poller.poll() == []
+
+        # As another worker would: write and log the change, but nothing is published here
+        with app.app_context():
+            side_letter = Document(investor_id=document['investorId'], title='Remote Side Letter',
+                                   doc_type='Side Letter')
+            db.session.add(side_letter)
+            db.session.flush()
+            clause = Clause(document_id=side_letter.id, clause_type='Management Fee', rate=1.25)
+            db.session.add(clause)
+            db.session.flush()
+            record_changes('document', 'upsert', [side_letter.id])
+            record_changes('clause', 'upsert', [clause.id])
+            db.session.commit()
+
+        assert poller.poll() == [document['investorId']]
+        event, data = self.read_event(chunks)
+        assert event == 'terms-changed'
+        assert data['changes'][0]['term']['rate'] == 1.25
+        # Already published: polling the same entries again sends nothing
+        assert poller.poll() == []
+        response.close()
+
+    def test_subscriber_cap(self, app, client, auth_headers, document):
+        """Test that streams beyond SSE_MAX_SUBSCRIBERS get a 503 until one closes."""
+        app.extensions['terms_feed'].max_subscribers = 1
+        token = auth_headers['Authorization'].split(' ')[1]
+        url = f'/investors/{document["investorId"]}/effective-terms/stream?token={token}'
+        first = client.get(url, buffered=False)
+        assert self.read_event(iter(first.response))[0] == 'snapshot'
+
+        refused = client.get(url)
+        assert refused.status_code == 503
+        assert refused.headers['Retry-After']
+
+        first.close()
+        second = client.get(url, buffered=False)
+        assert second.status_code == 200
+        second.close()
+
+    def test_no_recompute_without_subscribers(self):
+        """Test that writes for idle investors never recompute terms."""
+        feed = TermsFeed()
+        calls = []
+        assert feed.investor_changed(1, lambda: calls.append(1) or {}) is None
+        assert calls == []
+    
+    def test_unchanged_winner_publishes_nothing(self):
+        """Test that a write that keeps the same winner sends no event."""
+        feed = TermsFeed()
+        winners = {'Carry Terms': {'clauseId': 7, 'rate': 20.0, 'documentId': 3}}
+        subscription = feed.subscribe(1, winners)
+        assert feed.investor_changed(1, lambda: dict(winners)) is None
+        assert subscription.get(timeout=0) is None
+        
+        feed.unsubscribe(subscription)
+        assert not feed.has_subscribers(1)
+
+
+class TestBulkDelete:
+    """Test set-based deletes of investors, documents and demo data."""
+
+    def seed_clauses(self, app, n_documents=100, clauses_per_document=100):
+        """Insert an investor with n_documents * clauses_per_document clauses in bulk."""
+        with app.app_context():
+            investor = Investor(name='Large Investor')
+            db.session.add(investor)
+            db.session.flush()
+            db.session.execute(insert(Document), [
+                {'investor_id': investor.id, 'title': f'Doc {i}', 'doc_type': 'Side Letter'}
+                for i in range(n_documents)
+            ])
+            document_ids = [d.id for d in Document.query.filter_by(investor_id=investor.id)]
+            db.session.execute(insert(Clause), [
+                {'document_id': document_id, 'clause_type': 'Management Fee', 'rate': 1.5}
+                for document_id in document_ids for _ in range(clauses_per_document)
+            ])
+            db.session.commit()
+            return investor.id
+
+    def count_statements(self, app):
+        """Record the SQL statements executed on the app's engine."""
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute',
+            lambda conn, cursor, statement, *args: statements.append(statement))
+        return statements
+
+    def test_delete_investor_with_10k_clauses(self, app, client, auth_headers):
+        """Test that deleting a large investor is a handful of set-based statements."""
+        investor_id = self.seed_clauses(app)
+        statements = self.count_statements(app)
+
+        start = time.perf_counter()
+        response = client.delete(f'/investors/{investor_id}', headers=auth_headers)
+        elapsed = time.perf_counter() - start
+
+        assert response.status_code == 204
+        assert elapsed < 2.0
+        deletes = [s for s in statements if s.lstrip().upper().startswith('DELETE')]
+        # clause signatures, clauses, versions, documents, commitments, investor
+        assert len(deletes) == 6
+        assert not any('FROM clauses' in s and s.lstrip().upper().startswith('SELECT') for s in statements)
+        with app.app_context():
+            assert Clause.query.count() == 0
+            assert Document.query.count() == 0
+
+    def test_delete_document_clears_supersedes(self, app, client, auth_headers):
+        """Test that a document superseding a deleted one is kept and unlinked."""
+        investor = json.loads(client.post('/investors', data=json.dumps({'name': 'Chain'}),
+            headers=auth_headers).data)
+        original = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': 'Original', 'docType': 'Side Letter'
+        }), headers=auth_headers).data)
+        amendment = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': 'Amendment', 'docType': 'Amendment',
+            'supersedesId': original['id'],
+        }), headers=auth_headers).data)
+        client.post(f'/documents/{original["id"]}/clauses',
+            data=json.dumps({'clauseType': 'MFN'}), headers=auth_headers)
+
+        response = client.delete(f'/documents/{original["id"]}', headers=auth_headers)
+        assert response.status_code == 204
+
+        data = json.loads(client.get(f'/documents/{amendment["id"]}', headers=auth_headers).data)
+        assert data['supersedesId'] is None
+        with app.app_context():
+            assert Clause.query.count() == 0
+
+    def test_clear_demo_data(self, app, client, auth_headers):
+        """Test that /demo/clear removes every row."""
+        self.seed_clauses(app, n_documents=5, clauses_per_document=5)
+        response = client.post('/demo/clear', headers=auth_headers)
+        assert response.status_code == 200
+        with app.app_context():
+            assert Investor.query.count() == 0
+            assert Document.query.count() == 0
+            assert Clause.query.count() == 0
+
+
+class TestDemoSeeding:
+    """Test demo and synthetic bulk seeding."""
+
+    def test_seed_demo_books(self, client, auth_headers):
+        """Test that the default seed creates the three demo investors."""
+        response = client.post('/demo/seed', headers=auth_headers)
+        assert json.loads(response.data)['created'] == {'investors': 3, 'documents': 7, 'clauses': 12}
+
+        investors = json.loads(client.get('/investors', headers=auth_headers).data)
+        mock_capital = next(i for i in investors if i['name'] == 'Mock Capital LP')
+        terms = json.loads(client.get(f'/investors/{mock_capital["id"]}/effective-terms',
+            headers=auth_headers).data)['terms']
+        assert terms['Management Fee']['rate'] == 1.75
+
+    def test_seed_synthetic_books(self, app, client, auth_headers):
+        """Test that ?investors=N bulk-generates books after existing rows."""
+        client.post('/demo/seed', headers=auth_headers)
+        response = client.post('/demo/seed?investors=30', headers=auth_headers)
+        assert response.status_code == 200
+        assert json.loads(response.data)['created']['investors'] == 30
+
+        with app.app_context():
+            assert Investor.query.count() == 33
+            names = [name for (name,) in db.session.query(Investor.name)]
+            assert len(set(names)) == 33
+            synthetic = Investor.query.filter(Investor.name.like('% 4')).one()
+            side_letter = next(d for d in synthetic.documents if d.doc_type == 'Side Letter')
+            assert side_letter.title == f'{synthetic.name} Side Letter'
+            assert 'Mock Capital' not in side_letter.source_text
+
+        # Preassigned keys leave the tables ready for normal inserts
+        created = client.post('/investors', data=json.dumps({'name': 'After Seed'}), headers=auth_headers)
+        assert json.loads(created.data)['id'] == 34
+
+    def test_seed_holds_write_lock(self, tmp_path, monkeypatch):
+        """Test that a writer between the max-id reads and the inserts waits for the seed."""
+        path = tmp_path / 'seed.sqlite3'
+        monkeypatch.setattr(config['testing'], 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{path}')
+        app = create_app('testing')
+        other = sqlite3.connect(path, timeout=0)
+        attempts = []
+
+        def concurrent_insert(conn, cursor, statement, *args):
+            if 'max(investors.id)' in statement and not attempts:
+                try:
+                    other.execute("INSERT INTO investors (name, created_at, updated_at) "
+                                  "VALUES ('Concurrent LP', '2024-01-01', '2024-01-01')")
+                    other.commit()
+                    attempts.append('inserted')
+                except sqlite3.OperationalError as e:
+                    other.rollback()
+                    attempts.append(str(e))
+
+        with app.app_context():
+            db.create_all()
+            event.listen(db.engine, 'after_cursor_execute', concurrent_insert)
+            created = insert_books(DEMO_BOOKS)
+            db.session.commit()
+            event.remove(db.engine, 'after_cursor_execute', concurrent_insert)
+            assert attempts == ['database is locked']
+            assert created['investors'] == Investor.query.count() == 3
+            db.session.remove()
+            db.engine.dispose()
+        other.close()
+
+    def test_seed_limits(self, client, auth_headers):
+        """Test that the investor count is bounded."""
+        assert client.post('/demo/seed?investors=0', headers=auth_headers).status_code == 400
+        assert client.post('/demo/seed?investors=100000000', headers=auth_headers).status_code == 400
+
+    def test_seed_command(self, app):
+        """Test the seed-demo CLI command."""
+        result = app.test_cli_runner().invoke(args=['seed-demo', '--investors', '5'])
+        assert 'Created 5 investors' in result.output
+        with app.app_context():
+            assert Investor.query.count() == 5
+
+
+class TestTermsAnalytics:
+    """Test book-wide effective-terms analytics."""
+
+    def test_write_between_snapshot_queries(self, app, client, auth_headers):
+        """Test that a document committed between the snapshot's reads is neither a 500 nor cached."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Racing LP'}), headers=auth_headers).data)
+        writes = []
+
+        def commit_document(conn, cursor, statement, *args):
+            if statement.lstrip().startswith('SELECT documents.id') and not writes:
+                dbapi = cursor.connection
+                document_id = dbapi.execute(
+                    "INSERT INTO documents (investor_id, title, doc_type, priority) "
+                    "VALUES (?, 'Late Side Letter', 'Side Letter', 3)", (investor['id'],)
+                ).lastrowid
+                dbapi.execute("INSERT INTO clauses (document_id, clause_type, rate) "
+                              "VALUES (?, 'Carry Terms', 20)", (document_id,))
+                dbapi.execute("UPDATE investors SET updated_at = '2099-01-01' WHERE id = ?",
+                              (investor['id'],))
+                dbapi.commit()
+                writes.append(document_id)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'after_cursor_execute', commit_document)
+        try:
+            response = client.get('/analytics/terms', headers=auth_headers)
+        finally:
+            event.remove(engine, 'after_cursor_execute', commit_document)
+        assert response.status_code == 200
+        assert writes
+        # Rebuilt for the version after the write, so the late clause is in
+        data = json.loads(response.data)
+        assert 'Carry Terms' in data['funds'][0]['clauseTypes']
+        with app.app_context():
+            assert app.extensions['terms_snapshot']._snapshot.version == listing_validators()[0]
+
+    def test_fund_by_clause_type(self, client, auth_headers):
+        """Test counts, weighted averages and distributions over the demo book."""
+        client.post('/demo/seed', headers=auth_headers)
+        response = client.get('/analytics/terms', headers=auth_headers)
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['investors'] == 3
+
+        funds = {f['fund']: f for f in data['funds']}
+        fund_one = funds['Mock Fund I']
+        assert fund_one['investors'] == 2
+        fee = fund_one['clauseTypes']['Management Fee']
+        assert fee['investors'] == 2
+        # Mock Capital's side letter (1.75% on $250M) and Atlas (2.00% on $75M)
+        assert fee['rate']['min'] == 1.75
+        assert fee['rate']['max'] == 2.0
+        assert fee['rate']['weightedMean'] == pytest.approx((1.75 * 250 + 2.0 * 75) / 325)
+        assert fee['rate']['distribution'] == {'1.75': 1, '2': 1}
+        assert fund_one['clauseTypes']['MFN (Most Favored Nation)']['share'] == 1.0
+
+        carry = funds['Mock Fund II']['clauseTypes']['Carry Terms']
+        assert carry['rate']['mean'] == 15.0
+
+    def test_filters(self, client, auth_headers):
+        """Test ?fund= and ?clauseType= filters."""
+        client.post('/demo/seed', headers=auth_headers)
+        data = json.loads(client.get('/analytics/terms?fund=Mock Fund II&clauseType=Management Fee',
+            headers=auth_headers).data)
+        assert [f['fund'] for f in data['funds']] == ['Mock Fund II']
+        assert list(data['funds'][0]['clauseTypes']) == ['Management Fee']
+
+    def test_investor_counted_in_each_committed_fund(self, client, auth_headers):
+        """Test that fund totals and weights come from commitments, not the fund name."""
+        client.post('/demo/seed', headers=auth_headers)
+        investors = json.loads(client.get('/investors', headers=auth_headers).data)
+        mock_capital = next(i for i in investors if i['name'] == 'Mock Capital LP')
+        funds = {f['name']: f['id'] for f in json.loads(client.get('/funds', headers=auth_headers).data)}
+        client.post(f'/funds/{funds["Mock Fund II"]}/commitments',
+            data=json.dumps({'investorId': mock_capital['id'], 'amount': 50000000}), headers=auth_headers)
+
+        data = json.loads(client.get('/analytics/terms', headers=auth_headers).data)
+        assert data['investors'] == 3
+        fund_two = {f['fund']: f for f in data['funds']}['Mock Fund II']
+        assert fund_two['investors'] == 2
+        assert fund_two['commitment'] == pytest.approx(50000000 + sum(
+            float(i['commitmentAmount']) for i in investors if i['fund'] == 'Mock Fund II'))
+        assert fund_two['clauseTypes']['Management Fee']['investors'] == 2
+
+    def test_snapshot_follows_writes(self, client, auth_headers):
+        """Test that a clause write is reflected and unchanged books revalidate."""
+        client.post('/demo/seed', headers=auth_headers)
+        first = client.get('/analytics/terms', headers=auth_headers)
+        cached = client.get('/analytics/terms',
+            headers={**auth_headers, 'If-None-Match': first.headers['ETag']})
+        assert cached.status_code == 304
+
+        investors = json.loads(client.get('/investors', headers=auth_headers).data)
+        meridian = next(i for i in investors if i['name'] == 'Meridian Pension Fund')
+        document = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': meridian['id'], 'title': 'Fee Amendment', 'docType': 'Amendment',
+        }), headers=auth_headers).data)
+        client.post(f'/documents/{document["id"]}/clauses',
+            data=json.dumps({'clauseType': 'Management Fee', 'rate': 1.25}), headers=auth_headers)
+
+        data = json.loads(client.get('/analytics/terms?fund=Mock Fund II', headers=auth_headers).data)
+        assert data['funds'][0]['clauseTypes']['Management Fee']['rate']['min'] == 1.25
+
+
+@pytest.mark.skipif(not ARROW_AVAILABLE, reason="pyarrow is not installed")
+class TestColumnarExport:
+    """Test Arrow / Parquet snapshot export."""
+
+    def test_export_command(self, app, client, auth_headers, tmp_path):
+        """Test that every table is written in batches with a versioned manifest."""
+        import pyarrow as pa
+
+        client.post('/demo/seed?investors=30', headers=auth_headers)
+        result = app.test_cli_runner().invoke(
+            args=['export-snapshot', str(tmp_path), '--batch-size', '20'])
+        assert result.exit_code == 0, result.output
+
+        manifest = json.loads((tmp_path / 'manifest.json').read_text())
+        listing_etag = client.get('/investors', headers=auth_headers).headers['ETag'].strip('"')
+        assert manifest['snapshotVersion'] == listing_etag
+        assert {t: e['rows'] for t, e in manifest['tables'].items()} == {
+            'investors': 30, 'documents': 70, 'clauses': 120, 'effective_terms': 100,
+        }
+
+        with pa.memory_map(str(tmp_path / 'clauses.arrow')) as source:
+            reader = pa.ipc.open_file(source)
+            assert reader.num_record_batches == 6
+            assert reader.schema.metadata[b'snapshot_version'] == listing_etag.encode()
+            clauses = reader.read_all()
+        assert clauses.schema.field('rate').type == pa.float64()
+
+        with pa.memory_map(str(tmp_path / 'effective_terms.arrow')) as source:
+            terms = pa.ipc.open_file(source).read_all().to_pylist()
+        mock_capital_fee = next(t for t in terms
+            if t['investor_id'] == 1 and t['clause_type'] == 'Management Fee')
+        assert mock_capital_fee['rate'] == 1.75
+
+    def test_rewritten_when_book_changes_meanwhile(self, app, client, auth_headers, tmp_path, monkeypatch):
+        """Test that an export whose version moved while reading is redone."""
+        import snapshot_export
+
+        client.post('/demo/seed', headers=auth_headers)
+        versions = iter(['v1', 'v2', 'v2', 'v2'])
+        monkeypatch.setattr(snapshot_export, 'snapshot_version', lambda: (next(versions), None))
+        with app.app_context():
+            manifest = snapshot_export.write_snapshot(str(tmp_path))
+        assert manifest['snapshotVersion'] == 'v2'
+        assert json.loads((tmp_path / 'manifest.json').read_text())['snapshotVersion'] == 'v2'
+
+        monkeypatch.setattr(snapshot_export, 'snapshot_version', lambda: (str(time.perf_counter()), None))
+        with app.app_context(), pytest.raises(RuntimeError):
+            snapshot_export.write_snapshot(str(tmp_path / 'busy'))
+
+    def test_parquet_format(self, app, client, auth_headers, tmp_path):
+        """Test the Parquet writer."""
+        import pyarrow.parquet as pq
+
+        client.post('/demo/seed', headers=auth_headers)
+        result = app.test_cli_runner().invoke(
+            args=['export-snapshot', str(tmp_path), '--format', 'parquet'])
+        assert result.exit_code == 0, result.output
+        assert pq.read_table(str(tmp_path / 'investors.parquet')).num_rows == 3
+
+    def test_export_endpoint_streams_arrow(self, client, auth_headers):
+        """Test GET /export/<table> as an Arrow IPC stream."""
+        import pyarrow as pa
+
+        client.post('/demo/seed', headers=auth_headers)
+        response = client.get('/export/effective_terms', headers=auth_headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/vnd.apache.arrow.stream'
+        table = pa.ipc.open_stream(response.data).read_all()
+        assert table.num_rows == 10
+        assert table.schema.metadata[b'snapshot_version'] == response.headers['X-Snapshot-Version'].encode()
+
+        assert client.get('/export/users', headers=auth_headers).status_code == 404
+
+
+MODEL_ANSWER = """```json
+{
+  "document_info": {"detected_type": "Side Letter", "detected_investor": null},
+  "clauses": [
+    {"clause_type": "Management Fee", "rate": 1.75, "clause_text": "reduced to 1.75% {per annum}", "notes": "quote \\" and ] inside"},
+    {"clause_type": "MFN (Most Favored Nation)", "rate": null, "nested": {"a": [1, 2]}}
+  ],
+  "extraction_notes": "two clauses"
+}
+```"""
+
+
+class TestStreamingExtraction:
+    """Test incremental clause parsing and the NDJSON extraction stream."""
+
+    def test_parser_emits_each_clause_when_it_closes(self):
+        """Test char-by-char parsing with fences, escapes and nested values."""
+        parser = ClauseStreamParser()
+        emitted = []
+        for position, char in enumerate(MODEL_ANSWER):
+            for clause in parser.feed(char):
+                emitted.append((position, clause))
+
+        assert [c['clause_type'] for _, c in emitted] == ['Management Fee', 'MFN (Most Favored Nation)']
+        first_close = MODEL_ANSWER.index('inside"}') + len('inside"')
+        assert emitted[0][0] == first_close
+        assert emitted[0][1]['notes'] == 'quote " and ] inside'
+        assert emitted[1][1]['nested'] == {'a': [1, 2]}
+        assert parser.clauses_done
+
+    def test_parser_ignores_other_arrays(self):
+        """Test that only the top-level clauses array is parsed."""
+        parser = ClauseStreamParser()
+        assert parser.feed('{"document_info": {"clauses": [{"x": 1}]}, "other": [{"y": 2}]}') == []
+
+    def test_first_clause_before_stream_ends(self):
+        """Test that clauses are yielded while the provider is still streaming."""
+        pulled = []
+
+        def fake_stream(text):
+            for i in range(0, len(MODEL_ANSWER), 16):
+                pulled.append(i)
+                yield MODEL_ANSWER[i:i + 16]
+
+        router = ProviderRouter({'openai': fake_provider('openai')}, stream_providers={'openai': fake_stream})
+        events = extraction_service.stream_extract_clauses('x' * 100, router.stream)
+        kind, clause = next(events)
+        assert kind == 'clause'
+        assert clause['rate'] == 1.75
+        assert len(pulled) < len(range(0, len(MODEL_ANSWER), 16))
+
+        rest = list(events)
+        assert [kind for kind, _ in rest] == ['clause', 'done']
+        done = rest[-1][1]
+        assert done['document_info']['detected_type'] == 'Side Letter'
+        assert done['extraction_notes'] == 'two clauses'
+        assert done['provider'] == 'openai'
+        assert 'clauses' not in done
+
+    def test_provider_failure_falls_back_to_mock(self):
+        """Test the pattern-matching fallback when the stream fails up front."""
+        def broken_stream(text):
+            raise ConnectionError('provider unavailable')
+            yield
+
+        router = ProviderRouter({'openai': fake_provider('openai')}, stream_providers={'openai': broken_stream})
+        text = 'The Management Fee shall be 2.00% per annum of each commitment made.'
+        events = list(extraction_service.stream_extract_clauses(text, router.stream))
+        assert events[0][0] == 'clause'
+        assert events[-1][0] == 'done'
+        assert 'provider unavailable' in events[-1][1]['ai_error']
+        assert router.breakers['openai']._failures == 1
+
+    def test_stream_fails_over_before_first_delta(self, tmp_path):
+        """Test that streams go through the router's breaker, rate limit and failover."""
+        def broken_stream(text):
+            raise ConnectionError('provider unavailable')
+            yield
+
+        def answer_stream(text):
+            yield MODEL_ANSWER
+
+        bucket = SQLiteTokenBucket(str(tmp_path / 'b.sqlite3'), rate_per_second=0.0, capacity=1)
+        router = ProviderRouter(
+            {'primary': fake_provider('primary'), 'secondary': fake_provider('secondary')},
+            stream_providers={'primary': broken_stream, 'secondary': answer_stream},
+            rate_limiter=bucket,
+        )
+        events = list(extraction_service.stream_extract_clauses('x' * 100, router.stream))
+        done = events[-1][1]
+        assert [kind for kind, _ in events] == ['clause', 'clause', 'done']
+        assert done['provider'] == 'secondary'
+        assert done['routing']['attempted'] == ['primary', 'secondary']
+
+        # Both buckets are empty now, so the stream falls back to pattern matching
+        events = list(extraction_service.stream_extract_clauses('x' * 100, router.stream))
+        assert 'unavailable' in events[-1][1]['ai_error']
+
+    def test_stream_error_after_first_delta_is_not_retried(self):
+        """Test that a stream failing mid-answer reports the break instead of failing over."""
+        calls = []
+
+        def cut_stream(text):
+            calls.append('primary')
+            yield MODEL_ANSWER[:MODEL_ANSWER.index('inside"}') + len('inside"}')]
+            raise ConnectionError('reset')
+
+        def answer_stream(text):
+            calls.append('secondary')
+            yield MODEL_ANSWER
+
+        router = ProviderRouter(
+            {'primary': fake_provider('primary'), 'secondary': fake_provider('secondary')},
+            stream_providers={'primary': cut_stream, 'secondary': answer_stream},
+        )
+        events = list(extraction_service.stream_extract_clauses('x' * 100, router.stream))
+        assert [kind for kind, _ in events] == ['clause', 'done']
+        assert 'Stream interrupted: reset' == events[-1][1]['error']
+        assert calls == ['primary']
+        assert router.breakers['primary']._failures == 1
+
+    def test_ndjson_endpoint(self, client, auth_headers):
+        """Test POST /extract/stream in mock mode."""
+        text = 'Side Letter. The Management Fee shall be 1.75% per annum. Most Favored Nation applies.'
+        response = client.post('/extract/stream', data=json.dumps({'text': text, 'mock': True}),
+            headers=auth_headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert [line['type'] for line in lines] == ['clause', 'clause', 'done']
+        assert lines[0]['clause']['rate'] == 1.75
+        assert lines[-1]['document_info']['detected_type'] == 'Side Letter'
+
+    def test_ndjson_endpoint_validates_text(self, client, auth_headers):
+        """Test that short text is rejected before streaming starts."""
+        response = client.post('/extract/stream', data=json.dumps({'text': 'short'}), headers=auth_headers)
+        assert response.status_code == 400
+
+
+def fake_provider(name, delay=0.0, error=None, calls=None):
+    """A provider callable that sleeps, then fails or returns one clause."""
+    def call(text):
+        if calls is not None:
+            calls.append(name)
+        time.sleep(delay)
+        if error:
+            raise error
+        return {'document_info': {}, 'clauses': [{'clause_type': 'Management Fee', 'notes': name}]}
+    return call
+
+
+class TestProviderRouter:
+    """Test failover, circuit breaking, hedging and rate limiting."""
+
+    def test_failover_to_next_provider(self):
+        """Test that a failing provider falls through to the next one."""
+        router = ProviderRouter({
+            'primary': fake_provider('primary', error=RuntimeError('boom')),
+            'secondary': fake_provider('secondary'),
+        })
+        result = router.extract('text')
+        assert result['provider'] == 'secondary'
+        assert result['routing']['attempted'] == ['primary', 'secondary']
+        assert 'boom' in result['routing']['failed'][0]
+
+    def test_circuit_opens_and_recovers(self):
+        """Test that a failing provider is skipped until its cool-down passes."""
+        now = [0.0]
+        calls = []
+        failing = {'error': RuntimeError('down')}
+        router = ProviderRouter({
+            'primary': lambda text: fake_provider('primary', calls=calls, **failing)(text),
+            'secondary': fake_provider('secondary'),
+        }, breaker_failures=2, breaker_reset_seconds=30, clock=lambda: now[0])
+
+        router.extract('text')
+        router.extract('text')
+        assert router.breakers['primary'].state == CircuitBreaker.OPEN
+        router.extract('text')
+        assert calls == ['primary', 'primary']
+
+        now[0] = 31.0
+        failing.clear()
+        assert router.extract('text')['provider'] == 'primary'
+        assert router.breakers['primary'].state == CircuitBreaker.CLOSED
+
+    def test_hedged_request_takes_first_answer(self):
+        """Test that a slow primary is hedged with the secondary after the delay."""
+        router = ProviderRouter({
+            'slow': fake_provider('slow', delay=0.5),
+            'fast': fake_provider('fast', delay=0.01),
+        }, hedge=True, hedge_default_delay=0.05)
+
+        start = time.perf_counter()
+        result = router.extract('text')
+        assert result['provider'] == 'fast'
+        assert time.perf_counter() - start < 0.4
+
+    def test_hedge_delay_uses_p95(self):
+        """Test that the hedge delay follows observed latency once there are samples."""
+        router = ProviderRouter({'p': fake_provider('p')}, hedge_default_delay=5.0, hedge_min_samples=20)
+        assert router.hedge_delay('p') == 5.0
+        for i in range(1, 101):
+            router.latency['p'].record(i / 100)
+        assert router.hedge_delay('p') == pytest.approx(0.95, abs=0.01)
+
+    def test_timeout(self):
+        """Test that a provider slower than the timeout counts as a failure."""
+        router = ProviderRouter({'slow': fake_provider('slow', delay=0.3)}, timeout=0.05)
+        result = router.extract('text')
+        assert 'timed out' in result['error']
+        assert result['clauses'] == []
+
+    def test_timed_out_calls_do_not_block_other_providers(self):
+        """Test that a provider busy with timed-out calls is skipped, not queued behind."""
+        router = ProviderRouter({
+            'slow': fake_provider('slow', delay=0.5),
+            'fast': fake_provider('fast', delay=0.01),
+        }, timeout=0.05, max_workers=1)
+        assert 'timed out' in router.extract('text')['error']
+
+        start = time.perf_counter()
+        assert router.extract('text')['provider'] == 'fast'
+        assert time.perf_counter() - start < 0.3
+
+    def test_open_breaker_does_not_spend_tokens(self):
+        """Test that a provider the breaker rejects doesn't draw from its bucket."""
+        class CountingBucket:
+            def __init__(self):
+                self.acquired = []
+
+            def acquire(self, name):
+                self.acquired.append(name)
+                return True
+
+        now = [0.0]
+        bucket = CountingBucket()
+        router = ProviderRouter({'a': fake_provider('a'), 'b': fake_provider('b')},
+                                breaker_failures=1, breaker_reset_seconds=30,
+                                rate_limiter=bucket, clock=lambda: now[0])
+        router.breakers['a'].record_failure()
+        now[0] = 31.0
+        assert router.breakers['a'].allow()  # another request holds the half-open trial
+        assert router.extract('text')['provider'] == 'b'
+        assert bucket.acquired == ['b']
+
+    def test_async_failover_prefers_async_providers(self):
+        """Test that extract_async awaits async providers and fails over like extract."""
+        calls = []
+
+        async def async_secondary(text):
+            calls.append('async')
+            return {'document_info': {}, 'clauses': [{'clause_type': 'Management Fee'}]}
+
+        router = ProviderRouter({
+            'primary': fake_provider('primary', error=RuntimeError('boom')),
+            'secondary': fake_provider('secondary', calls=calls),
+        }, async_providers={'secondary': async_secondary})
+        result = asyncio.run(router.extract_async('text'))
+        assert result['provider'] == 'secondary'
+        assert result['routing']['attempted'] == ['primary', 'secondary']
+        assert calls == ['async']
+
+    def test_async_hedge_and_timeout(self):
+        """Test that extract_async hedges a slow provider and times out."""
+        async def slow(text):
+            await asyncio.sleep(0.5)
+            return {'document_info': {}, 'clauses': [{'clause_type': 'Management Fee'}]}
+
+        router = ProviderRouter({'slow': fake_provider('slow'), 'fast': fake_provider('fast', delay=0.01)},
+                                hedge=True, hedge_default_delay=0.05, async_providers={'slow': slow})
+        start = time.perf_counter()
+        assert asyncio.run(router.extract_async('text'))['provider'] == 'fast'
+        assert time.perf_counter() - start < 0.4
+
+        router = ProviderRouter({'slow': fake_provider('slow')}, timeout=0.05, async_providers={'slow': slow})
+        result = asyncio.run(router.extract_async('text'))
+        assert 'timed out' in result['error']
+        assert router.breakers['slow']._failures == 1
+
+    def test_async_rate_limiter_runs_off_the_loop(self):
+        """Test that extract_async takes rate-limit tokens on a worker thread."""
+        threads = []
+
+        class RecordingBucket:
+            def acquire(self, name):
+                threads.append(threading.current_thread())
+                return True
+
+        router = ProviderRouter({'a': fake_provider('a')}, rate_limiter=RecordingBucket())
+        assert asyncio.run(router.extract_async('text'))['provider'] == 'a'
+        assert threads and threading.main_thread() not in threads
+
+    def test_token_bucket_shared_across_instances(self, tmp_path):
+        """Test that buckets in one file are shared, like separate workers."""
+        path = str(tmp_path / 'buckets.sqlite3')
+        now = [1000.0]
+        first = SQLiteTokenBucket(path, rate_per_second=1.0, capacity=2, clock=lambda: now[0])
+        second = SQLiteTokenBucket(path, rate_per_second=1.0, capacity=2, clock=lambda: now[0])
+        assert first.acquire('openai')
+        assert second.acquire('openai')
+        assert not first.acquire('openai')
+        assert second.acquire('anthropic')
+        now[0] += 1.0
+        assert first.acquire('openai')
+
+    def test_rate_limited_provider_is_skipped(self, tmp_path):
+        """Test that an empty bucket routes to the next provider."""
+        bucket = SQLiteTokenBucket(str(tmp_path / 'b.sqlite3'), rate_per_second=0.0, capacity=1)
+        router = ProviderRouter({'a': fake_provider('a'), 'b': fake_provider('b')}, rate_limiter=bucket)
+        assert router.extract('text')['provider'] == 'a'
+        assert router.extract('text')['provider'] == 'b'
+
+    def test_extract_endpoint_uses_router(self, app, client, auth_headers):
+        """Test that POST /extract goes through the app's router."""
+        app.extensions['provider_router'] = ProviderRouter({'fake': fake_provider('fake')})
+        text = 'The Management Fee shall be 2.00% per annum of each commitment made.'
+        response = client.post('/extract', data=json.dumps({'text': text}), headers=auth_headers)
+        assert json.loads(response.data)['provider'] == 'fake'
+
+        status = json.loads(client.get('/extract/providers', headers=auth_headers).data)
+        assert status['fake']['state'] == 'closed'
+        assert status['fake']['samples'] == 1
+
+
+def boilerplate_document():
+    """A side letter buried in boilerplate sections."""
+    boilerplate = ' '.join(['The parties agree that this provision shall be construed in good faith.'] * 12)
+    sections = [f'SECTION {n}. GENERAL PROVISIONS {n}\n\n{n}.1 {boilerplate}' for n in range(1, 9)]
+    sections.insert(3, 'SECTION 20. MANAGEMENT FEE REDUCTION\n\n20.1 The Management Fee shall be 1.50% per annum.')
+    sections.insert(6, 'SECTION 21. MOST FAVORED NATION\n\n21.1 The Limited Partner shall have MFN rights.')
+    return 'SIDE LETTER AGREEMENT\n\nEntered into by Harbor Capital LP.\n\n' + '\n\n'.join(sections)
+
+
+class TestExtractionPrefilter:
+    """Test section pre-filtering before LLM extraction."""
+
+    def test_selects_clause_sections_with_offsets(self):
+        """Test that only scored sections (plus the preamble) are sent."""
+        text = boilerplate_document()
+        selection = extraction_service.prefilter_text(text)
+        assert selection['filtered']
+        assert selection['tokensSaved'] > selection['sentTokens']
+
+        headings = [text[s['start']:s['end']].splitlines()[0] for s in selection['sections']]
+        assert headings == ['SECTION 20. MANAGEMENT FEE REDUCTION', 'SECTION 21. MOST FAVORED NATION']
+        fee = selection['sections'][0]
+        assert f"[excerpt {fee['start']}-{fee['end']}]" in selection['text']
+        assert 'Harbor Capital LP' in selection['text']
+        assert 'GENERAL PROVISIONS 8' not in selection['text']
+
+    def test_short_or_unmatched_documents_are_sent_whole(self):
+        """Test the fallbacks to the full text."""
+        short = 'SIDE LETTER\n\nThe Management Fee shall be 1.75% per annum.'
+        assert extraction_service.prefilter_text(short)['text'] == short
+        unmatched = 'NOTICE\n\n' + 'Nothing about economics here. ' * 200
+        selection = extraction_service.prefilter_text(unmatched)
+        assert not selection['filtered']
+        assert selection['text'] == unmatched
+
+    def test_extract_sends_filtered_text_and_records_metrics(self, app, client, auth_headers):
+        """Test that /extract sends excerpts and reports tokens saved."""
+        prompts = []
+
+        def provider(prompt_text):
+            prompts.append(prompt_text)
+            return {'document_info': {}, 'clauses': [{'clause_type': 'Management Fee', 'rate': 1.5}]}
+
+        app.extensions['provider_router'] = ProviderRouter({'fake': provider})
+        text = boilerplate_document()
+        response = client.post('/extract', data=json.dumps({'text': text}), headers=auth_headers)
+        data = json.loads(response.data)
+
+        assert len(prompts[0]) < len(text) / 2
+        assert data['prefilter']['filtered']
+        assert data['prefilter']['tokensSaved'] > 0
+        assert data['prefilter']['provider'] == 'fake'
+
+        metrics = json.loads(client.get('/extract/metrics', headers=auth_headers).data)
+        assert metrics['documents'] >= 1
+        assert metrics['tokensSaved'] >= data['prefilter']['tokensSaved']
+
+
+
+VERSION_1 = (
+    'SIDE LETTER\n\n'
+    'SECTION 1. MANAGEMENT FEE\n'
+    'The Management Fee shall be 1.75% per annum of commitments.\n\n'
+    'SECTION 2. CARRIED INTEREST\n'
+    'The Carried Interest shall be 15% of profits.\n\n'
+    'SECTION 3. NOTICES\n'
+    'Notices shall be delivered in writing.\n'
+)
+
+
+class TestDocumentVersions:
+    """Test section diffs and incremental re-extraction of amendments."""
+
+    @pytest.fixture
+    def document(self, client, auth_headers):
+        """Create a side letter with one clause per economic section."""
+        inv_response = client.post('/investors',
+            data=json.dumps({'name': 'Versioned Investor', 'investorType': 'LP'}),
+            headers=auth_headers
+        )
+        investor = json.loads(inv_response.data)
+        doc_response = client.post('/documents',
+            data=json.dumps({
+                'investorId': investor['id'],
+                'title': 'Side Letter',
+                'docType': 'Side Letter',
+                'sourceText': VERSION_1,
+            }),
+            headers=auth_headers
+        )
+        document = json.loads(doc_response.data)
+        for clause_type, clause_text, rate in [
+            ('Management Fee', 'The Management Fee shall be 1.75% per annum of commitments.', 1.75),
+            ('Carried Interest', 'The Carried Interest shall be 15% of profits.', 15),
+        ]:
+            client.post(f'/documents/{document["id"]}/clauses',
+                data=json.dumps({'clauseType': clause_type, 'clauseText': clause_text, 'rate': rate}),
+                headers=auth_headers
+            )
+        return document
+
+    def test_diff_sections(self):
+        """Test that sections are matched by heading and content hash."""
+        amended = VERSION_1.replace('15%', '12.5%').replace(
+            'SECTION 3. NOTICES', 'SECTION 4. NOTICES')
+        diff = document_versions.diff_sections(
+            document_versions.section_index(VERSION_1),
+            document_versions.section_index(amended),
+        )
+        assert diff['changed'] == ['SECTION 2. CARRIED INTEREST']
+        assert 'SECTION 1. MANAGEMENT FEE' in diff['unchanged']
+        assert diff['added'] == ['SECTION 4. NOTICES']
+        assert diff['removed'] == ['SECTION 3. NOTICES']
+
+    def test_only_changed_sections_are_extracted(self, app, client, auth_headers, document):
+        """Test that an amendment re-extracts one section and keeps the rest."""
+        prompts = []
+
+        def provider(prompt_text):
+            prompts.append(prompt_text)
+            return {'document_info': {}, 'clauses': [{
+                'clause_type': 'Carried Interest', 'rate': 12.5,
+                'clause_text': 'The Carried Interest shall be 12.5% of profits.',
+            }]}
+
+        app.extensions['provider_router'] = ProviderRouter({'fake': provider})
+        before = {c['clauseType']: c['id'] for c in json.loads(
+            client.get(f'/documents/{document["id"]}', headers=auth_headers).data)['clauses']}
+
+        amended = VERSION_1.replace('15%', '12.5%')
+        response = client.post(f'/documents/{document["id"]}/versions',
+            data=json.dumps({'sourceText': amended}), headers=auth_headers)
+        assert response.status_code == 201
+        data = json.loads(response.data)
+
+        assert prompts == ['SECTION 2. CARRIED INTEREST\nThe Carried Interest shall be 12.5% of profits.']
+        assert data['version'] == 2
+        assert data['carriedForward'] == [before['Management Fee']]
+        assert data['replaced'] == [before['Carried Interest']]
+
+        updated = json.loads(client.get(f'/documents/{document["id"]}', headers=auth_headers).data)
+        rates = {c['clauseType']: (c['id'], c['rate']) for c in updated['clauses']}
+        assert rates['Management Fee'] == (before['Management Fee'], 1.75)
+        assert rates['Carried Interest'][1] == 12.5
+        assert updated['sourceText'] == amended
+
+        versions = json.loads(client.get(f'/documents/{document["id"]}/versions', headers=auth_headers).data)
+        assert [v['version'] for v in versions] == [1, 2]
+
+    def test_unlocated_clauses_of_re_extracted_sections(self, app, client, auth_headers, document):
+        """Test that unplaceable clauses are replaced by re-extracted ones, not kept beside them."""
+        def add(clause_type, clause_text, **fields):
+            return json.loads(client.post(f'/documents/{document["id"]}/clauses',
+                data=json.dumps({'clauseType': clause_type, 'clauseText': clause_text, **fields}),
+                headers=auth_headers).data)['id']
+
+        # Paraphrased by a reviewer, so the text isn't in the document
+        paraphrased = add('Carried Interest', 'Carry: fifteen percent.', rate=15)
+        by_reference = add('Hurdle', 'Hurdle as agreed.', sectionRef='Section 2')
+        unrelated = add('Key Person', 'Key person provisions apply.')
+
+        app.extensions['provider_router'] = ProviderRouter({'fake': lambda prompt_text: {
+            'document_info': {}, 'clauses': [{
+                'clause_type': 'Carried Interest', 'rate': 12.5,
+                'clause_text': 'The Carried Interest shall be 12.5% of profits.',
+            }],
+        }})
+        response = client.post(f'/documents/{document["id"]}/versions',
+            data=json.dumps({'sourceText': VERSION_1.replace('15%', '12.5%')}), headers=auth_headers)
+        data = json.loads(response.data)
+
+        assert paraphrased in data['replaced'] and by_reference in data['replaced']
+        assert data['unlocated'] == [unrelated]
+        assert unrelated in data['carriedForward']
+        clauses = json.loads(client.get(f'/documents/{document["id"]}', headers=auth_headers).data)['clauses']
+        assert [c['rate'] for c in clauses if c['clauseType'] == 'Carried Interest'] == [12.5]
+        assert 'Hurdle' not in {c['clauseType'] for c in clauses}
+
+    def test_dry_run_and_unchanged_text(self, client, auth_headers, document):
+        """Test that apply=false saves nothing and identical text extracts nothing."""
+        amended = VERSION_1.replace('15%', '12.5%')
+        response = client.post(f'/documents/{document["id"]}/versions',
+            data=json.dumps({'sourceText': amended, 'mock': True, 'apply': False}),
+            headers=auth_headers)
+        assert response.status_code == 200
+        assert json.loads(response.data)['diff']['changed'] == ['SECTION 2. CARRIED INTEREST']
+        assert json.loads(client.get(f'/documents/{document["id"]}/versions', headers=auth_headers).data) == []
+
+        response = client.post(f'/documents/{document["id"]}/versions',
+            data=json.dumps({'sourceText': VERSION_1, 'mock': True}), headers=auth_headers)
+        data = json.loads(response.data)
+        assert data['created'] == [] and data['replaced'] == []
+        assert len(data['carriedForward']) == 2
+
+
+class FakeClock:
+    """A settable clock for time-based eviction tests."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestSharedCache:
+    """Test the cross-worker cache store and its use by read endpoints."""
+
+    def test_shared_between_instances(self, tmp_path):
+        """Test that two workers opening the same file share entries and tags."""
+        path = str(tmp_path / 'cache.sqlite3')
+        first = SharedCache(SQLiteCache(path))
+        second = SharedCache(SQLiteCache(path))
+        first.set('investor-etag', b'{"id": 1}', tags=['investor:1'])
+        assert second.get('investor-etag') == b'{"id": 1}'
+        second.invalidate('investor:1')
+        assert first.get('investor-etag') is None
+
+    def test_lru_and_ttl_eviction(self):
+        """Test that the least recently read entry goes first and TTLs expire."""
+        clock = FakeClock()
+        cache = SQLiteCache(':memory:', max_entries=2, clock=clock, touch_interval=1)
+        cache.set('a', b'1')
+        clock.now += 1
+        cache.set('b', b'2')
+        clock.now += 1
+        assert cache.get('a') == b'1'
+        clock.now += 1
+        cache.set('c', b'3')
+        assert cache.get('b') is None
+        assert cache.get('a') == b'1'
+
+        cache.set('d', b'4', ex=10)
+        clock.now += 11
+        assert cache.get('d') is None
+
+    def test_hits_write_only_after_touch_interval(self):
+        """Test that repeated reads of a hot entry don't each write its access time."""
+        clock = FakeClock()
+        cache = SQLiteCache(':memory:', clock=clock, touch_interval=60)
+        cache.set('a', b'1')
+        writes = cache._connection().total_changes
+        for _ in range(5):
+            clock.now += 10
+            assert cache.get('a') == b'1'
+        assert cache._connection().total_changes == writes
+        clock.now += 10
+        assert cache.get('a') == b'1'
+        assert cache._connection().total_changes == writes + 1
+
+    def test_databases_do_not_share_entries(self, tmp_path):
+        """Test that apps on different databases sharing one cache file keep apart."""
+        path = str(tmp_path / 'cache.sqlite3')
+        dev = build_cache({'CACHE_URL': path, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///dev.db'})
+        staging = build_cache({'CACHE_URL': path, 'SQLALCHEMY_DATABASE_URI': 'postgresql://db/staging'})
+        same = build_cache({'CACHE_URL': path, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///dev.db'})
+        dev.set('investor-etag', b'{"id": 1}', tags=['investor:1'])
+        assert staging.get('investor-etag') is None
+        assert same.get('investor-etag') == b'{"id": 1}'
+        staging.invalidate('investor:1')
+        assert dev.get('investor-etag') == b'{"id": 1}'
+
+    def test_read_endpoints_cached_and_invalidated(self, app, client, auth_headers):
+        """Test that a cached investor is dropped when the investor changes."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Cached Investor', 'investorType': 'LP'}),
+            headers=auth_headers).data)
+        url = f'/investors/{investor["id"]}'
+        etag = client.get(url, headers=auth_headers).headers['ETag'].strip('"')
+        cache = app.extensions['shared_cache']
+        assert json.loads(cache.get(etag))['name'] == 'Cached Investor'
+
+        client.put(url, data=json.dumps({'name': 'Renamed Investor'}), headers=auth_headers)
+        assert cache.get(etag) is None
+        assert json.loads(client.get(url, headers=auth_headers).data)['name'] == 'Renamed Investor'
+
+
+
+class TestProfiling:
+    """Test on-demand request profiles and the slow-request log."""
+
+    @pytest.fixture
+    def investor(self, client, auth_headers):
+        """Create an investor with a document and a clause."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Profiled Investor', 'investorType': 'LP'}),
+            headers=auth_headers).data)
+        document = json.loads(client.post('/documents',
+            data=json.dumps({'investorId': investor['id'], 'title': 'LPA', 'docType': 'LPA'}),
+            headers=auth_headers).data)
+        client.post(f'/documents/{document["id"]}/clauses',
+            data=json.dumps({'clauseType': 'Management Fee', 'rate': 2.0}), headers=auth_headers)
+        return investor
+
+    def test_profile_query_parameter(self, app, client, auth_headers, investor, tmp_path):
+        """Test that ?profile=1 stores folded stacks and the SQL statements."""
+        app.config['PROFILE_DIR'] = str(tmp_path)
+        app.config['PROFILE_SAMPLE_INTERVAL'] = 0.0001
+        response = client.get(f'/investors/{investor["id"]}/effective-terms?profile=1',
+            headers=auth_headers)
+        assert response.status_code == 200
+        assert 'sql;dur=' in response.headers['Server-Timing']
+        profile_id = response.headers['X-Profile-Id']
+
+        profile = json.loads(client.get(f'/admin/profiles/{profile_id}', headers=auth_headers).data)
+        assert profile['route'] == '/investors/<int:investor_id>/effective-terms'
+        assert any('FROM clauses' in query['statement'] for query in profile['sql'])
+        for line in profile['folded'].splitlines():
+            stack, count = line.rsplit(' ', 1)
+            assert int(count) > 0
+
+        folded = client.get(f'/admin/profiles/{profile_id}/folded', headers=auth_headers)
+        assert folded.mimetype == 'text/plain'
+        listed = json.loads(client.get('/admin/profiles', headers=auth_headers).data)
+        assert [p['id'] for p in listed] == [profile_id]
+
+    def test_profiling_is_admin_only(self, app, client, auth_headers, investor, tmp_path):
+        """Test that non-admins can't profile or read the admin endpoints."""
+        app.config['PROFILE_DIR'] = str(tmp_path)
+        app.config['ADMIN_EMAILS'] = set()
+        response = client.get(f'/investors/{investor["id"]}', headers={**auth_headers, 'X-Profile': '1'})
+        assert response.status_code == 200
+        assert 'X-Profile-Id' not in response.headers
+        assert client.get('/admin/slow-requests', headers=auth_headers).status_code == 403
+        assert list(tmp_path.iterdir()) == []
+
+    def test_slow_request_log(self, app, client, auth_headers, investor):
+        """Test that sampled requests keep the slowest N per route with SQL."""
+        app.config['SLOW_REQUEST_SAMPLE_RATE'] = 1.0
+        for _ in range(app.config['SLOW_REQUEST_TOP_N'] + 2):
+            client.get(f'/investors/{investor["id"]}/effective-terms?asOf=2024-01-01',
+                headers=auth_headers)
+        app.config['SLOW_REQUEST_SAMPLE_RATE'] = 0.0
+
+        log = json.loads(client.get('/admin/slow-requests', headers=auth_headers).data)
+        entries = log['routes']['/investors/<int:investor_id>/effective-terms']
+        assert len(entries) == app.config['SLOW_REQUEST_TOP_N']
+        durations = [entry['durationMs'] for entry in entries]
+        assert durations == sorted(durations, reverse=True)
+        assert all(entry['sqlCount'] == len(entry['sql']) for entry in entries)
+
+
+class TestFunds:
+    """Test fund and commitment tables and the fund-scoped endpoints."""
+
+    def fund_id(self, client, auth_headers, name):
+        funds = json.loads(client.get('/funds', headers=auth_headers).data)
+        return next(fund['id'] for fund in funds if fund['name'] == name)
+
+    def test_demo_funds_backfilled(self, client, auth_headers):
+        """Test that seeded investors get funds and commitments from their fund name."""
+        client.post('/demo/seed', headers=auth_headers)
+        funds = {f['name']: f for f in json.loads(client.get('/funds', headers=auth_headers).data)}
+        assert funds['Mock Fund I']['investorCount'] == 2
+        assert funds['Mock Fund II']['investorCount'] == 1
+
+        fund_id = funds['Mock Fund I']['id']
+        data = json.loads(client.get(f'/funds/{fund_id}/investors', headers=auth_headers).data)
+        assert data['investorCount'] == 2
+        assert {investor['name'] for investor in data['investors']} == {
+            'Mock Capital LP', 'Atlas Family Office'}
+        assert Decimal(str(data['totalCommitment'])) == sum(
+            Decimal(str(investor['commitment']['amount'])) for investor in data['investors'])
+
+        documents = json.loads(client.get(f'/funds/{fund_id}/documents', headers=auth_headers).data)
+        assert {document['investorName'] for document in documents} == {
+            'Mock Capital LP', 'Atlas Family Office'}
+        assert all('sourceText' not in document for document in documents)
+        side_letters = json.loads(client.get(f'/funds/{fund_id}/documents?docType=Side Letter',
+            headers=auth_headers).data)
+        assert side_letters and all(d['docType'] == 'Side Letter' for d in side_letters)
+
+    def test_investor_in_many_funds(self, client, auth_headers):
+        """Test that investors sync their named fund and can commit to others."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Two Fund LP', 'fund': 'Growth Fund', 'commitmentAmount': 10000000}),
+            headers=auth_headers).data)
+        growth = self.fund_id(client, auth_headers, 'Growth Fund')
+        other = json.loads(client.post('/funds', data=json.dumps({'name': 'Credit Fund'}),
+            headers=auth_headers).data)
+        response = client.post(f'/funds/{other["id"]}/commitments',
+            data=json.dumps({'investorId': investor['id'], 'amount': 5000000}), headers=auth_headers)
+        assert response.status_code == 201
+
+        client.put(f'/investors/{investor["id"]}', data=json.dumps({'commitmentAmount': 20000000}),
+            headers=auth_headers)
+        for fund_id, amount in ((growth, 20000000), (other['id'], 5000000)):
+            data = json.loads(client.get(f'/funds/{fund_id}/investors', headers=auth_headers).data)
+            assert [i['id'] for i in data['investors']] == [investor['id']]
+            assert float(data['investors'][0]['commitment']['amount']) == amount
+
+        assert client.post('/funds', data=json.dumps({'name': 'Credit Fund'}),
+            headers=auth_headers).status_code == 409
+        assert client.get('/funds/999/investors', headers=auth_headers).status_code == 404
+
+        for query in ('limit=-1', 'limit=0', 'limit=5000', 'limit=10&offset=-5',
+                      'limit=10&offset=99999999999999999999', 'limit=abc'):
+            for listing in ('investors', 'documents'):
+                response = client.get(f'/funds/{growth}/{listing}?{query}', headers=auth_headers)
+                assert response.status_code == 400, (listing, query)
+        paged = json.loads(client.get(f'/funds/{growth}/investors?limit=1&offset=0',
+            headers=auth_headers).data)
+        assert len(paged['investors']) == 1
+
+
+    def test_fund_change_moves_commitment(self, client, auth_headers):
+        """Test that changing an investor's fund moves its commitment instead of adding one."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Mover LP', 'fund': 'Fund I', 'commitmentAmount': 100}),
+            headers=auth_headers).data)
+        client.put(f'/investors/{investor["id"]}', data=json.dumps({'fund': 'Fund II'}), headers=auth_headers)
+
+        funds = {f['name']: f for f in json.loads(client.get('/funds', headers=auth_headers).data)}
+        assert funds['Fund I']['investorCount'] == 0
+        assert funds['Fund II']['investorCount'] == 1
+        assert float(funds['Fund II']['totalCommitment']) == 100
+
+        client.put(f'/investors/{investor["id"]}', data=json.dumps({'fund': ''}), headers=auth_headers)
+        funds = {f['name']: f for f in json.loads(client.get('/funds', headers=auth_headers).data)}
+        assert funds['Fund II']['investorCount'] == 0
+
+    def test_named_fund_commitment_updates_investor(self, client, auth_headers):
+        """Test that a commitment to the investor's named fund writes back its amount."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Sync LP', 'fund': 'Fund I', 'commitmentAmount': 100}),
+            headers=auth_headers).data)
+        fund_i = self.fund_id(client, auth_headers, 'Fund I')
+        other = json.loads(client.post('/funds', data=json.dumps({'name': 'Side Fund'}),
+            headers=auth_headers).data)
+        for fund_id, amount in ((fund_i, 555), (other['id'], 777)):
+            client.post(f'/funds/{fund_id}/commitments', data=json.dumps({
+                'investorId': investor['id'], 'amount': amount, 'currency': 'EUR' if amount == 555 else 'GBP',
+            }), headers=auth_headers)
+
+        data = json.loads(client.get(f'/investors/{investor["id"]}', headers=auth_headers).data)
+        assert float(data['commitmentAmount']) == 555
+        assert data['currency'] == 'EUR'
+
+
+class TestInvestorOverview:
+    """Test the single-request investor page endpoint."""
+
+    def test_overview_matches_separate_calls(self, client, auth_headers):
+        """Test that the overview returns the same documents and terms."""
+        client.post('/demo/seed', headers=auth_headers)
+        investor_id = json.loads(client.get('/investors', headers=auth_headers).data)[-1]['id']
+        overview = json.loads(client.get(f'/investors/{investor_id}/overview', headers=auth_headers).data)
+
+        terms = json.loads(client.get(f'/investors/{investor_id}/effective-terms', headers=auth_headers).data)
+        documents = json.loads(client.get(f'/documents?investorId={investor_id}', headers=auth_headers).data)
+        assert overview['investor']['id'] == investor_id
+        assert overview['effectiveTerms'] == terms
+        assert {d['id'] for d in overview['documents']} == {d['id'] for d in documents}
+        assert all('sourceText' not in d and 'clauses' in d for d in overview['documents'])
+        assert [c['fundName'] for c in overview['commitments']] == [overview['investor']['fund']]
+
+    def test_zero_rate_is_zero_everywhere(self, client, auth_headers):
+        """Test that a 0% carry is 0.0, not null, in clauses, effective terms and the overview."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Zero Carry LP'}), headers=auth_headers).data)
+        document = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': 'Side Letter', 'docType': 'Side Letter',
+        }), headers=auth_headers).data)
+        client.post(f'/documents/{document["id"]}/clauses',
+            data=json.dumps({'clauseType': 'Carry Terms', 'rate': 0}), headers=auth_headers)
+
+        clause = json.loads(client.get(f'/documents/{document["id"]}', headers=auth_headers).data)['clauses'][0]
+        terms = json.loads(client.get(f'/investors/{investor["id"]}/effective-terms',
+            headers=auth_headers).data)
+        overview = json.loads(client.get(f'/investors/{investor["id"]}/overview', headers=auth_headers).data)
+        assert clause['rate'] == 0.0
+        assert terms['terms']['Carry Terms']['rate'] == 0.0
+        assert terms['summary']['carryTerms']['value'] == '0.0%'
+        assert overview['effectiveTerms']['terms']['Carry Terms']['rate'] == 0.0
+
+    def test_fixed_query_count_without_source_text(self, app, client, auth_headers):
+        """Test that the overview costs four queries and never reads source text."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Overview LP', 'fund': 'Overview Fund'}), headers=auth_headers).data)
+        for i in range(5):
+            document = json.loads(client.post('/documents', data=json.dumps({
+                'investorId': investor['id'], 'title': f'Doc {i}', 'docType': 'Side Letter',
+                'effectiveDate': f'2024-0{i + 1}-01', 'sourceText': 'Long text. ' * 100,
+            }), headers=auth_headers).data)
+            client.post(f'/documents/{document["id"]}/clauses',
+                data=json.dumps({'clauseType': 'Management Fee', 'rate': 2.0 - i / 10}),
+                headers=auth_headers)
+
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            response = client.get(f'/investors/{investor["id"]}/overview', headers=auth_headers)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+        assert response.status_code == 200
+        assert len(statements) == 4
+        assert not any('source_text' in statement for statement in statements)
+        data = json.loads(response.data)
+        assert len(data['documents']) == 5
+        assert data['effectiveTerms']['terms']['Management Fee']['rate'] == 1.6
+
+
+class TestBulkClauses:
+    """Test PATCH /clauses and DELETE /clauses."""
+
+    @pytest.fixture
+    def clause_ids(self, client, auth_headers):
+        """Create one document with five clauses."""
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Bulk Review LP'}), headers=auth_headers).data)
+        document = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': 'Side Letter', 'docType': 'Side Letter',
+        }), headers=auth_headers).data)
+        return [
+            json.loads(client.post(f'/documents/{document["id"]}/clauses',
+                data=json.dumps({'clauseType': 'Management Fee', 'rate': 2.0}),
+                headers=auth_headers).data)['id']
+            for _ in range(5)
+        ]
+
+    def record(self, app, monkeypatch):
+        """Record UPDATE statements and shared-cache invalidations."""
+        statements, invalidations = [], []
+        with app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        cache = app.extensions['shared_cache']
+        original = cache.invalidate
+        monkeypatch.setattr(cache, 'invalidate',
+            lambda *tags: (invalidations.append(tags), original(*tags)))
+        return statements, invalidations, lambda: event.remove(engine, 'before_cursor_execute', listener)
+
+    def test_patch_groups_updates_and_reports_per_item(self, app, client, auth_headers,
+                                                        clause_ids, monkeypatch):
+        """Test grouped set-based updates with per-item results."""
+        statements, invalidations, stop = self.record(app, monkeypatch)
+        updates = [{'id': clause_id, 'rate': 1.5} for clause_id in clause_ids[:3]]
+        updates += [
+            {'id': clause_ids[3], 'rate': 1.25, 'notes': 'Reviewed'},
+            {'id': clause_ids[4], 'rate': 'cheap'},
+            {'id': 999999, 'rate': 1.0},
+            {'id': clause_ids[0], 'notes': 'again'},
+        ]
+        response = client.patch('/clauses', data=json.dumps(updates), headers=auth_headers)
+        stop()
+
+        data = json.loads(response.data)
+        assert response.status_code == 200
+        assert data['updated'] == 4
+        assert [r['status'] for r in data['results']] == [200, 200, 200, 200, 400, 404, 400]
+        assert data['results'][3]['clause']['notes'] == 'Reviewed'
+        assert float(data['results'][0]['clause']['rate']) == 1.5
+
+        clause_updates = [s for s in statements if s.lstrip().upper().startswith('UPDATE CLAUSES')]
+        assert len(clause_updates) == 2
+        assert len(invalidations) == 1
+
+        unchanged = json.loads(client.get(f'/clauses/{clause_ids[4]}', headers=auth_headers).data)
+        assert float(unchanged['rate']) == 2.0
+
+    def test_patch_without_fields_changes_nothing(self, app, client, auth_headers,
+                                                   clause_ids, monkeypatch):
+        """Test that items with only an id are reported but not logged or touched."""
+        investor = json.loads(client.get(f'/clauses/{clause_ids[0]}', headers=auth_headers).data)
+        etag = client.get(f'/documents/{investor["documentId"]}', headers=auth_headers).headers['ETag']
+        statements, invalidations, stop = self.record(app, monkeypatch)
+        response = client.patch('/clauses', data=json.dumps([{'id': clause_ids[0]}]), headers=auth_headers)
+        stop()
+
+        data = json.loads(response.data)
+        assert data['updated'] == 0
+        assert [r['status'] for r in data['results']] == [200]
+        assert not [s for s in statements if s.lstrip().upper().startswith(('UPDATE', 'INSERT'))]
+        assert not any(invalidations)
+        cached = client.get(f'/documents/{investor["documentId"]}',
+            headers={**auth_headers, 'If-None-Match': etag})
+        assert cached.status_code == 304
+
+    def test_delete_many(self, app, client, auth_headers, clause_ids, monkeypatch):
+        """Test that one request deletes many clauses and reports missing ids."""
+        statements, invalidations, stop = self.record(app, monkeypatch)
+        response = client.delete('/clauses', data=json.dumps({'ids': clause_ids[:3] + [999999]}),
+            headers=auth_headers)
+        stop()
+
+        data = json.loads(response.data)
+        assert data['deleted'] == 3
+        assert [r['status'] for r in data['results']] == [204, 204, 204, 404]
+        # Clause signatures, then the clauses
+        assert len([s for s in statements if s.lstrip().upper().startswith('DELETE')]) == 2
+        assert len(invalidations) == 1
+        assert client.get(f'/clauses/{clause_ids[0]}', headers=auth_headers).status_code == 404
+
+        response = client.delete(f'/clauses?ids={clause_ids[3]},{clause_ids[4]}', headers=auth_headers)
+        assert json.loads(response.data)['deleted'] == 2
+        assert client.delete('/clauses', data=json.dumps({'ids': 'x'}),
+            headers=auth_headers).status_code == 400
+
+def _docx_bytes(pages):
+    """A minimal .docx with one paragraph per line and page breaks between pages."""
+    ns = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    body = []
+    for index, lines in enumerate(pages):
+        if index:
+            body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+        body.extend(f'<w:p><w:r><w:t>{line}</w:t></w:r></w:p>' for line in lines)
+    xml = f'<?xml version="1.0"?><w:document xmlns:w="{ns}"><w:body>{"".join(body)}</w:body></w:document>'
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', xml)
+    return buffer.getvalue()
+
+
+class TestFileUpload:
+    """Tests for POST /extract/upload."""
+    
+    @pytest.fixture(autouse=True)
+    def upload_config(self, app, tmp_path):
+        app.config['UPLOAD_DIR'] = str(tmp_path / 'uploads')
+    
+    def upload(self, client, auth_headers, filename, content):
+        headers = {'Authorization': auth_headers['Authorization']}
+        return client.post('/extract/upload', headers=headers, content_type='multipart/form-data', data={
+            'file': (io.BytesIO(content), filename),
+            'mock': 'true',
+        })
+    
+    def test_docx_pages_and_clause_page_numbers(self, app, client, auth_headers):
+        content = _docx_bytes([
+            ['SIDE LETTER AGREEMENT', 'This letter sets out terms agreed with the Investor.'],
+            ['1. Fees', 'The following applies from the first closing of the Fund onwards.',
+             'The Management Fee shall be 1.25% per annum of commitments.'],
+        ])
+        response = self.upload(client, auth_headers, 'side-letter.docx', content)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['file'] == {'name': 'side-letter.docx', 'kind': 'docx', 'size': len(content)}
+        assert [page['page'] for page in data['pages']] == [1, 2]
+        second = data['pages'][1]
+        assert data['sourceText'][second['start']:second['end']].startswith('1. Fees')
+        fee = next(c for c in data['clauses'] if c['clause_type'] == 'Management Fee')
+        assert fee['rate'] == 1.25
+        assert fee['page_number'] == 2
+        # The streamed file is removed once the text is out
+        assert os.listdir(app.config['UPLOAD_DIR']) == []
+    
+    def test_txt_pages_split_at_form_feeds(self, client, auth_headers):
+        text = 'Page one is the cover letter for the investor.\fDistributions follow the waterfall in the limited partnership agreement. The Preferred Return of 8% applies to all capital.'
+        response = self.upload(client, auth_headers, 'terms.txt', text.encode())
+        data = response.get_json()
+        assert len(data['pages']) == 2
+        assert next(c for c in data['clauses'] if c['clause_type'] == 'Preferred Return')['page_number'] == 2
+    
+    def test_unsupported_type(self, client, auth_headers):
+        response = self.upload(client, auth_headers, 'terms.rtf', b'{\\rtf1 Management Fee 2%}')
+        assert response.status_code == 415
+    
+    def test_missing_file(self, client, auth_headers):
+        response = client.post('/extract/upload', headers={'Authorization': auth_headers['Authorization']},
+                               content_type='multipart/form-data', data={'mock': 'true'})
+        assert response.status_code == 400
+    
+    def test_oversized_upload_rejected_while_streaming(self, app, client, auth_headers):
+        app.config['MAX_UPLOAD_BYTES'] = 1024
+        response = self.upload(client, auth_headers, 'big.txt', b'x' * 5000)
+        assert response.status_code == 413
+        # Refused from Content-Length before anything is written
+        assert not os.path.exists(app.config['UPLOAD_DIR'])
+    
+    def test_request_cap_covers_all_parts(self, app, client, auth_headers):
+        app.config['MAX_UPLOAD_BYTES'] = 4096
+        headers = {'Authorization': auth_headers['Authorization']}
+        response = client.post('/extract/upload', headers=headers, content_type='multipart/form-data', data={
+            'file': (io.BytesIO(b'x' * 3000), 'one.txt'),
+            'other': (io.BytesIO(b'x' * 3000), 'two.txt'),
+        })
+        assert response.status_code == 413
+        assert not os.path.exists(app.config['UPLOAD_DIR'])
+        
+        # Plain fields are held in memory, so they have a much lower cap
+        app.config['MAX_UPLOAD_BYTES'] = 1024 * 1024
+        response = client.post('/extract/upload', headers=headers, content_type='multipart/form-data', data={
+            'file': (io.BytesIO(b'x' * 100), 'one.txt'), 'note': 'x' * (600 * 1024),
+        })
+        assert response.status_code == 413
+        upload_dir = app.config['UPLOAD_DIR']
+        assert not os.path.exists(upload_dir) or os.listdir(upload_dir) == []
+    
+    def test_slow_conversion_is_killed(self, tmp_path):
+        import multiprocessing
+        from document_files import TextExtractor
+        path = tmp_path / 'terms.txt'
+        path.write_text('The Management Fee shall be 1.5% per annum.')
+        # Far shorter than starting a process, so the conversion is still running
+        with pytest.raises(TimeoutError):
+            TextExtractor(workers=1, timeout=0.001).extract(str(path), 'txt')
+        assert multiprocessing.active_children() == []
+        extractor = TextExtractor(workers=1, timeout=60)
+        assert extractor.extract(str(path), 'txt')['text'].startswith('The Management Fee')
+        with pytest.raises(RuntimeError):
+            extractor.extract(str(tmp_path / 'missing.txt'), 'txt')
+    
+    def test_long_text_sent_in_pieces(self, app, client, auth_headers):
+        prompts = []
+
+        def provider(prompt_text):
+            prompts.append(len(prompt_text))
+            return {'document_info': {}, 'clauses': [{'clause_type': 'Other', 'notes': str(len(prompts))}]}
+
+        app.extensions['provider_router'] = ProviderRouter({'fake': provider})
+        paragraph = 'The parties agree that this provision shall be construed in good faith.\n\n'
+        text = paragraph * (250000 // len(paragraph))
+        headers = {'Authorization': auth_headers['Authorization']}
+        response = client.post('/extract/upload', headers=headers, content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(text.encode()), 'long.txt')})
+        data = response.get_json()
+        assert response.status_code == 200
+        assert len(prompts) == data['chunks'] == 3
+        assert max(prompts) <= extraction_service.MAX_TEXT_LENGTH
+        assert len(data['clauses']) == 3
+    
+    def test_apply_keeps_file_name(self, client, auth_headers):
+        investor = client.post('/investors', data=json.dumps({'name': 'Upload LP', 'investorType': 'LP'}),
+                               headers=auth_headers).get_json()
+        document = client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': 'Uploaded', 'docType': 'Side Letter',
+        }), headers=auth_headers).get_json()
+        text = 'The Management Fee shall be 1.5% per annum, payable quarterly in advance by the Investor.'
+        extracted = self.upload(client, auth_headers, 'fees.txt', text.encode()).get_json()
+        response = client.post('/extract/apply', data=json.dumps({
+            'documentId': document['id'],
+            'clauses': extracted['clauses'],
+            'sourceText': extracted['sourceText'],
+            'fileName': extracted['file']['name'],
+        }), headers=auth_headers)
+        assert response.status_code == 200
+        stored = client.get(f'/documents/{document["id"]}', headers=auth_headers).get_json()
+        assert stored['fileName'] == 'fees.txt'
+        assert stored['clauses'][0]['pageNumber'] == 1
+
+
+MFN_TEXT = ('If the Partnership enters into a side letter with any other Limited Partner granting '
+            'more favorable economic terms, the Partnership shall promptly notify the Limited Partner '
+            'and offer equivalent terms within thirty days.')
+
+
+class TestClauseSimilarity:
+    """Test the MinHash/LSH index behind GET /clauses/<id>/similar."""
+
+    def add_clause(self, client, auth_headers, investor_name, text):
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': investor_name}), headers=auth_headers).data)
+        document = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': f'{investor_name} Side Letter', 'docType': 'Side Letter',
+        }), headers=auth_headers).data)
+        return json.loads(client.post(f'/documents/{document["id"]}/clauses',
+            data=json.dumps({'clauseType': 'MFN', 'clauseText': text}), headers=auth_headers).data)['id']
+
+    def similar(self, client, auth_headers, clause_id, **params):
+        response = client.get(f'/clauses/{clause_id}/similar', query_string=params, headers=auth_headers)
+        assert response.status_code == 200
+        return {match['clause']['id']: match for match in response.get_json()['similar']}
+
+    def test_orphaned_signatures_are_not_candidates(self, app, client, auth_headers):
+        original = self.add_clause(client, auth_headers, 'Alpha LP', MFN_TEXT)
+        edited = self.add_clause(client, auth_headers, 'Beta LP', MFN_TEXT.replace('thirty', 'sixty'))
+        deleted = self.add_clause(client, auth_headers, 'Gamma LP', MFN_TEXT.replace('promptly', 'at once'))
+        response = client.get(f'/clauses/{original}/similar', headers=auth_headers).get_json()
+        assert response['candidates'] == 3
+
+        client.put(f'/clauses/{edited}', data=json.dumps({'clauseText': 'Fees are waived.'}), headers=auth_headers)
+        client.delete(f'/clauses/{deleted}', headers=auth_headers)
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            response = client.get(f'/clauses/{original}/similar', headers=auth_headers).get_json()
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        assert response['candidates'] == 1
+        assert response['similar'] == []
+        assert sum('clause_lsh_buckets' in statement for statement in statements) == 1
+
+    def test_minhash_estimates_jaccard(self):
+        from clause_similarity import estimated_similarity, minhash, shingles
+        assert estimated_similarity(minhash(MFN_TEXT), minhash(MFN_TEXT.upper())) == 1.0
+        edited = MFN_TEXT.replace('thirty days', 'sixty days')
+        a, b = shingles(MFN_TEXT), shingles(edited)
+        jaccard = len(a & b) / len(a | b)
+        assert abs(estimated_similarity(minhash(MFN_TEXT), minhash(edited)) - jaccard) < 0.2
+        assert minhash('  --  ') is None
+
+    def test_similar_across_investors(self, client, auth_headers):
+        original = self.add_clause(client, auth_headers, 'Alpha LP', MFN_TEXT)
+        same = self.add_clause(client, auth_headers, 'Beta LP', MFN_TEXT)
+        near = self.add_clause(client, auth_headers, 'Gamma LP',
+                               MFN_TEXT.replace('within thirty days', 'within sixty days'))
+        other = self.add_clause(client, auth_headers, 'Delta LP',
+                                'The Management Fee shall be 1.50% per annum of the Capital Commitment.')
+
+        matches = self.similar(client, auth_headers, original)
+        assert list(matches) == [same, near]
+        assert matches[same]['similarity'] == 1.0
+        assert matches[same]['investorName'] == 'Beta LP'
+        assert 0.5 <= matches[near]['similarity'] < 1.0
+        assert other not in matches and original not in matches
+        assert list(self.similar(client, auth_headers, original, minSimilarity=1)) == [same]
+
+    def test_index_follows_updates_and_deletes(self, client, auth_headers):
+        original = self.add_clause(client, auth_headers, 'Alpha LP', MFN_TEXT)
+        edited = self.add_clause(client, auth_headers, 'Beta LP', MFN_TEXT)
+        removed = self.add_clause(client, auth_headers, 'Gamma LP', MFN_TEXT)
+
+        client.put(f'/clauses/{edited}', data=json.dumps({
+            'clauseText': 'Co-investment rights on a no-fee, no-carry basis alongside the Fund.',
+        }), headers=auth_headers)
+        client.delete(f'/clauses/{removed}', headers=auth_headers)
+        assert self.similar(client, auth_headers, original) == {}
+
+        client.patch('/clauses', data=json.dumps([{'id': edited, 'clauseText': MFN_TEXT}]),
+                     headers=auth_headers)
+        assert list(self.similar(client, auth_headers, original)) == [edited]
+
+    def test_seeded_clauses_are_indexed(self, app, client, auth_headers):
+        client.post('/demo/seed?investors=20', headers=auth_headers)
+        with app.app_context():
+            clause = Clause.query.filter(Clause.clause_text != '').order_by(Clause.id).first()
+            clause_id, investor_id = clause.id, clause.document.investor_id
+        matches = self.similar(client, auth_headers, clause_id, limit=5)
+        assert len(matches) == 5
+        # Synthetic books share templated wording across investors
+        assert any(match['investorId'] != investor_id for match in matches.values())
+
+    def test_errors(self, client, auth_headers):
+        original = self.add_clause(client, auth_headers, 'Alpha LP', MFN_TEXT)
+        assert client.get('/clauses/9999/similar', headers=auth_headers).status_code == 404
+        assert client.get(f'/clauses/{original}/similar?limit=0', headers=auth_headers).status_code == 400
+        assert client.get(f'/clauses/{original}/similar?minSimilarity=2',
+                          headers=auth_headers).status_code == 400
+
+
+class TestClauseTexts:
+    """Test interned clause text and the ?clauseText=refs representation."""
+
+    BOILERPLATE = 'The Management Fee shall be as set forth in the PPM.'
+
+    def add_document(self, client, auth_headers, name, texts):
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': name}), headers=auth_headers).data)
+        document = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': f'{name} Side Letter', 'docType': 'Side Letter',
+        }), headers=auth_headers).data)
+        clause_ids = [
+            json.loads(client.post(f'/documents/{document["id"]}/clauses',
+                data=json.dumps({'clauseType': 'Management Fee', 'clauseText': text}),
+                headers=auth_headers).data)['id']
+            for text in texts
+        ]
+        return document['id'], clause_ids
+
+    def test_identical_texts_are_stored_once(self, app, client, auth_headers):
+        self.add_document(client, auth_headers, 'Alpha LP', [self.BOILERPLATE, 'Fee waived in year one.'])
+        _, (clause_id,) = self.add_document(client, auth_headers, 'Beta LP',
+                                            [self.BOILERPLATE.replace('.', '.\r\n')])
+        with app.app_context():
+            assert ClauseText.query.count() == 2
+            clause = db.session.get(Clause, clause_id)
+            assert clause.clause_text == self.BOILERPLATE
+            assert clause.legacy_text is None
+            assert Clause.query.filter(Clause.clause_text == self.BOILERPLATE).count() == 2
+
+        client.put(f'/clauses/{clause_id}', data=json.dumps({'clauseText': 'Reduced to 1.5%.'}),
+                   headers=auth_headers)
+        client.patch('/clauses', data=json.dumps([{'id': clause_id, 'clauseText': 'Reduced to 1.25%.'}]),
+                     headers=auth_headers)
+        response = client.get(f'/clauses/{clause_id}', headers=auth_headers)
+        assert response.get_json()['clauseText'] == 'Reduced to 1.25%.'
+
+    def test_apply_interns_texts_in_one_batch(self, app, client, auth_headers):
+        document_id, _ = self.add_document(client, auth_headers, 'Batch LP', [self.BOILERPLATE])
+        clauses = [{'clause_type': 'Other', 'clause_text': f'Distinct clause {i} on fees.'} for i in range(10)]
+        clauses.append({'clause_type': 'Management Fee', 'clause_text': self.BOILERPLATE})
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            response = client.post('/extract/apply', data=json.dumps({
+                'documentId': document_id, 'clauses': clauses}), headers=auth_headers)
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        assert response.status_code == 200
+        assert sum('clause_texts' in s and s.startswith('INSERT') for s in statements) == 1
+        assert sum(s.startswith('SAVEPOINT') for s in statements) <= 2
+        assert [c['clauseText'] for c in response.get_json()['clauses']] == [c['clause_text'] for c in clauses]
+        with app.app_context():
+            assert ClauseText.query.count() == 11
+
+    def test_refs_representation(self, client, auth_headers):
+        for name in ('Alpha LP', 'Beta LP', 'Gamma LP'):
+            self.add_document(client, auth_headers, name, [self.BOILERPLATE])
+        full = client.get('/documents', headers=auth_headers)
+        refs = client.get('/documents?clauseText=refs', headers=auth_headers)
+        assert refs.headers['ETag'] != full.headers['ETag']
+
+        body = refs.get_json()
+        assert body['clauseTexts'] == [self.BOILERPLATE]
+        clauses = [clause for document in body['items'] for clause in document['clauses']]
+        assert len(clauses) == 3
+        assert all(clause['clauseTextRef'] == 0 and 'clauseText' not in clause for clause in clauses)
+
+        document_id = body['items'][0]['id']
+        single = client.get(f'/documents/{document_id}?clauseText=refs', headers=auth_headers).get_json()
+        assert single['clauseTexts'][single['clauses'][0]['clauseTextRef']] == self.BOILERPLATE
+
+    def test_templated_book_is_stored_and_sent_compactly(self, app, client, auth_headers):
+        client.post('/demo/seed?investors=50', headers=auth_headers)
+        with app.app_context():
+            assert ClauseText.query.count() * 10 < Clause.query.count()
+        full = client.get('/documents', headers=auth_headers)
+        refs = client.get('/documents?clauseText=refs', headers=auth_headers)
+        full_texts = sum(len(c['clauseText'] or '') for d in full.get_json() for c in d['clauses'])
+        ref_texts = sum(len(text) for text in refs.get_json()['clauseTexts'])
+        assert ref_texts * 10 < full_texts
+
+    def test_inline_text_is_migrated(self, app):
+        with app.app_context():
+            investor = Investor(name='Legacy LP')
+            document = Document(investor=investor, title='Old Side Letter')
+            db.session.add_all([investor, document])
+            db.session.flush()
+            db.session.execute(insert(Clause), [
+                {'document_id': document.id, 'legacy_text': self.BOILERPLATE} for _ in range(3)
+            ])
+            # Readable before it is moved
+            assert Clause.query.filter(Clause.clause_text == self.BOILERPLATE).count() == 3
+            migrate_clause_texts()
+            db.session.commit()
+            assert ClauseText.query.count() == 1
+            assert Clause.query.filter(Clause.legacy_text.isnot(None)).count() == 0
+            assert {clause.clause_text for clause in Clause.query} == {self.BOILERPLATE}
+
+
+class TestChangeFeed:
+    """Test the change log and GET /changes."""
+
+    def changes(self, client, auth_headers, **params):
+        response = client.get('/changes', query_string=params, headers=auth_headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    def test_writes_are_logged_in_order(self, client, auth_headers):
+        investor = json.loads(client.post('/investors',
+            data=json.dumps({'name': 'Feed LP'}), headers=auth_headers).data)
+        document = json.loads(client.post('/documents', data=json.dumps({
+            'investorId': investor['id'], 'title': 'Side Letter', 'docType': 'Side Letter',
+        }), headers=auth_headers).data)
+        clause = json.loads(client.post(f'/documents/{document["id"]}/clauses',
+            data=json.dumps({'clauseType': 'MFN'}), headers=auth_headers).data)
+        client.put(f'/clauses/{clause["id"]}', data=json.dumps({'rate': 1.5}), headers=auth_headers)
+        client.delete(f'/documents/{document["id"]}', headers=auth_headers)
+
+        feed = self.changes(client, auth_headers)
+        assert [(c['entity'], c['entityId'], c['op']) for c in feed['changes']] == [
+            ('investor', investor['id'], 'upsert'),
+            ('document', document['id'], 'upsert'),
+            ('clause', clause['id'], 'upsert'),
+            ('clause', clause['id'], 'upsert'),
+            ('clause', clause['id'], 'delete'),
+            ('document', document['id'], 'delete'),
+        ]
+        deleted = feed['changes'][4]
+        assert (deleted['documentId'], deleted['investorId']) == (document['id'], investor['id'])
+        assert feed['cursor'] == feed['changes'][-1]['id'] and not feed['hasMore']
+
+    def test_cursor_paging(self, client, auth_headers):
+        for name in ('A LP', 'B LP', 'C LP'):
+            client.post('/investors', data=json.dumps({'name': name}), headers=auth_headers)
+        first = self.changes(client, auth_headers, limit=2)
+        assert len(first['changes']) == 2 and first['hasMore']
+        rest = self.changes(client, auth_headers, since=first['cursor'])
+        assert len(rest['changes']) == 1 and not rest['hasMore']
+        caught_up = self.changes(client, auth_headers, since=rest['cursor'])
+        assert caught_up['changes'] == [] and caught_up['cursor'] == rest['cursor']
+
+    def test_bulk_writes_are_logged(self, app, client, auth_headers):
+        client.post('/demo/seed?investors=10', headers=auth_headers)
+        with app.app_context():
+            clause_count = Clause.query.count()
+            investor_ids = [investor.id for investor in Investor.query]
+        feed = self.changes(client, auth_headers, limit=5000)
+        upserts = [c for c in feed['changes'] if c['entity'] == 'clause']
+        assert len(upserts) == clause_count and all(c['investorId'] for c in upserts)
+
+        client.post('/demo/clear', headers=auth_headers)
+        deletes = self.changes(client, auth_headers, since=feed['cursor'], limit=5000)['changes']
+        assert {c['op'] for c in deletes} == {'delete'}
+        assert sorted(c['entityId'] for c in deletes if c['entity'] == 'investor') == sorted(investor_ids)
+        assert len([c for c in deletes if c['entity'] == 'clause']) == clause_count
+
+    def test_invalid_cursor(self, client, auth_headers):
+        assert client.get('/changes?since=abc', headers=auth_headers).status_code == 400
+        assert client.get('/changes?limit=0', headers=auth_headers).status_code == 400
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,246 @@
+"""
+Unit tests for the effective terms engine.
+Tests the resolution core directly and the engine through the API.
+"""
+import pytest
+import json
+import sys
+import os
+from datetime import date
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, Document
+from supersedes_graph import SupersedesCycleError, SupersedesGraphCache, build_supersedes_graph
+from terms_resolution import Candidate, candidate_sort_key, resolve, resolve_many
+
+
+@pytest.fixture
+def app():
+    """Create application for testing."""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create test client."""
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Get authentication headers by logging in with demo credentials."""
+    response = client.post('/auth/login',
+        data=json.dumps({'email': 'demo@agreement-tracker.com', 'password': 'Demo123!'}),
+        content_type='application/json'
+    )
+    data = json.loads(response.data)
+    return {'Authorization': f"Bearer {data['token']}", 'Content-Type': 'application/json'}
+
+
+def post(client, url, payload, headers):
+    """POST JSON and return the decoded response."""
+    return json.loads(client.post(url, data=json.dumps(payload), headers=headers).data)
+
+
+class TestResolutionCore:
+    """Test the ORM-free resolution core."""
+
+    def test_sort_key_orders_priority_then_date(self):
+        """Test that priority dominates and later dates win within a priority."""
+        assert candidate_sort_key(3, date(2020, 1, 1)) > candidate_sort_key(2, date(2024, 1, 1))
+        assert candidate_sort_key(3, date(2024, 1, 1)) > candidate_sort_key(3, date(2020, 1, 1))
+        assert candidate_sort_key(3, date(2020, 1, 1)) > candidate_sort_key(3, None)
+
+    def test_highest_priority_wins(self):
+        """Test that the side letter beats the PPM."""
+        ppm = Candidate(1, 10, 'Management Fee', 1, date(2024, 1, 1))
+        side_letter = Candidate(2, 11, 'Management Fee', 3, date(2024, 2, 1))
+        winner, losers = resolve([ppm, side_letter])['Management Fee']
+        assert winner is side_letter
+        assert losers == [ppm]
+
+    def test_superseded_candidates_lose(self):
+        """Test that superseded documents lose and are listed after ranked losers."""
+        old = Candidate(1, 10, 'Carry Terms', 4, date(2024, 6, 1), superseded_by=12)
+        sub = Candidate(2, 11, 'Carry Terms', 2, date(2024, 1, 1))
+        new = Candidate(3, 12, 'Carry Terms', 3, date(2024, 3, 1))
+        winner, losers = resolve([old, sub, new])['Carry Terms']
+        assert winner is new
+        assert losers == [sub, old]
+
+    def test_superseded_only_candidate_still_wins(self):
+        """Test the fallback when every candidate is superseded."""
+        only = Candidate(1, 10, 'MFN', 3, None, superseded_by=11)
+        winner, losers = resolve([only])['MFN']
+        assert winner is only
+        assert losers == []
+
+    def test_ties_keep_input_order(self):
+        """Test that equal keys resolve to the first candidate."""
+        first = Candidate(1, 10, 'Management Fee', 3, date(2024, 1, 1))
+        second = Candidate(2, 11, 'Management Fee', 3, date(2024, 1, 1))
+        winner, losers = resolve([first, second])['Management Fee']
+        assert winner is first
+        assert losers == [second]
+
+    def test_resolve_many(self):
+        """Test batch resolution keyed by investor."""
+        results = resolve_many({
+            1: [Candidate(1, 10, 'Management Fee', 1, None)],
+            2: [Candidate(2, 20, 'Carry Terms', 3, None)],
+        })
+        assert list(results[1]) == ['Management Fee']
+        assert list(results[2]) == ['Carry Terms']
+
+
+class TestEffectiveTermsAPI:
+    """Test effective terms resolution through the API."""
+
+    @pytest.fixture
+    def investor(self, client, auth_headers):
+        """Create an investor with PPM, subscription and side letter fees."""
+        investor = post(client, '/investors', {'name': 'Terms Investor'}, auth_headers)
+        for doc_type, effective_date, rate in [
+            ('PPM', '2024-01-01', 2.0),
+            ('Subscription Agreement', '2024-01-15', 2.0),
+            ('Side Letter', '2024-02-01', 1.75),
+        ]:
+            document = post(client, '/documents', {
+                'investorId': investor['id'],
+                'title': f'Terms {doc_type}',
+                'docType': doc_type,
+                'effectiveDate': effective_date,
+            }, auth_headers)
+            post(client, f'/documents/{document["id"]}/clauses',
+                {'clauseType': 'Management Fee', 'rate': rate}, auth_headers)
+        return investor
+
+    def test_side_letter_wins(self, client, auth_headers, investor):
+        """Test the document type hierarchy."""
+        response = client.get(f'/investors/{investor["id"]}/effective-terms', headers=auth_headers)
+        data = json.loads(response.data)
+        term = data['terms']['Management Fee']
+        assert term['rate'] == 1.75
+        assert term['source']['documentType'] == 'Side Letter'
+        reasons = [o['reason'] for o in data['overridden']['Management Fee']]
+        assert reasons == [
+            'Lower priority document type (Subscription Agreement)',
+            'Lower priority document type (PPM)',
+        ]
+        assert data['summary']['managementFee']['value'] == '1.75%'
+
+    def test_as_of_query(self, client, auth_headers, investor):
+        """Test that ?asOf ignores documents not yet in force."""
+        response = client.get(f'/investors/{investor["id"]}/effective-terms?asOf=2024-01-20',
+            headers=auth_headers)
+        term = json.loads(response.data)['terms']['Management Fee']
+        assert term['source']['documentType'] == 'Subscription Agreement'
+        assert term['rate'] == 2.0
+
+    def test_amendment_supersedes_side_letter(self, client, auth_headers, investor):
+        """Test that a superseded document's clauses are overridden."""
+        documents = json.loads(client.get(f'/documents?investorId={investor["id"]}',
+            headers=auth_headers).data)
+        side_letter = next(d for d in documents if d['docType'] == 'Side Letter')
+        amendment = post(client, '/documents', {
+            'investorId': investor['id'],
+            'title': 'Fee Amendment',
+            'docType': 'Amendment',
+            'effectiveDate': '2024-05-01',
+            'supersedesId': side_letter['id'],
+        }, auth_headers)
+        post(client, f'/documents/{amendment["id"]}/clauses',
+            {'clauseType': 'Management Fee', 'rate': 1.5}, auth_headers)
+
+        data = json.loads(client.get(f'/investors/{investor["id"]}/effective-terms',
+            headers=auth_headers).data)
+        assert data['terms']['Management Fee']['rate'] == 1.5
+        overridden = {o['source']['documentType']: o for o in data['overridden']['Management Fee']}
+        assert overridden['Side Letter']['reason'] == 'Superseded by Fee Amendment'
+        assert overridden['Side Letter']['supersededBy'] == amendment['id']
+
+
+class TestSupersedesGraph:
+    """Test transitive supersedes resolution."""
+
+    def test_chain_depth_and_latest(self):
+        """Test an A -> B -> C amendment chain."""
+        graph = build_supersedes_graph({'A': 'B', 'B': 'C', 'C': None, 'D': None})
+        assert graph.depth == {'A': 2, 'B': 1, 'C': 0, 'D': 0}
+        assert graph.superseded_by == {'B': 'A', 'C': 'B'}
+        assert graph.latest['C'] == 'A'
+        assert graph.latest['B'] == 'A'
+        assert graph.latest['D'] == 'D'
+        assert graph.order.index('A') < graph.order.index('B') < graph.order.index('C')
+
+    def test_links_outside_the_set_are_ignored(self):
+        """Test that a link to an unknown document doesn't mark anything superseded."""
+        graph = build_supersedes_graph({1: 99, 2: None})
+        assert not graph.is_superseded(99)
+        assert graph.depth == {1: 0, 2: 0}
+
+    def test_cycle_detection(self):
+        """Test that a supersedes loop raises with the cycle members."""
+        with pytest.raises(SupersedesCycleError) as excinfo:
+            build_supersedes_graph({1: 2, 2: 3, 3: 1, 4: 1})
+        assert sorted(excinfo.value.cycle) == [1, 2, 3]
+        assert 'cycle' in str(excinfo.value)
+
+    def test_deep_chain(self):
+        """Test that long amendment chains resolve without recursion."""
+        n = 5000
+        graph = build_supersedes_graph({i: (i - 1 if i else None) for i in range(n)})
+        assert graph.depth[n - 1] == n - 1
+        assert graph.latest[0] == n - 1
+        assert graph.order[0] == n - 1
+
+    def test_cache_reuses_graph_per_version(self):
+        """Test that graphs are cached per (investor, version)."""
+        cache = SupersedesGraphCache(maxsize=2)
+        first = cache.get_or_build(1, 'v1', {1: None})
+        assert cache.get_or_build(1, 'v1', {1: None}) is first
+        assert cache.get_or_build(1, 'v2', {1: None}) is not first
+
+    def test_cycle_returns_conflict(self, app, client, auth_headers):
+        """Test that the API reports a supersedes cycle with 409."""
+        investor = post(client, '/investors', {'name': 'Cycle Investor'}, auth_headers)
+        first = post(client, '/documents',
+            {'investorId': investor['id'], 'title': 'First', 'docType': 'Side Letter'}, auth_headers)
+        second = post(client, '/documents', {
+            'investorId': investor['id'], 'title': 'Second', 'docType': 'Amendment',
+            'supersedesId': first['id'],
+        }, auth_headers)
+        with app.app_context():
+            db.session.get(Document, first['id']).supersedes_id = second['id']
+            db.session.commit()
+
+        response = client.get(f'/investors/{investor["id"]}/effective-terms', headers=auth_headers)
+        assert response.status_code == 409
+        assert sorted(json.loads(response.data)['cycle']) == sorted([first['id'], second['id']])
+
+    def test_supersedes_must_share_investor(self, client, auth_headers):
+        """Test that a document can't supersede another investor's document."""
+        one = post(client, '/investors', {'name': 'One'}, auth_headers)
+        two = post(client, '/investors', {'name': 'Two'}, auth_headers)
+        document = post(client, '/documents',
+            {'investorId': one['id'], 'title': 'Theirs', 'docType': 'PPM'}, auth_headers)
+        response = client.post('/documents', data=json.dumps({
+            'investorId': two['id'], 'title': 'Mine', 'docType': 'Amendment',
+            'supersedesId': document['id'],
+        }), headers=auth_headers)
+        assert response.status_code == 400
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])